@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Optional, Union
+
+from prometheus_client import Counter, Gauge, Histogram
+
+REJECT_QUEUE_FULL = "queue_full"
+REJECT_USER_QUEUE_FULL = "user_queue_full"
+REJECT_TIMEOUT = "timeout"
+
+ADMISSION_WAIT_SECONDS = Histogram(
+    "aiyo_llm_admission_wait_seconds",
+    "LLM 呼叫在准入佇列中的等待時間（result：admitted / timeout / cancelled）",
+    ["result"],
+    buckets=(0.0, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0),
+)
+ADMISSION_REJECTIONS = Counter(
+    "aiyo_llm_admission_rejections_total",
+    "LLM 呼叫被准入控制拒絕的次數（queue_full、user_queue_full、timeout）",
+    ["reason"],
+)
+ADMISSION_ACTIVE = Gauge("aiyo_llm_admission_active", "已取得准入、進行中的 LLM 工作數")
+ADMISSION_QUEUE_DEPTH = Gauge("aiyo_llm_admission_queue_depth", "等待准入的 LLM 工作數")
+ADMISSION_CAPACITY = Gauge("aiyo_llm_admission_capacity", "目前的 LLM 並行上限（每台健康後端上限 × 健康後端數）")
+
+
+class AdmissionRejected(Exception):
+    """佇列已滿或等待逾時；status_code 為 429（單一使用者排隊過多）或 503（整體過載）。"""
+
+    def __init__(self, reason: str, retry_after_sec: int) -> None:
+        super().__init__(f"llm admission rejected: {reason}")
+        self.reason = reason
+        self.retry_after_sec = retry_after_sec
+
+    @property
+    def status_code(self) -> int:
+        return 429 if self.reason == REJECT_USER_QUEUE_FULL else 503
+
+
+class AdmissionTicket:
+    """一個准入名額；release() 可重複呼叫。
+
+    可用 `async with ticket:` 在區塊結束時釋放；串流回應以 hand_off() 把名額交給產生器，
+    由產生器結束時 release()。產生器若從未被迭代就被回收，物件回收時也會釋放。
+    """
+
+    def __init__(self, controller: "AdmissionController") -> None:
+        self._controller = controller
+        self._started = time.monotonic()
+        self._released = False
+        self._handed_off = False
+
+    def hand_off(self) -> None:
+        self._handed_off = True
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(time.monotonic() - self._started)
+
+    async def __aenter__(self) -> "AdmissionTicket":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None or not self._handed_off:
+            self.release()
+
+    def __del__(self) -> None:
+        self.release()
+
+
+Capacity = Union[int, Callable[[], int]]
+
+
+class AdmissionController:
+    """LLM 工作的准入控制：並行上限 + 有界等待佇列，依使用者輪流放行。
+
+    每位使用者各自一條 FIFO，名額釋放時依使用者輪詢（round-robin），
+    避免單一使用者連發的請求佔滿佇列。整體佇列滿時回 503、單一使用者排隊超過
+    max_queue_per_user 時回 429，等待超過 queue_timeout_sec 回 503；皆附 Retry-After 估計秒數。
+    capacity 可為函式（例如每台健康後端上限 × 健康後端數），後端被剔除時自動降載。
+    """
+
+    def __init__(
+        self,
+        capacity: Capacity,
+        *,
+        max_queue: int = 64,
+        max_queue_per_user: int = 4,
+        queue_timeout_sec: float = 20.0,
+    ) -> None:
+        self._capacity = capacity
+        self.max_queue = max(0, max_queue)
+        self.max_queue_per_user = max(1, max_queue_per_user)
+        self.queue_timeout_sec = max(0.0, queue_timeout_sec)
+        self._active = 0
+        self._waiting = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future[None]]]" = OrderedDict()
+        self._hold_ewma_sec = 0.0
+
+    @property
+    def capacity(self) -> int:
+        value = self._capacity() if callable(self._capacity) else self._capacity
+        return max(1, int(value))
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def retry_after(self) -> int:
+        """以平均佔用時間估計排到的秒數（1–60）。"""
+        hold = self._hold_ewma_sec or 5.0
+        estimate = hold * (self._waiting + 1) / self.capacity
+        return int(min(60, max(1, math.ceil(estimate))))
+
+    def _update_gauges(self) -> None:
+        ADMISSION_ACTIVE.set(self._active)
+        ADMISSION_QUEUE_DEPTH.set(self._waiting)
+        ADMISSION_CAPACITY.set(self.capacity)
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        ADMISSION_REJECTIONS.labels(reason=reason).inc()
+        return AdmissionRejected(reason, self.retry_after())
+
+    async def acquire(self, user_key: Optional[object] = None) -> AdmissionTicket:
+        key = str(user_key) if user_key is not None else "anonymous"
+        if self._active < self.capacity and self._waiting == 0:
+            self._active += 1
+            self._update_gauges()
+            ADMISSION_WAIT_SECONDS.labels(result="admitted").observe(0.0)
+            return AdmissionTicket(self)
+        if self._waiting >= self.max_queue:
+            raise self._reject(REJECT_QUEUE_FULL)
+        queue = self._queues.get(key)
+        if queue is not None and len(queue) >= self.max_queue_per_user:
+            raise self._reject(REJECT_USER_QUEUE_FULL)
+
+        future: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[key] = deque()
+        queue.append(future)
+        self._waiting += 1
+        # capacity 可能因後端恢復而變大，順便放行
+        self._dispatch()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout_sec)
+        except asyncio.TimeoutError:
+            if self._abandon(key, future):
+                ADMISSION_WAIT_SECONDS.labels(result="timeout").observe(time.monotonic() - started)
+                raise self._reject(REJECT_TIMEOUT) from None
+        except asyncio.CancelledError:
+            if not self._abandon(key, future):
+                # 已被放行但呼叫端取消，名額還回去
+                self._release(0.0, record=False)
+            ADMISSION_WAIT_SECONDS.labels(result="cancelled").observe(time.monotonic() - started)
+            raise
+        ADMISSION_WAIT_SECONDS.labels(result="admitted").observe(time.monotonic() - started)
+        return AdmissionTicket(self)
+
+    def _abandon(self, key: str, future: "asyncio.Future[None]") -> bool:
+        """將仍在排隊的 future 移出佇列；已被放行則回傳 False。"""
+        if future.done():
+            return False
+        future.cancel()
+        queue = self._queues.get(key)
+        if queue is not None:
+            try:
+                queue.remove(future)
+            except ValueError:
+                pass
+            if not queue:
+                del self._queues[key]
+        self._waiting -= 1
+        self._update_gauges()
+        return True
+
+    def _release(self, held_sec: float, record: bool = True) -> None:
+        self._active = max(0, self._active - 1)
+        if record:
+            self._hold_ewma_sec = held_sec if self._hold_ewma_sec <= 0 else 0.2 * held_sec + 0.8 * self._hold_ewma_sec
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._active < self.capacity and self._queues:
+            key, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                # 這位使用者還有人在排，移到隊尾，下一個名額給其他使用者
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._waiting -= 1
+            if future.done():
+                continue
+            future.set_result(None)
+            self._active += 1
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def slot(self, user_key: Optional[object] = None) -> AsyncIterator[AdmissionTicket]:
+        ticket = await self.acquire(user_key)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
@@ -0,0 +1,226 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, List, Optional, Sequence, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from app import db
+
+AUDIT_LOG_QUEUE_DEPTH = Gauge(
+    "aiyo_audit_log_queue_depth",
+    "等待寫入 developer_audit_logs 的筆數",
+)
+AUDIT_LOG_DROPPED = Counter(
+    "aiyo_audit_log_dropped_total",
+    "未寫入的稽核紀錄（overflow：佇列滿丟棄最舊、sampled：取樣略過、error：寫入失敗）",
+    ["reason"],
+)
+AUDIT_LOG_WRITTEN = Counter(
+    "aiyo_audit_log_rows_written_total",
+    "已寫入 developer_audit_logs 的筆數",
+)
+AUDIT_LOG_FLUSH_SECONDS = Histogram(
+    "aiyo_audit_log_flush_seconds",
+    "每次批次寫入 developer_audit_logs 的耗時",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+AUDIT_SENSITIVE_KEYS = {
+    "password", "password_hash", "token", "access_token", "refresh_token",
+    "authorization", "cookie", "set-cookie", "x-internal-token",
+    "secret", "api_key", "apikey",
+}
+
+AUDIT_COLUMNS = (
+    "trace_id", "user_id", "session_id", "endpoint", "method", "status_code",
+    "request_json", "response_json", "ai_prompt_json", "ai_response_json",
+    "tool_calls_json", "error_text", "duration_ms",
+)
+
+COPY_AUDIT_SQL = f"COPY developer_audit_logs ({', '.join(AUDIT_COLUMNS)}) FROM STDIN"
+
+
+def _mask_sensitive(obj: Any, depth: int = 0) -> Any:
+    if depth > 8 or obj is None:
+        return obj
+    if isinstance(obj, str):
+        return obj
+    if isinstance(obj, list):
+        return [_mask_sensitive(item, depth + 1) for item in obj]
+    if isinstance(obj, dict):
+        masked = {}
+        for k, v in obj.items():
+            if k.lower() in AUDIT_SENSITIVE_KEYS:
+                masked[k] = "***MASKED***" if isinstance(v, str) and v else v
+            else:
+                masked[k] = _mask_sensitive(v, depth + 1)
+        return masked
+    return obj
+
+
+def _json_payload(value: Any, empty: Any, max_bytes: int) -> str:
+    """遮罩敏感欄位後序列化；超過 max_bytes 時改存截斷後的預覽，避免單筆紀錄撐大批次。"""
+    text = json.dumps(_mask_sensitive(value) or empty, ensure_ascii=False, default=str)
+    size = len(text.encode("utf-8"))
+    if size <= max_bytes:
+        return text
+    preview = text.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore")
+    return json.dumps({"truncated": True, "original_bytes": size, "preview": preview}, ensure_ascii=False)
+
+
+@dataclass
+class AuditEntry:
+    trace_id: Optional[str] = None
+    user_id: Optional[int] = None
+    session_id: Optional[str] = None
+    endpoint: Optional[str] = None
+    method: Optional[str] = None
+    status_code: Optional[int] = None
+    request_json: Any = None
+    response_json: Any = None
+    ai_prompt_json: Any = None
+    ai_response_json: Any = None
+    tool_calls_json: Any = None
+    error_text: Optional[str] = None
+    duration_ms: Optional[int] = None
+
+    def to_row(self, max_payload_bytes: int) -> Tuple[Any, ...]:
+        error_text = self.error_text
+        if error_text and len(error_text) > max_payload_bytes:
+            error_text = error_text[:max_payload_bytes]
+        return (
+            self.trace_id,
+            self.user_id,
+            self.session_id,
+            self.endpoint,
+            self.method,
+            self.status_code,
+            _json_payload(self.request_json, {}, max_payload_bytes),
+            _json_payload(self.response_json, {}, max_payload_bytes),
+            _json_payload(self.ai_prompt_json, {}, max_payload_bytes),
+            _json_payload(self.ai_response_json, {}, max_payload_bytes),
+            _json_payload(self.tool_calls_json, [], max_payload_bytes),
+            error_text,
+            self.duration_ms,
+        )
+
+
+RowWriter = Callable[[Sequence[Tuple[Any, ...]]], Awaitable[None]]
+
+
+async def copy_audit_rows(rows: Sequence[Tuple[Any, ...]]) -> None:
+    """以 COPY 一次寫入整批紀錄（單一連線、單一交易）。"""
+    async with db.async_connection() as conn:
+        async with conn.cursor() as cur:
+            async with cur.copy(COPY_AUDIT_SQL) as copy:
+                for row in rows:
+                    await copy.write_row(row)
+
+
+class AuditLogWriter:
+    """developer_audit_logs 的背景批次寫入器。
+
+    請求端只把 AuditEntry 放進有上限的佇列（滿了丟棄最舊的一筆），遮罩、序列化與寫入都在背景 flusher：
+    累積到 batch_size 筆或每 flush_interval_ms 寫入一次。錯誤回應（status >= 400 或有 error_text）一律保留，
+    其餘依 sample_rate 取樣。
+    """
+
+    def __init__(
+        self,
+        write_rows: RowWriter = copy_audit_rows,
+        *,
+        max_queue_size: int = 5000,
+        batch_size: int = 200,
+        flush_interval_ms: float = 500.0,
+        sample_rate: float = 1.0,
+        max_payload_bytes: int = 16384,
+        rng: Callable[[], float] = random.random,
+    ) -> None:
+        self._write_rows = write_rows
+        self.max_queue_size = max(1, max_queue_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_sec = max(1.0, flush_interval_ms) / 1000.0
+        self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self.max_payload_bytes = max(256, max_payload_bytes)
+        self._rng = rng
+        self._queue: Deque[AuditEntry] = deque(maxlen=self.max_queue_size)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def submit(self, entry: AuditEntry) -> bool:
+        """放入佇列後立即返回；回傳 False 表示因取樣略過。"""
+        is_error = bool(entry.error_text) or (entry.status_code or 0) >= 400
+        if not is_error and self.sample_rate < 1.0 and self._rng() >= self.sample_rate:
+            AUDIT_LOG_DROPPED.labels(reason="sampled").inc()
+            return False
+        if len(self._queue) >= self.max_queue_size:
+            AUDIT_LOG_DROPPED.labels(reason="overflow").inc()
+        self._queue.append(entry)
+        AUDIT_LOG_QUEUE_DEPTH.set(len(self._queue))
+        if len(self._queue) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止背景 flusher，並寫出佇列中剩餘的紀錄。"""
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        while self._queue:
+            await self.flush()
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval_sec)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            while self._queue:
+                await self.flush()
+                if len(self._queue) < self.batch_size:
+                    break
+
+    def _take_batch(self) -> List[AuditEntry]:
+        batch: List[AuditEntry] = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        AUDIT_LOG_QUEUE_DEPTH.set(len(self._queue))
+        return batch
+
+    async def flush(self) -> int:
+        batch = self._take_batch()
+        if not batch:
+            return 0
+        started = time.perf_counter()
+        try:
+            rows = [entry.to_row(self.max_payload_bytes) for entry in batch]
+            await self._write_rows(rows)
+        except Exception as exc:
+            AUDIT_LOG_DROPPED.labels(reason="error").inc(len(batch))
+            print(f"[audit] flush of {len(batch)} rows failed: {type(exc).__name__}: {exc}")
+            return 0
+        finally:
+            AUDIT_LOG_FLUSH_SECONDS.observe(time.perf_counter() - started)
+        AUDIT_LOG_WRITTEN.inc(len(rows))
+        return len(rows)
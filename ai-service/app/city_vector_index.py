@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from prometheus_client import Counter
+
+# 每個城市一個 partial HNSW 索引；索引名稱須為 ASCII，故以城市名稱雜湊命名
+CITY_INDEX_PREFIX = "idx_ssd_emb_city_"
+DEFAULT_MIN_ROWS = 20000
+
+VECTOR_SCAN_PLANS = Counter(
+    "aiyo_vector_scan_plans_total",
+    "dense 檢索採用的掃描方式（partial_index / iterative_scan / global）",
+    ["plan"],
+)
+
+IndexNameLoader = Callable[[], Awaitable[Iterable[str]]]
+
+
+def city_index_name(city: str) -> str:
+    digest = hashlib.sha1(city.strip().encode("utf-8")).hexdigest()[:12]
+    return f"{CITY_INDEX_PREFIX}{digest}"
+
+
+def sql_string_literal(value: str) -> str:
+    """standard_conforming_strings 下的字串常值；僅用於已知城市名稱。"""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def city_index_ddl(city: str, concurrently: bool = True) -> str:
+    """partial 索引的 WHERE 必須與查詢條件字面一致，planner 才會選用（見 CityVectorIndexPlanner）。"""
+    keyword = "CREATE INDEX CONCURRENTLY IF NOT EXISTS" if concurrently else "CREATE INDEX IF NOT EXISTS"
+    return (
+        f"{keyword} {city_index_name(city)} ON segment_search_doc "
+        "USING hnsw (embedding_vector vector_cosine_ops) "
+        f"WHERE embedding_vector IS NOT NULL AND city = {sql_string_literal(city.strip())}"
+    )
+
+
+@dataclass(frozen=True)
+class DenseScanPlan:
+    """dense 查詢的城市條件與需在同一交易內套用的 SET LOCAL 設定。"""
+
+    city_predicate: str = ""
+    settings: Tuple[Tuple[str, str], ...] = field(default_factory=tuple)
+    plan: str = "global"
+
+
+class CityVectorIndexPlanner:
+    """依城市是否已有 partial HNSW 索引決定 dense 查詢寫法。
+
+    - 有 partial 索引：城市條件以常值寫入 SQL（綁定參數在 generic plan 下無法對應 partial 索引）
+    - 無 partial 索引：維持綁定參數，並開啟 hnsw.iterative_scan，避免全域索引 post-filter 後筆數不足
+    已建立的索引名稱由 loader 讀取並快取 refresh_sec 秒。
+    """
+
+    def __init__(
+        self,
+        known_cities: Sequence[str],
+        *,
+        refresh_sec: float = 300.0,
+        iterative_scan: str = "strict_order",
+        ef_search: int = 100,
+        max_scan_tuples: int = 20000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.known_cities = [city.strip() for city in known_cities if city and city.strip()]
+        self.refresh_sec = max(1.0, refresh_sec)
+        self.iterative_scan = (iterative_scan or "off").strip().lower()
+        self.ef_search = max(1, ef_search)
+        self.max_scan_tuples = max(1, max_scan_tuples)
+        self._clock = clock
+        self._indexed: Set[str] = set()
+        self._loaded_at: Optional[float] = None
+
+    def _filtered_scan_settings(self) -> Tuple[Tuple[str, str], ...]:
+        if self.iterative_scan == "off":
+            return (("hnsw.ef_search", str(self.ef_search)),)
+        return (
+            ("hnsw.iterative_scan", self.iterative_scan),
+            ("hnsw.ef_search", str(self.ef_search)),
+            ("hnsw.max_scan_tuples", str(self.max_scan_tuples)),
+        )
+
+    async def indexed_cities(self, loader: IndexNameLoader) -> Set[str]:
+        now = self._clock()
+        if self._loaded_at is None or now - self._loaded_at >= self.refresh_sec:
+            try:
+                names = set(await loader())
+            except Exception as exc:
+                print(f"[city_vector_index] failed to load index names: {type(exc).__name__}: {exc}")
+                names = None
+            if names is not None:
+                self._indexed = {city for city in self.known_cities if city_index_name(city) in names}
+            self._loaded_at = now
+        return self._indexed
+
+    async def plan(self, city: Optional[str], loader: IndexNameLoader) -> DenseScanPlan:
+        city_text = (city or "").strip()
+        if not city_text:
+            VECTOR_SCAN_PLANS.labels(plan="global").inc()
+            return DenseScanPlan()
+        if city_text in await self.indexed_cities(loader):
+            VECTOR_SCAN_PLANS.labels(plan="partial_index").inc()
+            # 查詢另帶有 pyformat 參數，常值中的 % 需跳脫
+            literal = sql_string_literal(city_text).replace("%", "%%")
+            return DenseScanPlan(
+                city_predicate=f"AND d.city = {literal}",
+                plan="partial_index",
+            )
+        VECTOR_SCAN_PLANS.labels(plan="iterative_scan").inc()
+        return DenseScanPlan(
+            city_predicate="AND d.city = %(kw_city)s",
+            settings=self._filtered_scan_settings(),
+            plan="iterative_scan",
+        )
+
+
+# 參數：(CITY_INDEX_PREFIX,)
+INDEX_NAMES_SQL = """
+    SELECT indexname
+    FROM pg_indexes
+    WHERE tablename = 'segment_search_doc'
+      AND starts_with(indexname, %s)
+"""
+
+CITY_COUNTS_SQL = """
+    SELECT city, COUNT(*) AS row_count
+    FROM segment_search_doc
+    WHERE embedding_vector IS NOT NULL
+      AND city = ANY(%s)
+    GROUP BY city
+"""
+
+
+def plan_city_indexes(counts: Dict[str, int], min_rows: int) -> List[str]:
+    """回傳資料量達門檻、應建立 partial 索引的城市（依筆數由多到少）。"""
+    eligible = [(city, count) for city, count in counts.items() if count >= min_rows]
+    eligible.sort(key=lambda item: (-item[1], item[0]))
+    return [city for city, _ in eligible]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="為資料量大的城市產生 segment_search_doc partial HNSW 索引")
+    parser.add_argument("--min-rows", type=int, default=DEFAULT_MIN_ROWS, help="城市至少要有幾筆 embedding 才建索引")
+    parser.add_argument("--apply", action="store_true", help="實際執行 CREATE INDEX CONCURRENTLY（預設只印出 DDL）")
+    args = parser.parse_args(argv)
+
+    import psycopg
+
+    from app import db
+    from app.main import ALL_CITY_NAMES
+
+    with psycopg.connect(db.DATABASE_URL, autocommit=True) as conn:
+        rows = conn.execute(CITY_COUNTS_SQL, (list(ALL_CITY_NAMES),)).fetchall()
+        counts = {str(city): int(count) for city, count in rows}
+        cities = plan_city_indexes(counts, args.min_rows)
+        if not cities:
+            print(f"沒有城市達到 {args.min_rows} 筆門檻。")
+            return
+        for city in cities:
+            ddl = city_index_ddl(city)
+            print(f"-- {city}: {counts[city]} rows")
+            print(ddl + ";")
+            if args.apply:
+                conn.execute(ddl)
+
+
+if __name__ == "__main__":
+    main()
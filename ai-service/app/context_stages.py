@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from prometheus_client import Histogram
+
+STAGE_OK = "ok"
+STAGE_TIMEOUT = "timeout"
+STAGE_ERROR = "error"
+
+CONTEXT_STAGE_SECONDS = Histogram(
+    "aiyo_chat_context_stage_seconds",
+    "聊天 context 組裝各階段耗時",
+    ["stage", "status"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+StageRunner = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+@dataclass
+class ContextStage:
+    """context 組裝中的一個階段。
+
+    run 會收到其相依階段的結果（以階段名稱為 key）；逾時或拋出例外時改用 default_factory 的降級值，
+    相依於它的階段仍會以降級值繼續執行。
+    """
+
+    name: str
+    run: StageRunner
+    timeout_sec: float
+    default_factory: Callable[[], Any] = lambda: None
+    depends_on: Sequence[str] = field(default_factory=tuple)
+
+
+@dataclass
+class StageOutcome:
+    name: str
+    value: Any
+    status: str
+    duration_ms: int
+    error: Optional[str] = None
+
+
+def _validate_stage_graph(stages: List[ContextStage]) -> None:
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("duplicate context stage name")
+    known: set[str] = set()
+    for stage in stages:
+        for dep in stage.depends_on:
+            if dep not in known:
+                # 只允許依賴排在前面的階段，避免循環依賴
+                raise ValueError(f"context stage {stage.name} depends on unknown or later stage {dep}")
+        known.add(stage.name)
+
+
+async def run_context_stages(stages: List[ContextStage]) -> Dict[str, StageOutcome]:
+    """依相依關係並行執行各階段；互不相依的階段同時進行，總耗時約為最長路徑而非總和。"""
+    _validate_stage_graph(stages)
+    tasks: Dict[str, asyncio.Task[StageOutcome]] = {}
+
+    async def _run(stage: ContextStage) -> StageOutcome:
+        deps: Dict[str, Any] = {}
+        if stage.depends_on:
+            dep_outcomes = await asyncio.gather(*(tasks[name] for name in stage.depends_on))
+            deps = {outcome.name: outcome.value for outcome in dep_outcomes}
+        started = time.monotonic()
+        status = STAGE_OK
+        error: Optional[str] = None
+        try:
+            value = await asyncio.wait_for(stage.run(deps), timeout=max(0.001, stage.timeout_sec))
+        except asyncio.TimeoutError:
+            status = STAGE_TIMEOUT
+            error = f"timeout after {stage.timeout_sec:.2f}s"
+            value = stage.default_factory()
+        except Exception as exc:
+            status = STAGE_ERROR
+            error = f"{type(exc).__name__}: {exc}"
+            value = stage.default_factory()
+        elapsed = time.monotonic() - started
+        CONTEXT_STAGE_SECONDS.labels(stage=stage.name, status=status).observe(elapsed)
+        if status != STAGE_OK:
+            print(f"[context_stages] stage {stage.name} degraded: {error}")
+        return StageOutcome(
+            name=stage.name,
+            value=value,
+            status=status,
+            duration_ms=int(elapsed * 1000),
+            error=error,
+        )
+
+    for stage in stages:
+        tasks[stage.name] = asyncio.create_task(_run(stage), name=f"context-stage:{stage.name}")
+    try:
+        outcomes = await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return {outcome.name: outcome for outcome in outcomes}
+
+
+def stage_timings(outcomes: Dict[str, StageOutcome]) -> Dict[str, Dict[str, Any]]:
+    """供稽核紀錄使用的精簡耗時摘要。"""
+    return {
+        name: {"status": outcome.status, "duration_ms": outcome.duration_ms}
+        for name, outcome in outcomes.items()
+    }
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+EMBEDDING_BATCH_QUEUE_DEPTH = Gauge(
+    "aiyo_embedding_batch_queue_depth",
+    "等待併入批次的 embedding 請求數",
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "aiyo_embedding_batch_size",
+    "每次送往 Ollama /api/embed 的批次筆數",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+EMBEDDING_BATCH_REQUESTS = Counter(
+    "aiyo_embedding_batch_requests_total",
+    "批次 embedding 呼叫結果",
+    ["result"],
+)
+
+# (model, texts) -> 與 texts 等長的向量清單；失敗回傳 None
+BatchSender = Callable[[str, List[str]], Awaitable[Optional[List[List[float]]]]]
+_Pending = Tuple[str, "asyncio.Future[Optional[List[float]]]"]
+
+
+class EmbeddingBatcher:
+    """把多個 coroutine 的 embedding 請求在短時間窗內合併成一次 /api/embed 呼叫。
+
+    每個 model 各自累積；湊滿 max_batch_size 立即送出，否則最多等待 max_wait_ms。
+    批次失敗時每個呼叫者收到 None，由呼叫端自行走單筆降級路徑。
+    """
+
+    def __init__(
+        self,
+        send_batch: BatchSender,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 5.0,
+        max_queue_depth: int = 1024,
+    ) -> None:
+        self._send_batch = send_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_sec = max(0.0, max_wait_ms) / 1000.0
+        self.max_queue_depth = max(1, max_queue_depth)
+        self._pending: Dict[str, List[_Pending]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._inflight: set[asyncio.Task[None]] = set()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(items) for items in self._pending.values())
+
+    async def embed(self, model: str, text: str) -> Optional[List[float]]:
+        if self.queue_depth >= self.max_queue_depth:
+            # 佇列已滿：不再排隊，直接單筆送出，避免無上限累積
+            EMBEDDING_BATCH_REQUESTS.labels(result="overflow").inc()
+            vectors = await self._send_checked(model, [text])
+            return vectors[0] if vectors else None
+
+        loop = asyncio.get_running_loop()
+        future: "asyncio.Future[Optional[List[float]]]" = loop.create_future()
+        bucket = self._pending.setdefault(model, [])
+        bucket.append((text, future))
+        EMBEDDING_BATCH_QUEUE_DEPTH.set(self.queue_depth)
+        if len(bucket) >= self.max_batch_size:
+            self._flush(model)
+        elif model not in self._timers:
+            self._timers[model] = loop.call_later(self.max_wait_sec, self._flush, model)
+        return await future
+
+    def _flush(self, model: str) -> None:
+        timer = self._timers.pop(model, None)
+        if timer is not None:
+            timer.cancel()
+        bucket = self._pending.pop(model, [])
+        EMBEDDING_BATCH_QUEUE_DEPTH.set(self.queue_depth)
+        # 已被取消的呼叫者不必送出
+        items = [item for item in bucket if not item[1].done()]
+        for start in range(0, len(items), self.max_batch_size):
+            chunk = items[start : start + self.max_batch_size]
+            task = asyncio.get_running_loop().create_task(self._dispatch(model, chunk))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _send_checked(self, model: str, texts: List[str]) -> Optional[List[List[float]]]:
+        """送出一批；例外或筆數不符時回傳 None，批次與佇列滿直接送出兩條路徑的降級行為一致。"""
+        try:
+            vectors = await self._send_batch(model, texts)
+        except Exception as exc:
+            print(f"[embedding_batcher] batch of {len(texts)} failed: {type(exc).__name__}: {exc}")
+            return None
+        if not vectors or len(vectors) != len(texts):
+            return None
+        return vectors
+
+    async def _dispatch(self, model: str, items: List[_Pending]) -> None:
+        EMBEDDING_BATCH_SIZE.observe(len(items))
+        vectors = await self._send_checked(model, [text for text, _ in items])
+        EMBEDDING_BATCH_REQUESTS.labels(result="ok" if vectors else "error").inc()
+        for index, (_text, future) in enumerate(items):
+            if not future.done():
+                future.set_result(vectors[index] if vectors else None)
+
+    async def drain(self) -> None:
+        """送出所有累積中的請求並等待完成（關閉服務時使用）。"""
+        for model in list(self._pending):
+            self._flush(model)
+        if self._inflight:
+            await asyncio.gather(*list(self._inflight), return_exceptions=True)
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+EMBEDDING_CACHE_REQUESTS = Counter(
+    "aiyo_embedding_cache_requests_total",
+    "查詢向量快取請求數（hit / miss / coalesced）",
+    ["result"],
+)
+EMBEDDING_CACHE_ENTRIES = Gauge("aiyo_embedding_cache_entries", "查詢向量快取目前筆數")
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+CacheKey = Tuple[str, str]
+EmbeddingCompute = Callable[[], Awaitable[Optional[List[float]]]]
+
+
+def normalize_embedding_text(text: str) -> str:
+    """全形半形統一（NFKC）並壓縮空白，讓「台南  美食」與「台南 美食」共用同一筆快取。"""
+    normalized = unicodedata.normalize("NFKC", text or "")
+    return _WHITESPACE_RE.sub(" ", normalized).strip()
+
+
+class EmbeddingCache:
+    """以 (model, 正規化文字) 為 key 的 LRU + TTL 查詢向量快取。
+
+    相同 key 的並行請求只會觸發一次 compute（single-flight），其餘請求等待同一個結果。
+    compute 回傳 None（Ollama 失敗）時不寫入快取，下次請求會重試。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        ttl_sec: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl_sec = max(0.0, ttl_sec)
+        self._clock = clock
+        self._entries: "OrderedDict[CacheKey, Tuple[float, List[float]]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, "asyncio.Future[Optional[List[float]]]"] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _lookup(self, key: CacheKey) -> Optional[List[float]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, vector = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            EMBEDDING_CACHE_ENTRIES.set(len(self._entries))
+            return None
+        self._entries.move_to_end(key)
+        return vector
+
+    def _store(self, key: CacheKey, vector: List[float]) -> None:
+        self._entries[key] = (self._clock() + self.ttl_sec, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        EMBEDDING_CACHE_ENTRIES.set(len(self._entries))
+
+    async def get_or_compute(self, model: str, text: str, compute: EmbeddingCompute) -> Optional[List[float]]:
+        key = (model, normalize_embedding_text(text))
+        cached = self._lookup(key)
+        if cached is not None:
+            self.hits += 1
+            EMBEDDING_CACHE_REQUESTS.labels(result="hit").inc()
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            EMBEDDING_CACHE_REQUESTS.labels(result="coalesced").inc()
+            try:
+                # shield：等待者被取消時不影響正在進行的那一次 Ollama 呼叫
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                task = asyncio.current_task()
+                if inflight.cancelled() and task is not None and not task.cancelling():
+                    # 發起呼叫的請求被取消（例如階段逾時），等待者自行重算
+                    return await compute()
+                raise
+
+        self.misses += 1
+        EMBEDDING_CACHE_REQUESTS.labels(result="miss").inc()
+        future: "asyncio.Future[Optional[List[float]]]" = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            vector = await compute()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            if not future.done():
+                future.set_exception(exc)
+                # 若沒有其他等待者，避免 "exception was never retrieved" 警告
+                future.exception()
+            raise
+        else:
+            if vector:
+                self._store(key, vector)
+            if not future.done():
+                future.set_result(vector)
+            return vector
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        EMBEDDING_CACHE_ENTRIES.set(0)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": ((self.hits + self.coalesced) / total) if total else 0.0,
+        }
@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+# orjson 為選用相依：未安裝時退回標準庫 json，行為一致（UTF-8、不跳脫非 ASCII）
+if importlib.util.find_spec("orjson") is not None:
+    import orjson
+
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value, default=str, option=_ORJSON_OPTIONS)
+
+    def loads(data: Any) -> Any:
+        return orjson.loads(data)
+
+    JSONDecodeError = orjson.JSONDecodeError
+    BACKEND = "orjson"
+else:
+
+    def dumps(value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+    def loads(data: Any) -> Any:
+        return json.loads(data)
+
+    JSONDecodeError = json.JSONDecodeError
+    BACKEND = "json"
+
+
+class FastJSONResponse(JSONResponse):
+    """以 dumps 序列化的 JSONResponse，用於 RAG / 推薦等較大的回應。"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import importlib.util
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
+from app.config import env_bool, env_float, env_int
+
+
+UPSTREAM_OLLAMA = "ollama"
+UPSTREAM_YOUTUBE = "youtube"
+UPSTREAM_WEATHER = "weather"
+UPSTREAM_GEOCODE = "geocode"
+UPSTREAM_SEARCH = "search"
+
+# Ollama 預設 timeout 即聊天串流 timeout：connect 有限、read 拉長，避免長回應被整段切斷
+OLLAMA_HTTP_TIMEOUT = httpx.Timeout(connect=30.0, read=600.0, write=120.0, pool=30.0)
+HTTP_KEEPALIVE_EXPIRY_SEC = max(1.0, env_float("HTTP_KEEPALIVE_EXPIRY_SEC", 30.0))
+HTTP_OLLAMA_MAX_CONNECTIONS = max(1, env_int("HTTP_OLLAMA_MAX_CONNECTIONS", 64))
+HTTP_OLLAMA_MAX_KEEPALIVE = max(0, env_int("HTTP_OLLAMA_MAX_KEEPALIVE", 32))
+HTTP_EXTERNAL_MAX_CONNECTIONS = max(1, env_int("HTTP_EXTERNAL_MAX_CONNECTIONS", 20))
+HTTP_EXTERNAL_MAX_KEEPALIVE = max(0, env_int("HTTP_EXTERNAL_MAX_KEEPALIVE", 10))
+# HTTP/2 只套用在 TLS 外部服務（googleapis、open-meteo 等），需額外安裝 h2 套件
+HTTP_ENABLE_HTTP2 = env_bool("HTTP_ENABLE_HTTP2", False)
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    timeout: httpx.Timeout
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY_SEC
+    http2: bool = False
+
+
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def default_upstream_configs() -> Dict[str, UpstreamConfig]:
+    http2 = HTTP_ENABLE_HTTP2 and _http2_available()
+    if HTTP_ENABLE_HTTP2 and not http2:
+        print("[http_clients] HTTP_ENABLE_HTTP2=true but h2 is not installed; falling back to HTTP/1.1")
+
+    def external(timeout: httpx.Timeout) -> UpstreamConfig:
+        return UpstreamConfig(
+            timeout=timeout,
+            max_connections=HTTP_EXTERNAL_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_EXTERNAL_MAX_KEEPALIVE,
+            http2=http2,
+        )
+
+    return {
+        UPSTREAM_OLLAMA: UpstreamConfig(
+            timeout=OLLAMA_HTTP_TIMEOUT,
+            max_connections=HTTP_OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_OLLAMA_MAX_KEEPALIVE,
+        ),
+        UPSTREAM_YOUTUBE: external(httpx.Timeout(15.0, connect=5.0)),
+        UPSTREAM_WEATHER: external(httpx.Timeout(12.0, connect=4.0)),
+        UPSTREAM_GEOCODE: external(httpx.Timeout(10.0, connect=3.0)),
+        UPSTREAM_SEARCH: external(httpx.Timeout(15.0, connect=5.0)),
+    }
+
+
+def _build_client(config: UpstreamConfig) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=config.timeout,
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        http2=config.http2,
+    )
+
+
+class HttpClientRegistry:
+    """每個上游一個長駐 AsyncClient，連線在請求之間保持 keep-alive 重用。"""
+
+    def __init__(self, configs: Optional[Dict[str, UpstreamConfig]] = None) -> None:
+        self.configs = configs if configs is not None else default_upstream_configs()
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def config_for(self, name: str) -> UpstreamConfig:
+        config = self.configs.get(name)
+        if config is None:
+            raise KeyError(f"unknown upstream: {name}")
+        return config
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = _build_client(self.config_for(name))
+            self._clients[name] = client
+        return client
+
+    async def aclose(self) -> None:
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+
+_registry: Optional[HttpClientRegistry] = None
+
+
+def open_http_clients() -> HttpClientRegistry:
+    """服務啟動時呼叫；之後各上游呼叫共用同一組連線池。"""
+    global _registry
+    if _registry is None:
+        _registry = HttpClientRegistry()
+    return _registry
+
+
+async def close_http_clients() -> None:
+    global _registry
+    registry, _registry = _registry, None
+    if registry is not None:
+        await registry.aclose()
+
+
+def get_http_clients() -> Optional[HttpClientRegistry]:
+    return _registry
+
+
+@asynccontextmanager
+async def upstream_client(
+    name: str,
+    registry: Optional[HttpClientRegistry] = None,
+) -> AsyncIterator[httpx.AsyncClient]:
+    """取得指定上游的 client：優先使用呼叫端注入的 registry，其次為服務層級的共用 registry。
+
+    兩者皆無時（單元測試、腳本直接呼叫）退回建立一次性的 client，用完即關閉。
+    """
+    registry = registry or _registry
+    if registry is not None:
+        yield registry.get(name)
+        return
+    async with _build_client(default_upstream_configs()[name]) as ephemeral:
+        yield ephemeral
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.keyword_search import build_segment_keyword_search
+
+# 單一陳述式融合時額外回傳的輔助欄位；回傳給呼叫端前移除
+HYBRID_HELPER_COLUMNS = ("rrf_score", "dense_rank", "sparse_rank", "dense_count", "sparse_count")
+
+
+def build_hybrid_search_sql(
+    columns: str,
+    vector_param: Any,
+    terms: Sequence[str],
+    query: str,
+    city: Optional[str],
+    *,
+    rrf_k: int,
+    vector_top_k: int,
+    keyword_top_k: int,
+    vector_weight: float,
+    keyword_weight: float,
+    limit: int,
+    dense_city_predicate: Optional[str] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """dense 與 sparse 兩路以 CTE 在同一個陳述式內執行，並在 Postgres 內計算 RRF。
+
+    分數與 main.reciprocal_rank_fusion 相同：weight * 1 / (k + rank)，rank 從 1 起算；
+    同分時 dense 命中者在前（依 dense 名次），其餘依 sparse 名次，等同 Python 版依首次出現順序的穩定排序。
+    columns 使用別名 d（segment_search_doc），另外回傳 distance 與 HYBRID_HELPER_COLUMNS。
+    dense_city_predicate 可覆寫 dense 路的城市條件（見 city_vector_index.CityVectorIndexPlanner）。
+    """
+    params: Dict[str, Any] = {
+        "hy_vector": vector_param,
+        "hy_rrf_k": rrf_k,
+        "hy_vector_top_k": vector_top_k,
+        "hy_vector_weight": vector_weight,
+        "hy_keyword_weight": keyword_weight,
+        "hy_limit": limit,
+    }
+    dense_city = ""
+    if city:
+        dense_city = dense_city_predicate or "AND d.city = %(kw_city)s"
+        params["kw_city"] = city
+
+    if terms:
+        keyword_sql, keyword_sql_params = build_segment_keyword_search(
+            "d.segment_id, d.segment_created_at", terms, query, city, keyword_top_k
+        )
+        params.update(keyword_sql_params)
+        sparse_cte = f"""
+        sparse_hits AS ({keyword_sql}),
+        sparse AS (
+            SELECT segment_id,
+                   ROW_NUMBER() OVER (ORDER BY keyword_score DESC, segment_created_at DESC) AS rank
+            FROM sparse_hits
+        ),"""
+    else:
+        sparse_cte = """
+        sparse AS (
+            SELECT NULL::integer AS segment_id, NULL::bigint AS rank
+            WHERE FALSE
+        ),"""
+
+    sql = f"""
+        WITH dense_hits AS (
+            SELECT d.segment_id, (d.embedding_vector <=> %(hy_vector)s::vector) AS distance
+            FROM segment_search_doc d
+            WHERE d.embedding_vector IS NOT NULL
+              {dense_city}
+            ORDER BY d.embedding_vector <=> %(hy_vector)s::vector
+            LIMIT %(hy_vector_top_k)s
+        ),
+        dense AS (
+            SELECT segment_id, distance, ROW_NUMBER() OVER (ORDER BY distance) AS rank
+            FROM dense_hits
+        ),{sparse_cte}
+        fused AS (
+            SELECT COALESCE(dn.segment_id, sp.segment_id) AS segment_id,
+                   dn.distance,
+                   COALESCE(%(hy_vector_weight)s::float8 * (1.0::float8 / (%(hy_rrf_k)s + dn.rank)), 0)
+                     + COALESCE(%(hy_keyword_weight)s::float8 * (1.0::float8 / (%(hy_rrf_k)s + sp.rank)), 0)
+                     AS rrf_score,
+                   dn.rank AS dense_rank,
+                   sp.rank AS sparse_rank
+            FROM dense dn
+            FULL OUTER JOIN sparse sp ON sp.segment_id = dn.segment_id
+        )
+        SELECT {columns},
+               f.distance,
+               f.rrf_score,
+               f.dense_rank,
+               f.sparse_rank,
+               (SELECT COUNT(*) FROM dense) AS dense_count,
+               (SELECT COUNT(*) FROM sparse) AS sparse_count
+        FROM fused f
+        JOIN segment_search_doc d ON d.segment_id = f.segment_id
+        ORDER BY f.rrf_score DESC, (f.dense_rank IS NULL), COALESCE(f.dense_rank, f.sparse_rank)
+        LIMIT %(hy_limit)s
+    """
+    return sql, params
+
+
+def hybrid_mode(rows: List[Dict[str, Any]]) -> str:
+    """依兩路命中數決定 mode，與 Python 融合路徑的 hybrid-rrf / pgvector / keyword-only 一致。"""
+    if not rows:
+        return ""
+    dense_count = int(rows[0].get("dense_count") or 0)
+    sparse_count = int(rows[0].get("sparse_count") or 0)
+    if dense_count and sparse_count:
+        return "hybrid-rrf"
+    if dense_count:
+        return "pgvector"
+    return "keyword-only"
+
+
+def strip_hybrid_helpers(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for row in rows:
+        for column in HYBRID_HELPER_COLUMNS:
+            row.pop(column, None)
+    return rows
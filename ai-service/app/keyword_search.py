@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# 查詢最多拆成幾個關鍵詞；每個詞都會展開成多個 ILIKE 條件，過多會讓查詢計畫變慢
+KEYWORD_MAX_TERMS = 4
+
+# 欄位命中權重：地點名稱 > 摘要 > 影片標題 > 標籤（與舊版 CASE 排序的優先順序一致）
+KEYWORD_PLACE_WEIGHT = 3.0
+KEYWORD_SUMMARY_WEIGHT = 2.0
+KEYWORD_TITLE_WEIGHT = 1.5
+KEYWORD_TAGS_WEIGHT = 1.0
+
+_TERM_SPLIT_RE = re.compile(r"[\s,，、。．.!！?？;；:：/|()（）\[\]【】「」『』\"'“”‘’]+")
+_LIKE_ESCAPE_RE = re.compile(r"([\\%_])")
+
+
+def keyword_terms(query: str, max_terms: int = KEYWORD_MAX_TERMS) -> List[str]:
+    """把查詢切成關鍵詞（依空白與標點），去重後保留前 max_terms 個。
+
+    單一字元的詞（例如「的」）對 trigram 索引沒有幫助，除非整個查詢就只有它。
+    """
+    normalized = unicodedata.normalize("NFKC", query or "").strip()
+    if not normalized:
+        return []
+    parts = [part for part in _TERM_SPLIT_RE.split(normalized) if part]
+    terms = list(dict.fromkeys(part for part in parts if len(part) >= 2))
+    if not terms:
+        terms = list(dict.fromkeys(parts))
+    return terms[: max(1, max_terms)]
+
+
+def like_pattern(term: str) -> str:
+    """包成 %term% 並跳脫 LIKE 萬用字元，避免使用者輸入的 % / _ 變成萬用比對。"""
+    escaped = _LIKE_ESCAPE_RE.sub(r"\\\1", term)
+    return f"%{escaped}%"
+
+
+def keyword_phrase(query: str) -> str:
+    """整句比對用的查詢字串（NFKC、壓縮空白）。"""
+    return " ".join(unicodedata.normalize("NFKC", query or "").split())
+
+
+def needs_bigram_index(term: str) -> bool:
+    """pg_trgm 無法從少於 3 個字元的詞抽出 trigram（`%台南%` 會掃過整個索引），
+    這類 2 字元詞改查 segment_search_doc.search_bigrams（migration 018）。"""
+    return len(term) == 2 and not any(char.isspace() for char in term)
+
+
+def bigram_tsquery(term: str) -> str:
+    """單一 bigram 的 tsquery 字面值；search_bigrams 存的是小寫 bigram，不經斷詞或詞幹處理。"""
+    lexeme = term.lower().replace("\\", "\\\\").replace("'", "''")
+    return f"'{lexeme}'"
+
+
+def keyword_params(terms: Sequence[str], query: str) -> Dict[str, Any]:
+    params: Dict[str, Any] = {f"kw{index}": like_pattern(term) for index, term in enumerate(terms)}
+    params["kw_query"] = " ".join(terms) or (query or "").strip()
+    return params
+
+
+def keyword_score_sql(weighted_columns: Sequence[Tuple[str, float]], term_count: int) -> str:
+    """每個 (欄位, 關鍵詞) 命中累加對應權重；命中越多詞、越重要的欄位分數越高。"""
+    parts = [
+        f"CASE WHEN {column} ILIKE %(kw{index})s THEN {weight} ELSE 0 END"
+        for index in range(term_count)
+        for column, weight in weighted_columns
+    ]
+    return "(" + " + ".join(parts) + ")" if parts else "0"
+
+
+SEGMENT_DOC_TEXT_COLUMNS = ("d.summary", "d.tags_text", "d.video_title", "d.place_names")
+
+
+def segment_doc_match_sql(terms: Sequence[str], prefix: str = "kw") -> Tuple[str, Dict[str, Any]]:
+    """segment_search_doc 任一文字欄位命中任一詞：3 字元以上走 trigram 索引的 ILIKE，2 字元詞走 bigram 索引。"""
+    conditions: List[str] = []
+    params: Dict[str, Any] = {}
+    for index, term in enumerate(terms):
+        if needs_bigram_index(term):
+            key = f"{prefix}b{index}"
+            params[key] = bigram_tsquery(term)
+            conditions.append(f"d.search_bigrams @@ %({key})s::tsquery")
+        else:
+            key = f"{prefix}{index}"
+            params[key] = like_pattern(term)
+            conditions.extend(f"{column} ILIKE %({key})s" for column in SEGMENT_DOC_TEXT_COLUMNS)
+    return ("(" + " OR ".join(conditions) + ")" if conditions else "FALSE"), params
+
+
+def build_segment_keyword_search(
+    columns: str,
+    terms: Sequence[str],
+    query: str,
+    city: Optional[str],
+    limit: int,
+    match_terms: Optional[Sequence[str]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """segment_search_doc 的關鍵字檢索 SQL：以可走索引的條件取出命中列，
+    再依欄位權重 + word_similarity 計算排名分數排序。
+
+    columns 為 SELECT 的欄位清單，使用別名 d（segment_search_doc）。
+    預設任一詞命中即列入候選；match_terms 可改用其他條件取候選（例如 [整句]），排名仍依 terms 計分。
+    """
+    term_count = len(terms)
+    params = keyword_params(terms, query)
+    params["kw_limit"] = limit
+    city_filter = ""
+    if city:
+        city_filter = "AND d.city = %(kw_city)s"
+        params["kw_city"] = city
+
+    score = keyword_score_sql(
+        [
+            ("d.place_names", KEYWORD_PLACE_WEIGHT),
+            ("d.summary", KEYWORD_SUMMARY_WEIGHT),
+            ("d.video_title", KEYWORD_TITLE_WEIGHT),
+            ("d.tags_text", KEYWORD_TAGS_WEIGHT),
+        ],
+        term_count,
+    )
+    if match_terms is None:
+        match, match_params = segment_doc_match_sql(terms)
+    else:
+        match, match_params = segment_doc_match_sql(match_terms, prefix="km")
+    params.update(match_params)
+    sql = f"""
+        SELECT {columns},
+               ({score} + word_similarity(%(kw_query)s, COALESCE(d.summary, '')))::float8 AS keyword_score
+        FROM segment_search_doc d
+        WHERE {match}
+          {city_filter}
+        ORDER BY keyword_score DESC, d.segment_created_at DESC
+        LIMIT %(kw_limit)s
+    """
+    return sql, params
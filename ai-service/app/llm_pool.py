@@ -0,0 +1,488 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+
+import httpx
+from prometheus_client import Counter, Gauge
+
+from app import fast_json
+from app.http_clients import UPSTREAM_OLLAMA, HttpClientRegistry, upstream_client
+
+PROTOCOL_OLLAMA = "ollama"
+PROTOCOL_OPENAI = "openai"
+STRATEGY_LEAST_OUTSTANDING = "least_outstanding"
+STRATEGY_EWMA = "ewma"
+
+LLM_BACKEND_OUTSTANDING = Gauge(
+    "aiyo_llm_backend_outstanding",
+    "各 LLM 後端進行中的請求數",
+    ["backend"],
+)
+LLM_BACKEND_HEALTHY = Gauge(
+    "aiyo_llm_backend_healthy",
+    "LLM 後端是否在負載平衡名單內（0 表示被暫時剔除）",
+    ["backend"],
+)
+LLM_BACKEND_LATENCY_EWMA = Gauge(
+    "aiyo_llm_backend_latency_ewma_seconds",
+    "LLM 後端回應時間（非串流為完整回應、串流為收到標頭）的指數移動平均",
+    ["backend"],
+)
+LLM_BACKEND_REQUESTS = Counter(
+    "aiyo_llm_backend_requests_total",
+    "送往各 LLM 後端的請求（ok / client_error / model_missing / error）",
+    ["backend", "result"],
+)
+LLM_BACKEND_EJECTIONS = Counter(
+    "aiyo_llm_backend_ejections_total",
+    "LLM 後端因連續失敗被暫時剔除的次數",
+    ["backend"],
+)
+
+
+@dataclass
+class LlmBackend:
+    name: str
+    base_url: str
+    protocol: str = PROTOCOL_OLLAMA
+    api_key: str = ""
+    # 不為空時取代請求中的 model（OpenAI 相容後端的模型名稱通常與 Ollama tag 不同）
+    model: str = ""
+    outstanding: int = 0
+    ewma_sec: float = 0.0
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+
+    @property
+    def chat_url(self) -> str:
+        if self.protocol == PROTOCOL_OPENAI:
+            return f"{self.base_url}/chat/completions"
+        return f"{self.base_url}/api/chat"
+
+    def headers(self) -> Dict[str, str]:
+        if self.protocol == PROTOCOL_OPENAI and self.api_key:
+            return {"Authorization": f"Bearer {self.api_key}"}
+        return {}
+
+
+def parse_backends(spec: str, default_base_url: str, api_key: str = "") -> List[LlmBackend]:
+    """`LLM_BACKENDS` 為逗號分隔清單，每項為 URL 或 `協定|URL[|model=模型名稱]`（協定：ollama / openai）。
+
+    例：`http://ollama-1:11434,openai|http://vllm:8000/v1|model=google/gemma-3-4b-it`；
+    設定 model 時送往該後端的請求一律改用該模型（vLLM 等只服務一個模型、名稱與 Ollama tag 不同）。
+    未設定時只有 OLLAMA_BASE_URL。
+    """
+    backends: List[LlmBackend] = []
+    seen: set = set()
+    for raw in (spec or "").split(","):
+        item = raw.strip()
+        if not item:
+            continue
+        parts = [part.strip() for part in item.split("|")]
+        if len(parts) == 1:
+            protocol, url, options = PROTOCOL_OLLAMA, parts[0], []
+        else:
+            protocol, url, options = parts[0].lower(), parts[1], parts[2:]
+        if protocol not in (PROTOCOL_OLLAMA, PROTOCOL_OPENAI):
+            print(f"[llm_pool] ignoring backend with unknown protocol: {item}")
+            continue
+        model = ""
+        for option in options:
+            key, sep, value = option.partition("=")
+            if sep and key.strip().lower() == "model":
+                model = value.strip()
+            else:
+                print(f"[llm_pool] ignoring unknown backend option: {option}")
+        url = url.rstrip("/")
+        name = f"{protocol}:{urlparse(url).netloc or url}"
+        if name in seen:
+            continue
+        seen.add(name)
+        backends.append(LlmBackend(name=name, base_url=url, protocol=protocol, api_key=api_key, model=model))
+    if not backends:
+        url = default_base_url.rstrip("/")
+        backends.append(LlmBackend(name=f"{PROTOCOL_OLLAMA}:{urlparse(url).netloc or url}", base_url=url))
+    return backends
+
+
+def is_model_missing(status_code: int, text: str) -> bool:
+    """後端沒有這個模型（Ollama：404 model not found；vLLM：404 / 400 model does not exist）。
+
+    模型名稱來自用戶端，不代表後端故障：只改送另一台，不計入健康檢查。
+    """
+    if status_code not in (400, 404):
+        return False
+    lowered = (text or "").lower()
+    return "model" in lowered and ("not found" in lowered or "does not exist" in lowered)
+
+
+def is_backend_fault(status_code: int, text: str) -> bool:
+    """5xx，或不是模型不存在的 404（base URL / 路徑設定錯誤），計入健康檢查。"""
+    return status_code >= 500 or (status_code == 404 and not is_model_missing(status_code, text))
+
+
+def to_openai_request(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Ollama /api/chat 請求 → OpenAI 相容 /chat/completions 請求。"""
+    options = body.get("options") or {}
+    request: Dict[str, Any] = {
+        "model": body.get("model"),
+        "messages": body.get("messages") or [],
+        "stream": bool(body.get("stream")),
+    }
+    if "temperature" in options:
+        request["temperature"] = options["temperature"]
+    if "top_p" in options:
+        request["top_p"] = options["top_p"]
+    if "num_predict" in options:
+        request["max_tokens"] = options["num_predict"]
+    if body.get("tools"):
+        request["tools"] = body["tools"]
+    if body.get("format") == "json":
+        request["response_format"] = {"type": "json_object"}
+    return request
+
+
+def from_openai_response(data: Any) -> Dict[str, Any]:
+    """OpenAI 相容回應 → Ollama /api/chat 回應格式（呼叫端只處理一種格式）。"""
+    choices = data.get("choices") if isinstance(data, dict) else None
+    choice = choices[0] if isinstance(choices, list) and choices and isinstance(choices[0], dict) else {}
+    message = choice.get("message") if isinstance(choice.get("message"), dict) else {}
+    converted: Dict[str, Any] = {"role": "assistant", "content": message.get("content") or ""}
+    if message.get("tool_calls"):
+        converted["tool_calls"] = message["tool_calls"]
+    return {"message": converted, "done": True}
+
+
+def from_openai_stream_event(data: Any) -> Dict[str, Any]:
+    choices = data.get("choices") if isinstance(data, dict) else None
+    choice = choices[0] if isinstance(choices, list) and choices and isinstance(choices[0], dict) else {}
+    delta = choice.get("delta") if isinstance(choice.get("delta"), dict) else {}
+    return {"message": {"content": delta.get("content") or ""}, "done": choice.get("finish_reason") is not None}
+
+
+class LlmResponse:
+    """非串流回應；json() 一律為 Ollama /api/chat 格式。"""
+
+    def __init__(self, status_code: int, data: Any = None, text: str = "", backend: str = "") -> None:
+        self.status_code = status_code
+        self._data = data
+        self.text = text
+        self.backend = backend
+
+    def json(self) -> Any:
+        return self._data if self._data is not None else {}
+
+
+class LlmStream:
+    """串流回應；chunks() 逐一產生 Ollama 格式的 chunk（{"message": {"content"}, "done"} 或 {"error"}）。"""
+
+    def __init__(
+        self,
+        status_code: int,
+        *,
+        backend: Optional[LlmBackend] = None,
+        response: Optional[httpx.Response] = None,
+        text: str = "",
+        on_close: Optional[Callable[[bool], None]] = None,
+        exit_stack: Optional[AsyncExitStack] = None,
+    ) -> None:
+        self.status_code = status_code
+        self.backend = backend.name if backend is not None else ""
+        self.text = text
+        self._protocol = backend.protocol if backend is not None else PROTOCOL_OLLAMA
+        self._response = response
+        self._on_close = on_close
+        self._exit_stack = exit_stack
+        self._failed = False
+        self._closed = False
+
+    async def chunks(self) -> AsyncIterator[Dict[str, Any]]:
+        if self._response is None:
+            return
+        # OpenAI 相容串流先以 finish_reason 結束、再送 [DONE]：只產生一個 done chunk
+        done_sent = False
+        try:
+            async for raw in self._response.aiter_lines():
+                line = raw.strip()
+                if not line:
+                    continue
+                if self._protocol == PROTOCOL_OPENAI:
+                    if not line.startswith("data:"):
+                        continue
+                    line = line[5:].strip()
+                    if line == "[DONE]":
+                        if not done_sent:
+                            yield {"message": {"content": ""}, "done": True}
+                        return
+                try:
+                    chunk = fast_json.loads(line)
+                except fast_json.JSONDecodeError:
+                    continue
+                if self._protocol == PROTOCOL_OPENAI:
+                    if isinstance(chunk, dict) and chunk.get("error"):
+                        yield {"error": str(chunk["error"])}
+                        continue
+                    if done_sent:
+                        # finish_reason 之後只剩 usage 等統計 chunk
+                        continue
+                    chunk = from_openai_stream_event(chunk)
+                    done_sent = bool(chunk["done"])
+                yield chunk
+        except httpx.HTTPError:
+            self._failed = True
+            raise
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._response is not None:
+                await self._response.aclose()
+            if self._exit_stack is not None:
+                await self._exit_stack.aclose()
+        finally:
+            if self._on_close is not None:
+                self._on_close(not self._failed)
+
+
+def _affinity_score(session_id: str, backend: LlmBackend) -> int:
+    return int.from_bytes(hashlib.sha1(f"{session_id}|{backend.name}".encode("utf-8")).digest()[:8], "big")
+
+
+class LlmPool:
+    """多個 LLM 後端（Ollama / OpenAI 相容如 vLLM）的負載平衡池。
+
+    - 路由：least_outstanding（進行中請求最少，平手比 EWMA）或 ewma（EWMA × (進行中 + 1)）。
+    - 被動健康檢查：連線錯誤、5xx 與路徑不存在的 404 連續 max_failures 次即剔除 eject_sec 秒；全部被剔除時仍挑最早恢復的一台。
+      模型不存在由用戶端指定的模型造成，只改送另一台、不計入。
+    - session 親和：同一 session_id 以 rendezvous hash 固定到同一台以重用 KV cache；
+      該台進行中請求比最閒的一台多出 affinity_max_skew 以上時改走一般路由。
+    - 每台上限：max_outstanding > 0 時只挑進行中請求未達上限的後端（親和也不例外）；全部達上限時才照常路由。
+    - 非串流請求與尚未開始串流的請求，遇到連線錯誤、5xx 或該後端沒有這個模型時會改送另一台後端重試一次。
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[LlmBackend],
+        *,
+        strategy: str = STRATEGY_LEAST_OUTSTANDING,
+        max_failures: int = 3,
+        eject_sec: float = 30.0,
+        ewma_alpha: float = 0.3,
+        session_affinity: bool = True,
+        affinity_max_skew: int = 4,
+        max_outstanding: int = 0,
+        http_clients: Optional[HttpClientRegistry] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not backends:
+            raise ValueError("LlmPool needs at least one backend")
+        self.backends = list(backends)
+        self.strategy = strategy if strategy in (STRATEGY_LEAST_OUTSTANDING, STRATEGY_EWMA) else STRATEGY_LEAST_OUTSTANDING
+        self.max_failures = max(1, max_failures)
+        self.eject_sec = max(0.0, eject_sec)
+        self.ewma_alpha = min(1.0, max(0.01, ewma_alpha))
+        self.session_affinity = session_affinity
+        self.affinity_max_skew = max(0, affinity_max_skew)
+        self.max_outstanding = max(0, max_outstanding)
+        self._http_clients = http_clients
+        self._clock = clock
+        for backend in self.backends:
+            LLM_BACKEND_HEALTHY.labels(backend=backend.name).set(1)
+            LLM_BACKEND_OUTSTANDING.labels(backend=backend.name).set(0)
+
+    @property
+    def default_base_url(self) -> str:
+        return self.backends[0].base_url
+
+    def healthy_backends(self) -> List[LlmBackend]:
+        now = self._clock()
+        healthy = [backend for backend in self.backends if backend.ejected_until <= now]
+        for backend in healthy:
+            LLM_BACKEND_HEALTHY.labels(backend=backend.name).set(1)
+        return healthy
+
+    def pick(self, session_id: Optional[str] = None, exclude: Sequence[LlmBackend] = ()) -> LlmBackend:
+        candidates = [backend for backend in self.healthy_backends() if backend not in exclude]
+        if not candidates:
+            # 全部被剔除時仍要有人服務：挑最早恢復的一台
+            fallback = [backend for backend in self.backends if backend not in exclude] or self.backends
+            return min(fallback, key=lambda backend: backend.ejected_until)
+        if self.max_outstanding:
+            # 准入控制只限制總量，這裡避免親和或路由把名額集中到同一台
+            below_cap = [backend for backend in candidates if backend.outstanding < self.max_outstanding]
+            candidates = below_cap or candidates
+        if self.strategy == STRATEGY_EWMA:
+            best = min(candidates, key=lambda backend: (backend.ewma_sec * (backend.outstanding + 1), backend.outstanding))
+        else:
+            best = min(candidates, key=lambda backend: (backend.outstanding, backend.ewma_sec))
+        if self.session_affinity and session_id:
+            preferred = max(candidates, key=lambda backend: _affinity_score(session_id, backend))
+            if preferred.outstanding - best.outstanding <= self.affinity_max_skew:
+                return preferred
+        return best
+
+    def _acquire(self, backend: LlmBackend) -> float:
+        backend.outstanding += 1
+        LLM_BACKEND_OUTSTANDING.labels(backend=backend.name).set(backend.outstanding)
+        return self._clock()
+
+    def _release(self, backend: LlmBackend) -> None:
+        backend.outstanding = max(0, backend.outstanding - 1)
+        LLM_BACKEND_OUTSTANDING.labels(backend=backend.name).set(backend.outstanding)
+
+    def _record_latency(self, backend: LlmBackend, elapsed: float) -> None:
+        if backend.ewma_sec <= 0:
+            backend.ewma_sec = elapsed
+        else:
+            backend.ewma_sec = self.ewma_alpha * elapsed + (1 - self.ewma_alpha) * backend.ewma_sec
+        LLM_BACKEND_LATENCY_EWMA.labels(backend=backend.name).set(backend.ewma_sec)
+
+    def _record_success(self, backend: LlmBackend, status_code: int) -> None:
+        backend.consecutive_failures = 0
+        result = "client_error" if status_code >= 400 else "ok"
+        LLM_BACKEND_REQUESTS.labels(backend=backend.name, result=result).inc()
+
+    def _record_model_missing(self, backend: LlmBackend) -> None:
+        LLM_BACKEND_REQUESTS.labels(backend=backend.name, result="model_missing").inc()
+
+    def _record_failure(self, backend: LlmBackend) -> None:
+        LLM_BACKEND_REQUESTS.labels(backend=backend.name, result="error").inc()
+        backend.consecutive_failures += 1
+        if backend.consecutive_failures >= self.max_failures and self.eject_sec > 0:
+            backend.ejected_until = self._clock() + self.eject_sec
+            backend.consecutive_failures = 0
+            LLM_BACKEND_EJECTIONS.labels(backend=backend.name).inc()
+            LLM_BACKEND_HEALTHY.labels(backend=backend.name).set(0)
+            print(f"[llm_pool] ejecting {backend.name} for {self.eject_sec:g}s")
+
+    def _build_request(self, client: httpx.AsyncClient, backend: LlmBackend, body: Dict[str, Any], timeout: Any) -> httpx.Request:
+        if backend.model:
+            body = {**body, "model": backend.model}
+        payload = to_openai_request(body) if backend.protocol == PROTOCOL_OPENAI else body
+        kwargs: Dict[str, Any] = {"json": payload, "headers": backend.headers()}
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        return client.build_request("POST", backend.chat_url, **kwargs)
+
+    def _attempts(self) -> int:
+        return min(2, len(self.backends))
+
+    async def chat(
+        self,
+        body: Dict[str, Any],
+        *,
+        session_id: Optional[str] = None,
+        timeout: Any = None,
+    ) -> LlmResponse:
+        """非串流呼叫（body 為 Ollama /api/chat 格式）；回應一律轉成 Ollama 格式。"""
+        body = {**body, "stream": False}
+        tried: List[LlmBackend] = []
+        last_error: Optional[Exception] = None
+        last_response: Optional[LlmResponse] = None
+        for _ in range(self._attempts()):
+            backend = self.pick(session_id, exclude=tried)
+            tried.append(backend)
+            started = self._acquire(backend)
+            try:
+                async with upstream_client(UPSTREAM_OLLAMA, self._http_clients) as client:
+                    response = await client.send(self._build_request(client, backend, body, timeout))
+            except httpx.TransportError as exc:
+                last_error = exc
+                self._record_failure(backend)
+                continue
+            finally:
+                self._release(backend)
+            if is_backend_fault(response.status_code, response.text):
+                self._record_failure(backend)
+                last_response = LlmResponse(response.status_code, text=response.text, backend=backend.name)
+                continue
+            if is_model_missing(response.status_code, response.text):
+                self._record_model_missing(backend)
+                last_response = LlmResponse(response.status_code, text=response.text, backend=backend.name)
+                continue
+            self._record_latency(backend, self._clock() - started)
+            self._record_success(backend, response.status_code)
+            if response.status_code >= 400:
+                return LlmResponse(response.status_code, text=response.text, backend=backend.name)
+            data = response.json() if response.content else {}
+            if backend.protocol == PROTOCOL_OPENAI:
+                data = from_openai_response(data)
+            return LlmResponse(response.status_code, data, backend=backend.name)
+        if last_response is not None:
+            return last_response
+        assert last_error is not None
+        raise last_error
+
+    async def open_stream(
+        self,
+        body: Dict[str, Any],
+        *,
+        session_id: Optional[str] = None,
+        timeout: Any = None,
+    ) -> LlmStream:
+        """開始串流呼叫；收到標頭後即回傳，由呼叫端以 chunks() 讀取並在結束時 aclose()。"""
+        body = {**body, "stream": True}
+        tried: List[LlmBackend] = []
+        last_error: Optional[Exception] = None
+        last_stream: Optional[LlmStream] = None
+        for _ in range(self._attempts()):
+            backend = self.pick(session_id, exclude=tried)
+            tried.append(backend)
+            started = self._acquire(backend)
+            stack = AsyncExitStack()
+            try:
+                client = await stack.enter_async_context(upstream_client(UPSTREAM_OLLAMA, self._http_clients))
+                response = await client.send(self._build_request(client, backend, body, timeout), stream=True)
+            except httpx.TransportError as exc:
+                await stack.aclose()
+                self._release(backend)
+                self._record_failure(backend)
+                last_error = exc
+                continue
+            except BaseException:
+                await stack.aclose()
+                self._release(backend)
+                raise
+            if response.status_code >= 400:
+                await response.aread()
+                text = response.text
+                await response.aclose()
+                await stack.aclose()
+                self._release(backend)
+                if is_backend_fault(response.status_code, text):
+                    self._record_failure(backend)
+                    last_stream = LlmStream(response.status_code, backend=backend, text=text)
+                    continue
+                if is_model_missing(response.status_code, text):
+                    self._record_model_missing(backend)
+                    last_stream = LlmStream(response.status_code, backend=backend, text=text)
+                    continue
+                self._record_success(backend, response.status_code)
+                return LlmStream(response.status_code, backend=backend, text=text)
+            self._record_latency(backend, self._clock() - started)
+
+            def on_close(ok: bool, backend: LlmBackend = backend) -> None:
+                self._release(backend)
+                if ok:
+                    self._record_success(backend, 200)
+                else:
+                    self._record_failure(backend)
+
+            return LlmStream(
+                response.status_code,
+                backend=backend,
+                response=response,
+                on_close=on_close,
+                exit_stack=stack,
+            )
+        if last_stream is not None:
+            return last_stream
+        assert last_error is not None
+        raise last_error
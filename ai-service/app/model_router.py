@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional
+
+from prometheus_client import Counter, Histogram
+
+# 規劃工具呼叫、萃取偏好 JSON、產生影片大綱、回覆使用者
+ROLE_PLANNER = "planner"
+ROLE_EXTRACTOR = "extractor"
+ROLE_OUTLINER = "outliner"
+ROLE_RESPONDER = "responder"
+MODEL_ROLES = (ROLE_PLANNER, ROLE_EXTRACTOR, ROLE_OUTLINER, ROLE_RESPONDER)
+
+LLM_ROLE_SECONDS = Histogram(
+    "aiyo_llm_role_seconds",
+    "各角色呼叫 Ollama /api/chat 的耗時（串流回覆為整段回應時間）",
+    ["role", "model"],
+    buckets=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0),
+)
+LLM_ROLE_REQUESTS = Counter(
+    "aiyo_llm_role_requests_total",
+    "各角色呼叫 Ollama 的次數（result：ok / error）",
+    ["role", "model", "result"],
+)
+
+DEFAULT_ROLE_OPTIONS: Dict[str, Dict[str, Any]] = {
+    ROLE_PLANNER: {"temperature": 0.2, "num_predict": 800},
+    ROLE_EXTRACTOR: {"temperature": 0.1, "num_predict": 512},
+    ROLE_OUTLINER: {"temperature": 0.3, "num_predict": 1200},
+    ROLE_RESPONDER: {},
+}
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    role: str
+    model: str
+    options: Dict[str, Any] = field(default_factory=dict)
+
+
+class ModelRouter:
+    """角色 → (模型, options) 的對應。
+
+    未指定模型的角色沿用預設模型；responder 與未指定模型的 planner 會採用使用者在請求中選的模型，
+    extractor / outliner 為背景工作，不受請求模型影響。
+    """
+
+    def __init__(
+        self,
+        default_model: str,
+        role_models: Optional[Dict[str, str]] = None,
+        role_options: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> None:
+        self.default_model = default_model
+        self.role_models = {role: model for role, model in (role_models or {}).items() if model}
+        self.role_options = {role: dict(DEFAULT_ROLE_OPTIONS.get(role, {})) for role in MODEL_ROLES}
+        for role, options in (role_options or {}).items():
+            self.role_options.setdefault(role, {}).update(options)
+
+    def route(self, role: str, requested_model: Optional[str] = None) -> ModelRoute:
+        model = self.role_models.get(role)
+        if role == ROLE_RESPONDER:
+            model = requested_model or model
+        elif role == ROLE_PLANNER:
+            model = model or requested_model
+        return ModelRoute(
+            role=role,
+            model=model or self.default_model,
+            options=dict(self.role_options.get(role, {})),
+        )
+
+    def describe(self) -> Dict[str, Dict[str, Any]]:
+        return {role: {"model": self.route(role).model, "options": self.route(role).options} for role in MODEL_ROLES}
+
+
+def _role_options_from_env(role: str) -> Dict[str, Any]:
+    raw = (os.getenv(f"OLLAMA_{role.upper()}_OPTIONS") or "").strip()
+    if not raw:
+        return {}
+    try:
+        parsed = json.loads(raw)
+    except json.JSONDecodeError:
+        print(f"[model_router] ignoring invalid OLLAMA_{role.upper()}_OPTIONS: {raw[:80]}")
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+
+def model_router_from_env(default_model: str, responder_options: Optional[Dict[str, Any]] = None) -> ModelRouter:
+    """OLLAMA_<ROLE>_MODEL 指定模型、OLLAMA_<ROLE>_OPTIONS（JSON）覆寫 options。"""
+    role_options: Dict[str, Dict[str, Any]] = {ROLE_RESPONDER: dict(responder_options or {})}
+    for role in MODEL_ROLES:
+        role_options.setdefault(role, {}).update(_role_options_from_env(role))
+    return ModelRouter(
+        default_model,
+        role_models={role: (os.getenv(f"OLLAMA_{role.upper()}_MODEL") or "").strip() for role in MODEL_ROLES},
+        role_options=role_options,
+    )
+
+
+class LlmCall:
+    def __init__(self) -> None:
+        self.ok = True
+
+    def failed(self) -> None:
+        self.ok = False
+
+
+@contextmanager
+def track_llm_call(role: str, model: str) -> Iterator[LlmCall]:
+    """記錄單次 LLM 呼叫的耗時與結果；拋出例外或呼叫 failed() 視為 error。"""
+    call = LlmCall()
+    started = time.monotonic()
+    try:
+        yield call
+    except BaseException:
+        call.failed()
+        raise
+    finally:
+        LLM_ROLE_SECONDS.labels(role=role, model=model).observe(time.monotonic() - started)
+        LLM_ROLE_REQUESTS.labels(role=role, model=model, result="ok" if call.ok else "error").inc()
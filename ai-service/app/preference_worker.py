@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, List, Optional, Set
+
+from prometheus_client import Counter, Gauge, Histogram
+
+PREFERENCE_QUEUE_DEPTH = Gauge(
+    "aiyo_preference_queue_depth",
+    "等待背景偏好萃取的使用者數",
+)
+PREFERENCE_INFLIGHT = Gauge(
+    "aiyo_preference_jobs_inflight",
+    "正在執行的偏好萃取工作數",
+)
+PREFERENCE_JOBS = Counter(
+    "aiyo_preference_jobs_total",
+    "偏好萃取工作（ok / error；deduped：被同一使用者較新的對話取代；dropped：佇列滿丟棄最舊）",
+    ["result"],
+)
+PREFERENCE_JOB_SECONDS = Histogram(
+    "aiyo_preference_job_seconds",
+    "單次偏好萃取（LLM + embedding + upsert）耗時",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0),
+)
+
+# (user_id, 對話歷史) -> 萃取並寫入偏好
+PreferenceJob = Callable[[int, List[Any]], Awaitable[None]]
+
+
+class PreferenceExtractionQueue:
+    """把偏好萃取移出聊天請求路徑的背景佇列。
+
+    每個使用者最多保留一筆待處理工作，新的對話歷史直接取代舊的（只處理最新狀態）；
+    同一使用者不會同時有兩個工作在執行，整體並行數上限為 concurrency。
+    待處理使用者超過 max_pending 時丟棄最舊的一筆。
+    """
+
+    def __init__(
+        self,
+        process: PreferenceJob,
+        *,
+        concurrency: int = 2,
+        max_pending: int = 1000,
+    ) -> None:
+        self._process = process
+        self.concurrency = max(1, concurrency)
+        self.max_pending = max(1, max_pending)
+        self._pending: "OrderedDict[int, List[Any]]" = OrderedDict()
+        self._active: Set[int] = set()
+        self._workers: List["asyncio.Task[None]"] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def submit(self, user_id: int, history: List[Any]) -> None:
+        """排入工作後立即返回；首次呼叫時啟動背景 worker。"""
+        if not self._workers:
+            self.start()
+        if user_id in self._pending:
+            PREFERENCE_JOBS.labels(result="deduped").inc()
+            del self._pending[user_id]
+        elif len(self._pending) >= self.max_pending:
+            self._pending.popitem(last=False)
+            PREFERENCE_JOBS.labels(result="dropped").inc()
+        self._pending[user_id] = list(history)
+        PREFERENCE_QUEUE_DEPTH.set(len(self._pending))
+        assert self._wakeup is not None
+        self._wakeup.set()
+
+    def start(self) -> None:
+        if self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._workers = [
+            loop.create_task(self._worker(), name=f"preference-worker:{index}")
+            for index in range(self.concurrency)
+        ]
+
+    async def stop(self) -> None:
+        """關閉服務時呼叫：取消執行中的工作並捨棄尚未處理的佇列（偏好會在之後的對話再次萃取）。"""
+        workers, self._workers = self._workers, []
+        for task in workers:
+            task.cancel()
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+        self._pending.clear()
+        self._active.clear()
+        PREFERENCE_QUEUE_DEPTH.set(0)
+        PREFERENCE_INFLIGHT.set(0)
+
+    def _next_ready(self) -> Optional[int]:
+        for user_id in self._pending:
+            if user_id not in self._active:
+                return user_id
+        return None
+
+    async def _worker(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            user_id = self._next_ready()
+            if user_id is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            history = self._pending.pop(user_id)
+            PREFERENCE_QUEUE_DEPTH.set(len(self._pending))
+            self._active.add(user_id)
+            PREFERENCE_INFLIGHT.set(len(self._active))
+            started = time.monotonic()
+            try:
+                await self._process(user_id, history)
+                PREFERENCE_JOBS.labels(result="ok").inc()
+            except Exception as exc:
+                PREFERENCE_JOBS.labels(result="error").inc()
+                print(f"[preference_worker] user {user_id} failed: {type(exc).__name__}: {exc}")
+            finally:
+                PREFERENCE_JOB_SECONDS.observe(time.monotonic() - started)
+                self._active.discard(user_id)
+                PREFERENCE_INFLIGHT.set(len(self._active))
+                # 同一使用者可能在執行期間又排入新工作
+                self._wakeup.set()
+
+    async def join(self) -> None:
+        """等待佇列清空且沒有執行中的工作（測試用）。"""
+        while self._pending or self._active:
+            await asyncio.sleep(0.01)
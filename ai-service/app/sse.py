@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Union
+
+from prometheus_client import Counter
+
+from app.fast_json import dumps
+
+SSE_TOKEN_FRAMES = Counter(
+    "aiyo_sse_token_frames_total",
+    "串流回覆送出的 token frame 數（合併後）",
+)
+SSE_TOKENS = Counter(
+    "aiyo_sse_tokens_total",
+    "串流回覆收到的上游 token 數（合併前）",
+)
+
+_DONE = object()
+
+
+def sse_event(payload: Dict[str, Any]) -> bytes:
+    return b"data: " + dumps(payload) + b"\n\n"
+
+
+@dataclass
+class TokenBatch:
+    """合併後的一段文字；count 為合併前的上游 token 數。"""
+
+    text: str
+    count: int
+
+
+def _chunk_token(chunk: Dict[str, Any]) -> str:
+    if chunk.get("error"):
+        return ""
+    return (chunk.get("message") or {}).get("content") or ""
+
+
+async def coalesce_tokens(
+    chunks: AsyncIterator[Dict[str, Any]],
+    *,
+    flush_ms: float = 40.0,
+    max_chars: int = 48,
+) -> AsyncIterator[Union[TokenBatch, Dict[str, Any]]]:
+    """把上游逐 token 的 chunk 合併成 TokenBatch，每 flush_ms 毫秒或累積 max_chars 字送出一次。
+
+    非 token 的 chunk（error、done 或帶統計的結尾）原樣產生，之前已累積的文字會先送出；
+    done chunk 的 content 若不為空，會先併入文字再產生 done。
+    flush_ms <= 0 為低延遲模式：每個 token 立即送出。
+    時間到即送出（即使上游暫時沒有新 token），以背景 task 讀取上游、主迴圈以佇列等待。
+    """
+    if flush_ms <= 0:
+        async for chunk in chunks:
+            token = _chunk_token(chunk)
+            if token:
+                SSE_TOKENS.inc()
+                SSE_TOKEN_FRAMES.inc()
+                yield TokenBatch(token, 1)
+            if chunk.get("error") or chunk.get("done"):
+                yield chunk
+        return
+
+    queue: "asyncio.Queue[Any]" = asyncio.Queue()
+
+    async def pump() -> None:
+        try:
+            async for chunk in chunks:
+                await queue.put(chunk)
+        except Exception as exc:
+            await queue.put(exc)
+        finally:
+            await queue.put(_DONE)
+
+    reader = asyncio.create_task(pump())
+    window_sec = flush_ms / 1000.0
+    parts: list = []
+    size = 0
+    started = 0.0
+    try:
+        while True:
+            timeout = None if not parts else max(0.0, started + window_sec - time.monotonic())
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if isinstance(item, BaseException):
+                # 已累積的文字先送出，呼叫端才能記錄、保留中斷前的回覆
+                if parts:
+                    SSE_TOKEN_FRAMES.inc()
+                    yield TokenBatch("".join(parts), len(parts))
+                raise item
+            if item is not None and item is not _DONE:
+                token = _chunk_token(item)
+                if token:
+                    SSE_TOKENS.inc()
+                    if not parts:
+                        started = time.monotonic()
+                    parts.append(token)
+                    size += len(token)
+            boundary = item is _DONE or (isinstance(item, dict) and (item.get("error") or item.get("done")))
+            if parts and (
+                boundary
+                or item is None
+                or size >= max_chars
+                or time.monotonic() - started >= window_sec
+            ):
+                SSE_TOKEN_FRAMES.inc()
+                yield TokenBatch("".join(parts), len(parts))
+                parts = []
+                size = 0
+            if item is _DONE:
+                return
+            if boundary:
+                yield item
+    finally:
+        if not reader.done():
+            reader.cancel()
+            try:
+                await reader
+            except asyncio.CancelledError:
+                task = asyncio.current_task()
+                if task is not None and task.cancelling():
+                    raise
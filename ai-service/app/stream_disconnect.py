@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Optional
+
+from prometheus_client import Counter
+
+CHAT_STREAM_DISCONNECTS = Counter(
+    "aiyo_chat_stream_disconnects_total",
+    "串流回覆途中用戶端中斷連線的次數（phase：context 工具規劃中、generating 產生回覆中）",
+    ["phase"],
+)
+
+
+class DisconnectWatcher:
+    """在串流產生器旁輪詢 request.is_disconnected()，連線中斷時取消產生器所在的 task。
+
+    Starlette 只有在下一次寫入失敗時才會發現斷線，而等待工具規劃或第一個 token 時不會寫入；
+    主動取消可讓產生器立刻關閉上游串流（Ollama 會隨連線關閉停止產生），不再把 num_predict 跑完。
+    """
+
+    def __init__(self, request: Any, poll_sec: float = 0.5) -> None:
+        self.request = request
+        self.poll_sec = max(0.05, poll_sec)
+        self.disconnected = False
+        self._target: Optional["asyncio.Task[Any]"] = None
+        self._watch: Optional["asyncio.Task[None]"] = None
+
+    def start(self) -> None:
+        self._target = asyncio.current_task()
+        self._watch = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                await asyncio.sleep(self.poll_sec)
+                if await self.request.is_disconnected():
+                    self.disconnected = True
+                    if self._target is not None and not self._target.done():
+                        self._target.cancel()
+                    return
+        except Exception as exc:
+            print(f"[chat] disconnect watcher stopped: {type(exc).__name__}: {exc}")
+
+    def consume_cancel(self) -> bool:
+        """目前的 CancelledError 是否由斷線觸發；是的話撤銷這次取消，讓產生器正常收尾。"""
+        if not self.disconnected or self._target is None:
+            return False
+        if self._target.cancelling():
+            self._target.uncancel()
+        return True
+
+    def stop(self) -> None:
+        if self._watch is not None and not self._watch.done():
+            self._watch.cancel()
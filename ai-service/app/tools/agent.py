@@ -2,19 +2,55 @@ from __future__ import annotations
 
 import asyncio
 import json
+import random
+import time
 from typing import Any, Awaitable, Callable, Dict, List, Optional
 
 import httpx
+from prometheus_client import Counter
 
+from ..llm_pool import LlmPool
+from ..model_router import DEFAULT_ROLE_OPTIONS, ROLE_PLANNER, track_llm_call
 from .common import ToolResult, make_tool_result, parse_tool_arguments
+from .resilience import (
+    TOOL_HEDGE_ENABLED,
+    TOOL_HEDGE_MIN_DELAY_SEC,
+    TOOL_HEDGE_MIN_SAMPLES,
+    TOOL_UPSTREAMS,
+    CircuitOpenError,
+    UpstreamCallGate,
+    degraded_tool_result,
+    get_circuit_breaker,
+    hedged_call,
+    is_retryable_error,
+    is_retryable_exception,
+    upstream_call_gate,
+)
+from .router import ROUTE_DIRECT, ROUTE_LLM, ROUTE_SKIP, ToolRoute, route_tools
 from .transport import search_transport_options
 from .travel_info import search_travel_information
 from .weather import get_current_time, get_weather, infer_weather_region, is_weather_query
 from .youtube import search_youtube_videos
 
+TOOL_ROUTES = Counter(
+    "aiyo_tool_route_total",
+    "工具前置分流結果（skip：不需工具、direct：規則直接執行、llm：交給 LLM 規劃）",
+    ["path"],
+)
+
 ToolHandler = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[ToolResult]]
 
 
+def _retry_backoff(attempt: int) -> float:
+    # 指數退避加抖動，避免同時失敗的請求一起重打上游
+    return min(2.0, 0.25 * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+def _upstream_elapsed(started: float, gate: UpstreamCallGate) -> float:
+    # 扣掉工具內其他上游（地理編碼）的時間，只留這個上游自己的延遲
+    return max(0.0, time.monotonic() - started - gate.nested_sec)
+
+
 async def _execute_with_retry(
     handler: ToolHandler,
     args: Dict[str, Any],
@@ -22,28 +58,143 @@ async def _execute_with_retry(
     tool_name: str,
     max_retries: int = 2,
 ) -> ToolResult:
+    upstream = TOOL_UPSTREAMS.get(tool_name, "")
+    breaker = get_circuit_breaker(upstream)
     last_error: Optional[Exception] = None
     for attempt in range(1 + max_retries):
-        try:
-            result = await handler(args, context)
-            if result.get("ok") or attempt >= max_retries:
-                return result
-            error_text = result.get("error") or ""
-            retryable = any(kw in error_text for kw in ("timeout", "5", "429", "connection"))
-            if not retryable:
-                return result
-        except Exception as exc:
-            last_error = exc
-            if attempt >= max_retries:
-                break
-        await asyncio.sleep(0.5 * (attempt + 1))
+        hedge_delay = (
+            breaker.hedge_delay(TOOL_HEDGE_MIN_SAMPLES, TOOL_HEDGE_MIN_DELAY_SEC)
+            if breaker is not None and TOOL_HEDGE_ENABLED
+            else None
+        )
+        started = time.monotonic()
+        # 斷路器只看真的打到上游的呼叫：結果快取命中（gate.calls == 0）不記錄成功、失敗或延遲
+        with upstream_call_gate(breaker) as gate:
+            try:
+                result = await hedged_call(
+                    lambda: handler(args, context),
+                    hedge_delay,
+                    lambda item: bool(item.get("ok")),
+                    upstream,
+                )
+            except CircuitOpenError as exc:
+                return degraded_tool_result(tool_name, exc.breaker)
+            except asyncio.CancelledError:
+                # 被工具 timeout 取消也算一次上游失敗
+                if breaker is not None and gate.calls:
+                    breaker.record_failure(_upstream_elapsed(started, gate))
+                raise
+            except Exception as exc:
+                last_error = exc
+                if breaker is not None and gate.calls:
+                    breaker.record_failure(_upstream_elapsed(started, gate))
+                if attempt >= max_retries or not is_retryable_exception(exc):
+                    break
+            else:
+                upstream_failed = not result.get("ok") and is_retryable_error(result.get("error"))
+                if breaker is not None and gate.calls:
+                    if upstream_failed:
+                        breaker.record_failure(_upstream_elapsed(started, gate))
+                    else:
+                        breaker.record_success(_upstream_elapsed(started, gate))
+                if not upstream_failed or attempt >= max_retries:
+                    return result
+        await asyncio.sleep(_retry_backoff(attempt))
     return make_tool_result(
         ok=False,
         source=tool_name,
-        error=f"failed after {max_retries + 1} attempts: {type(last_error).__name__}: {last_error}" if last_error else "failed after retries",
+        error=f"failed after {attempt + 1} attempts: {type(last_error).__name__}: {last_error}" if last_error else "failed after retries",
     )
 
 
+# 各工具單次呼叫（含重試）的時間上限；未列出的工具使用 resolve_tool_context 的 tool_timeout_sec
+DEFAULT_TOOL_TIMEOUTS: Dict[str, float] = {
+    "get_current_time": 2.0,
+}
+# 同一次解析中只需執行一次、後續呼叫共用結果的工具
+SHARED_RESULT_TOOLS = frozenset({"get_weather"})
+
+
+def _tool_timeout(name: str, tool_timeout_sec: float) -> float:
+    return min(tool_timeout_sec, DEFAULT_TOOL_TIMEOUTS.get(name, tool_timeout_sec))
+
+
+async def _execute_tool_call(
+    handler: Optional[ToolHandler],
+    name: str,
+    args: Dict[str, Any],
+    context: Dict[str, Any],
+    timeout_sec: float,
+) -> ToolResult:
+    if handler is None:
+        return make_tool_result(ok=False, source="tool-executor", error=f"unsupported tool: {name}")
+    try:
+        return await asyncio.wait_for(
+            _execute_with_retry(handler, args, context, name, max_retries=2),
+            timeout=timeout_sec,
+        )
+    except asyncio.TimeoutError:
+        return make_tool_result(ok=False, source=name, error=f"timeout after {timeout_sec:g}s")
+
+
+async def execute_tool_calls(
+    calls: List[Dict[str, Any]],
+    tool_executor: Dict[str, ToolHandler],
+    context: Dict[str, Any],
+    *,
+    tool_timeout_sec: float = 10.0,
+    shared_results: Optional[Dict[str, ToolResult]] = None,
+) -> List[ToolResult]:
+    """並行執行同一輪的工具呼叫，結果依 calls 原順序回傳。
+
+    SHARED_RESULT_TOOLS 內的工具在 shared_results 已有結果時直接沿用，
+    同一輪出現多次時也只執行第一次；每個呼叫各自受 timeout 限制，不會拖住其他工具。
+    """
+    shared: Dict[str, "asyncio.Future[ToolResult]"] = {}
+    pending: List["asyncio.Future[ToolResult]"] = []
+    for call in calls:
+        name = call["name"]
+        if name in SHARED_RESULT_TOOLS:
+            if shared_results and name in shared_results:
+                done: "asyncio.Future[ToolResult]" = asyncio.get_running_loop().create_future()
+                done.set_result(shared_results[name])
+                pending.append(done)
+                continue
+            if name in shared:
+                pending.append(shared[name])
+                continue
+        task = asyncio.ensure_future(
+            _execute_tool_call(
+                tool_executor.get(name),
+                name,
+                dict(call["arguments"]),
+                context,
+                _tool_timeout(name, tool_timeout_sec),
+            )
+        )
+        if name in SHARED_RESULT_TOOLS:
+            shared[name] = task
+        pending.append(task)
+    unique = list({id(item): item for item in pending}.values())
+    try:
+        await asyncio.gather(*unique)
+    except asyncio.CancelledError:
+        for item in unique:
+            item.cancel()
+        raise
+    return [item.result() for item in pending]
+
+
+def _tool_summary(name: str, args: Dict[str, Any], result: ToolResult) -> Dict[str, Any]:
+    return {
+        "tool": name,
+        "ok": bool(result.get("ok")),
+        "source": result.get("source"),
+        "error": result.get("error"),
+        "arguments": args,
+    }
+
+
 def _extract_weather_location(args: Dict[str, Any]) -> str:
     for key in ("location", "city", "region", "place", "area"):
         value = args.get(key)
@@ -177,12 +328,14 @@ async def _tool_get_weather(args: Dict[str, Any], context: Dict[str, Any]) -> To
         user_ai_settings=context.get("user_ai_settings", {}),
         default_region=context.get("default_region"),
         user_agent=context["http_user_agent"],
+        http_clients=context.get("http_clients"),
     )
     return await get_weather(
         region=region_data["region"],
         user_agent=context["http_user_agent"],
         query=query,
         location_source=region_data["location_source"],
+        http_clients=context.get("http_clients"),
     )
 
 
@@ -190,14 +343,25 @@ async def _tool_search_youtube(args: Dict[str, Any], context: Dict[str, Any]) ->
     query = str(args.get("query") or context.get("last_user_message") or "")
     location = str(args.get("location") or context.get("default_region") or "")
     max_results = int(args.get("max_results") or 5)
-    return await search_youtube_videos(query, location, max_results, context.get("youtube_api_key", ""))
+    return await search_youtube_videos(
+        query,
+        location,
+        max_results,
+        context.get("youtube_api_key", ""),
+        http_clients=context.get("http_clients"),
+    )
 
 
 async def _tool_search_travel_info(args: Dict[str, Any], context: Dict[str, Any]) -> ToolResult:
     query = str(args.get("query") or context.get("last_user_message") or "")
     region = str(args.get("region") or context.get("default_region") or "")
     limit = int(args.get("max_results") or 5)
-    return await search_travel_information(query=query, region=region, limit=limit)
+    return await search_travel_information(
+        query=query,
+        region=region,
+        limit=limit,
+        http_clients=context.get("http_clients"),
+    )
 
 
 async def _tool_search_transport(args: Dict[str, Any], _context: Dict[str, Any]) -> ToolResult:
@@ -221,8 +385,50 @@ def should_force_weather_tool(last_user_message: str) -> bool:
     return is_weather_query(last_user_message)
 
 
+def _tool_results_message(tool_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "role": "system",
+        "content": (
+            "以下是工具查詢結果（JSON）。請整合後回覆使用者，並標註可能會隨時間變動的資訊：\n"
+            + json.dumps(tool_results, ensure_ascii=False)
+        ),
+    }
+
+
+def pre_route_tools(context: Dict[str, Any], tool_flags: Dict[str, bool]) -> ToolRoute:
+    tool_policy = context.get("tool_policy_json") if isinstance(context, dict) else {}
+    # 使用者自訂的觸發規則是自然語言，只能交給 LLM 判斷
+    if isinstance(tool_policy, dict) and str(tool_policy.get("tool_trigger_rules") or "").strip():
+        return ToolRoute(path=ROUTE_LLM, reason="custom-tool-rules")
+    return route_tools(str(context.get("last_user_message") or ""), tool_flags)
+
+
+async def _run_routed_tools(
+    route: ToolRoute,
+    base_messages: List[Dict[str, Any]],
+    context: Dict[str, Any],
+    tool_timeout_sec: float,
+) -> Dict[str, Any]:
+    calls = [dict(call) for call in route.calls]
+    results = await execute_tool_calls(calls, build_tool_executor(), context, tool_timeout_sec=tool_timeout_sec)
+    tool_calls_summary: List[Dict[str, Any]] = [route.summary()]
+    tool_results: List[Dict[str, Any]] = []
+    for tool_call, result in zip(calls, results):
+        name = tool_call["name"]
+        args = dict(tool_call["arguments"])
+        tool_calls_summary.append(_tool_summary(name, args, result))
+        tool_results.append({"tool": name, "arguments": args, "result": result})
+    return {
+        "messages": [*base_messages, _tool_results_message(tool_results)],
+        "used_tools": True,
+        "direct_reply": "",
+        "tool_calls_summary": tool_calls_summary,
+        "youtube_tool_videos": [],
+    }
+
+
 async def resolve_tool_context(
-    client: httpx.AsyncClient,
+    client: Optional[httpx.AsyncClient],
     ollama_base_url: str,
     model: str,
     base_messages: List[Dict[str, Any]],
@@ -230,7 +436,21 @@ async def resolve_tool_context(
     tool_flags: Dict[str, bool],
     max_rounds: int = 3,
     max_calls_per_round: int = 4,
+    pre_route: bool = True,
+    tool_timeout_sec: float = 10.0,
+    planner_options: Optional[Dict[str, Any]] = None,
+    llm_pool: Optional[LlmPool] = None,
+    session_id: Optional[str] = None,
 ) -> Dict[str, Any]:
+    """決定並執行工具呼叫。
+
+    pre_route 開啟時先以規則分流：不需要工具的訊息直接跳過規劃回合（skip），
+    工具與參數可由規則決定時直接執行（direct），其餘才進入 LLM 規劃（llm）；
+    採用的路徑會以 kind="route" 記錄在 tool_calls_summary 第一筆。
+    同一輪的多個工具呼叫並行執行，各自受 tool_timeout_sec（及 DEFAULT_TOOL_TIMEOUTS）限制。
+    model / planner_options 為 planner 角色的模型與 options（見 app/model_router.py）。
+    傳入 llm_pool 時規劃回合經由 LLM 後端池送出（見 app/llm_pool.py），client 可為 None；否則以 client 直接呼叫 ollama_base_url。
+    """
     tool_policy = context.get("tool_policy_json") if isinstance(context, dict) else {}
     if isinstance(tool_policy, dict) and tool_policy.get("enabled") is False:
         return {
@@ -241,28 +461,48 @@ async def resolve_tool_context(
             "youtube_tool_videos": [],
         }
 
+    route: Optional[ToolRoute] = pre_route_tools(context, tool_flags) if pre_route else None
+    if route is not None:
+        TOOL_ROUTES.labels(path=route.path).inc()
+    if route is not None and route.path == ROUTE_SKIP:
+        return {
+            "messages": base_messages,
+            "used_tools": False,
+            "direct_reply": "",
+            "tool_calls_summary": [route.summary()],
+            "youtube_tool_videos": [],
+        }
+    if route is not None and route.path == ROUTE_DIRECT:
+        return await _run_routed_tools(route, base_messages, context, tool_timeout_sec)
+
     tools = get_tool_schemas(tool_flags)
     tool_executor = build_tool_executor()
     working_messages = list(base_messages)
     used_tools = False
     direct_reply = ""
-    tool_calls_summary: List[Dict[str, Any]] = []
+    tool_calls_summary: List[Dict[str, Any]] = [route.summary()] if route is not None else []
     forced_weather_once = False
     weather_result_cache: Optional[Dict[str, Any]] = None
     weather_summary_added = False
     youtube_tool_videos: List[Dict[str, Any]] = []
 
+    options = dict(DEFAULT_ROLE_OPTIONS[ROLE_PLANNER] if planner_options is None else planner_options)
     for _ in range(max(1, max_rounds)):
-        planner_response = await client.post(
-            f"{ollama_base_url}/api/chat",
-            json={
+        with track_llm_call(ROLE_PLANNER, model) as llm_call:
+            planner_body = {
                 "model": model,
                 "stream": False,
                 "messages": working_messages,
                 "tools": tools,
-                "options": {"temperature": 0.2, "num_predict": 800},
-            },
-        )
+                "options": options,
+            }
+            if llm_pool is not None:
+                planner_response = await llm_pool.chat(planner_body, session_id=session_id)
+            else:
+                assert client is not None, "resolve_tool_context needs client or llm_pool"
+                planner_response = await client.post(f"{ollama_base_url}/api/chat", json=planner_body)
+            if planner_response.status_code >= 400:
+                llm_call.failed()
         if planner_response.status_code >= 400:
             return {
                 "messages": base_messages,
@@ -304,16 +544,7 @@ async def resolve_tool_context(
                     }
                     tool_calls_summary.append(forced_summary)
                     working_messages.append(
-                        {
-                            "role": "system",
-                            "content": (
-                                "以下是工具查詢結果（JSON）。請整合後回覆使用者，並標註可能會隨時間變動的資訊：\n"
-                                + json.dumps(
-                                    [{"tool": "get_weather", "arguments": {}, "result": forced_result}],
-                                    ensure_ascii=False,
-                                )
-                            ),
-                        }
+                        _tool_results_message([{"tool": "get_weather", "arguments": {}, "result": forced_result}])
                     )
                     continue
             direct_reply = (assistant_message.get("content") or "").strip()
@@ -326,65 +557,43 @@ async def resolve_tool_context(
             }
 
         used_tools = True
+        round_calls = tool_calls[: max(1, max_calls_per_round)]
+        shared_results = {"get_weather": weather_result_cache} if weather_result_cache is not None else {}
+        results = await execute_tool_calls(
+            round_calls,
+            tool_executor,
+            context,
+            tool_timeout_sec=tool_timeout_sec,
+            shared_results=shared_results,
+        )
         tool_results: List[Dict[str, Any]] = []
-        for tool_call in tool_calls[: max(1, max_calls_per_round)]:
+        for tool_call, result in zip(round_calls, results):
             name = tool_call["name"]
             args = dict(tool_call["arguments"])
-            if name == "get_weather" and weather_result_cache is not None:
-                result = weather_result_cache
-                if not weather_summary_added:
-                    weather_summary_added = True
-                    tool_calls_summary.append(
-                        {
-                            "tool": name,
-                            "ok": bool(result.get("ok")),
-                            "source": result.get("source"),
-                            "error": result.get("error"),
-                            "arguments": args,
-                        }
-                    )
-            else:
-                handler = tool_executor.get(name)
-                if handler is None:
-                    result = make_tool_result(ok=False, source="tool-executor", error=f"unsupported tool: {name}")
-                else:
-                    result = await _execute_with_retry(handler, args, context, name, max_retries=2)
-                if name == "get_weather":
-                    weather_result_cache = result
-                    weather_summary_added = True
-                if name == "search_youtube_videos" and result.get("ok"):
-                    data = result.get("data") or {}
-                    for v in (data.get("videos") or [])[:10]:
-                        if isinstance(v, dict) and v.get("video_id"):
-                            youtube_tool_videos.append({
-                                "video_id": 0,
-                                "youtube_id": str(v.get("video_id", "")),
-                                "title": str(v.get("title", "")),
-                                "channel": str(v.get("channel", "")),
-                                "segments": [],
-                                "thumbnail_url": f"https://i.ytimg.com/vi/{v.get('video_id', '')}/mqdefault.jpg",
-                                "summary": str(v.get("description", "")),
-                            })
-                tool_calls_summary.append(
-                    {
-                        "tool": name,
-                        "ok": bool(result.get("ok")),
-                        "source": result.get("source"),
-                        "error": result.get("error"),
-                        "arguments": args,
-                    }
-                )
+            if name == "get_weather":
+                # 同一輪或前幾輪的天氣只查一次，摘要也只記一筆
+                weather_result_cache = result
+                if weather_summary_added:
+                    tool_results.append({"tool": name, "arguments": args, "result": result})
+                    continue
+                weather_summary_added = True
+            if name == "search_youtube_videos" and result.get("ok"):
+                data = result.get("data") or {}
+                for v in (data.get("videos") or [])[:10]:
+                    if isinstance(v, dict) and v.get("video_id"):
+                        youtube_tool_videos.append({
+                            "video_id": 0,
+                            "youtube_id": str(v.get("video_id", "")),
+                            "title": str(v.get("title", "")),
+                            "channel": str(v.get("channel", "")),
+                            "segments": [],
+                            "thumbnail_url": f"https://i.ytimg.com/vi/{v.get('video_id', '')}/mqdefault.jpg",
+                            "summary": str(v.get("description", "")),
+                        })
+            tool_calls_summary.append(_tool_summary(name, args, result))
             tool_results.append({"tool": name, "arguments": args, "result": result})
 
-        working_messages.append(
-            {
-                "role": "system",
-                "content": (
-                    "以下是工具查詢結果（JSON）。請整合後回覆使用者，並標註可能會隨時間變動的資訊：\n"
-                    + json.dumps(tool_results, ensure_ascii=False)
-                ),
-            }
-        )
+        working_messages.append(_tool_results_message(tool_results))
 
     return {
         "messages": working_messages,
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Protocol, Tuple
+
+from prometheus_client import Counter, Gauge
+
+from .. import db
+from ..config import env_bool, env_float, env_int
+from .resilience import before_upstream_call, is_hedge_attempt
+
+
+TOOL_CACHE_REQUESTS = Counter(
+    "aiyo_tool_cache_requests_total",
+    "外部工具結果快取（hit：記憶體命中、persistent_hit：Postgres 命中、coalesced：併入進行中的呼叫、miss：呼叫外部 API）",
+    ["tool", "result"],
+)
+TOOL_CACHE_ENTRIES = Gauge("aiyo_tool_cache_entries", "外部工具結果快取（記憶體層）目前筆數")
+
+CACHE_GEOCODE = "geocode"
+CACHE_REVERSE_GEOCODE = "reverse_geocode"
+CACHE_WEATHER = "weather"
+CACHE_YOUTUBE_SEARCH = "youtube_search"
+CACHE_TRAVEL_SEARCH = "travel_search"
+
+# 地名座標幾乎不變、天氣十分鐘內差異不大、YouTube 搜尋以小時計（同時節省配額）
+DEFAULT_TOOL_CACHE_TTLS: Dict[str, float] = {
+    CACHE_GEOCODE: max(0.0, env_float("TOOL_CACHE_GEOCODE_TTL_SEC", 7 * 86400.0)),
+    CACHE_REVERSE_GEOCODE: max(0.0, env_float("TOOL_CACHE_GEOCODE_TTL_SEC", 7 * 86400.0)),
+    CACHE_WEATHER: max(0.0, env_float("TOOL_CACHE_WEATHER_TTL_SEC", 600.0)),
+    CACHE_YOUTUBE_SEARCH: max(0.0, env_float("TOOL_CACHE_YOUTUBE_TTL_SEC", 6 * 3600.0)),
+    CACHE_TRAVEL_SEARCH: max(0.0, env_float("TOOL_CACHE_SEARCH_TTL_SEC", 3600.0)),
+}
+TOOL_CACHE_ENABLED = env_bool("TOOL_CACHE_ENABLED", True)
+TOOL_CACHE_MAX_ENTRIES = max(1, env_int("TOOL_CACHE_MAX_ENTRIES", 5000))
+# 需先套用 scripts/migrations/017_tool_result_cache.sql
+TOOL_CACHE_PERSISTENT = env_bool("TOOL_CACHE_PERSISTENT", False)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_cache_value(value: Any) -> Any:
+    """字串做 NFKC、壓縮空白並轉小寫，讓「台南  美食」「台南 美食」「TAINAN」共用同一筆快取。"""
+    if isinstance(value, str):
+        return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", value)).strip().lower()
+    if isinstance(value, dict):
+        return {str(key): normalize_cache_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize_cache_value(item) for item in value]
+    return value
+
+
+def tool_cache_key(tool: str, args: Dict[str, Any]) -> str:
+    payload = json.dumps(normalize_cache_value(args), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return f"{tool}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def _default_cacheable(value: Any) -> bool:
+    """None、ToolResult 失敗（ok=False）與帶 error 的結果不快取，下次呼叫會重試。"""
+    if value is None:
+        return False
+    if isinstance(value, dict):
+        if value.get("ok") is False or value.get("error"):
+            return False
+    return True
+
+
+class PersistentToolCache(Protocol):
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """回傳 (值, 剩餘秒數)；沒有或已過期回傳 None。"""
+
+    async def set(self, key: str, tool: str, value: Any, ttl_sec: float) -> None:
+        ...
+
+
+class PostgresToolCacheStore:
+    """tool_result_cache 表：重啟後保留、多個 worker 共用。讀寫失敗只記錄，不影響工具呼叫。"""
+
+    GET_SQL = """
+        SELECT payload, EXTRACT(EPOCH FROM (expires_at - NOW()))::float AS ttl_left
+        FROM tool_result_cache
+        WHERE cache_key = %(cache_key)s AND expires_at > NOW()
+    """
+    SET_SQL = """
+        INSERT INTO tool_result_cache (cache_key, tool, payload, expires_at, updated_at)
+        VALUES (%(cache_key)s, %(tool)s, %(payload)s::jsonb, NOW() + make_interval(secs => %(ttl_sec)s), NOW())
+        ON CONFLICT (cache_key) DO UPDATE
+        SET payload = EXCLUDED.payload, expires_at = EXCLUDED.expires_at, updated_at = NOW()
+    """
+    PRUNE_SQL = "DELETE FROM tool_result_cache WHERE expires_at < NOW()"
+
+    def __init__(self, prune_every: int = 500) -> None:
+        self.prune_every = max(1, prune_every)
+        self._writes = 0
+
+    async def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        try:
+            row = await db.afetch_one(self.GET_SQL, {"cache_key": key})
+        except Exception as exc:
+            print(f"[tool_cache] persistent get failed: {type(exc).__name__}: {exc}")
+            return None
+        if not row:
+            return None
+        return row["payload"], float(row["ttl_left"] or 0.0)
+
+    async def set(self, key: str, tool: str, value: Any, ttl_sec: float) -> None:
+        try:
+            await db.aexecute(
+                self.SET_SQL,
+                {
+                    "cache_key": key,
+                    "tool": tool,
+                    "payload": json.dumps(value, ensure_ascii=False, default=str),
+                    "ttl_sec": float(ttl_sec),
+                },
+            )
+            self._writes += 1
+            # 不再被查詢的過期列不會被 upsert 覆寫，定期清掉
+            if self._writes % self.prune_every == 0:
+                await db.aexecute(self.PRUNE_SQL)
+        except Exception as exc:
+            print(f"[tool_cache] persistent set failed: {type(exc).__name__}: {exc}")
+
+
+ToolLoader = Callable[[], Awaitable[Any]]
+
+
+class ToolResultCache:
+    """外部工具結果快取：依工具各自的 TTL，以正規化後的參數為 key。
+
+    記憶體層為 LRU + TTL，可選擇再加上 Postgres 持久層（記憶體未命中時先查）。
+    相同 key 的並行呼叫只會打一次外部 API；TTL 為 0 或未設定的工具不快取。
+    快取的值會被多個請求共用，呼叫端不應就地修改。
+    """
+
+    def __init__(
+        self,
+        ttls: Optional[Dict[str, float]] = None,
+        *,
+        max_entries: int = 5000,
+        persistent: Optional[PersistentToolCache] = None,
+        enabled: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttls = dict(DEFAULT_TOOL_CACHE_TTLS if ttls is None else ttls)
+        self.max_entries = max(1, max_entries)
+        self.persistent = persistent
+        self.enabled = enabled
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[Any]"] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _record(self, tool: str, result: str) -> None:
+        TOOL_CACHE_REQUESTS.labels(tool=tool, result=result).inc()
+        counts = self._counts.setdefault(tool, {"hit": 0, "persistent_hit": 0, "coalesced": 0, "miss": 0})
+        counts[result] += 1
+
+    def _lookup(self, key: str) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            TOOL_CACHE_ENTRIES.set(len(self._entries))
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _store(self, key: str, value: Any, ttl_sec: float) -> None:
+        self._entries[key] = (self._clock() + ttl_sec, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        TOOL_CACHE_ENTRIES.set(len(self._entries))
+
+    async def get_or_load(
+        self,
+        tool: str,
+        args: Dict[str, Any],
+        loader: ToolLoader,
+        cacheable: Callable[[Any], bool] = _default_cacheable,
+    ) -> Any:
+        ttl_sec = self.ttls.get(tool, 0.0)
+        if not self.enabled or ttl_sec <= 0:
+            before_upstream_call()
+            return await loader()
+        key = tool_cache_key(tool, args)
+        found, value = self._lookup(key)
+        if found:
+            self._record(tool, "hit")
+            return value
+
+        if is_hedge_attempt():
+            # 對沖請求就是要另打一次上游，不能等第一次的結果
+            return await self._load(tool, key, ttl_sec, loader, cacheable)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._record(tool, "coalesced")
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                task = asyncio.current_task()
+                if inflight.cancelled() and task is not None and not task.cancelling():
+                    before_upstream_call()
+                    return await loader()
+                raise
+
+        future: "asyncio.Future[Any]" = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load(tool, key, ttl_sec, loader, cacheable)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def _load(
+        self,
+        tool: str,
+        key: str,
+        ttl_sec: float,
+        loader: ToolLoader,
+        cacheable: Callable[[Any], bool],
+    ) -> Any:
+        if self.persistent is not None:
+            stored = await self.persistent.get(key)
+            if stored is not None:
+                value, ttl_left = stored
+                self._record(tool, "persistent_hit")
+                self._store(key, value, min(ttl_sec, max(0.0, ttl_left)))
+                return value
+        before_upstream_call()
+        self._record(tool, "miss")
+        value = await loader()
+        if cacheable(value):
+            self._store(key, value, ttl_sec)
+            if self.persistent is not None:
+                await self.persistent.set(key, tool, value, ttl_sec)
+        return value
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._inflight.clear()
+        TOOL_CACHE_ENTRIES.set(0)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """各工具的命中次數與命中率（hit + persistent_hit + coalesced 視為省下一次外部呼叫）。"""
+        report: Dict[str, Dict[str, float]] = {}
+        for tool, counts in self._counts.items():
+            total = sum(counts.values())
+            saved = counts["hit"] + counts["persistent_hit"] + counts["coalesced"]
+            report[tool] = {**counts, "hit_ratio": (saved / total) if total else 0.0}
+        return report
+
+
+TOOL_RESULT_CACHE = ToolResultCache(
+    max_entries=TOOL_CACHE_MAX_ENTRIES,
+    persistent=PostgresToolCacheStore() if TOOL_CACHE_PERSISTENT else None,
+    enabled=TOOL_CACHE_ENABLED,
+)
@@ -0,0 +1,344 @@
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Dict, Iterator, Optional, Tuple, TypeVar
+
+import httpx
+from prometheus_client import Counter, Gauge
+
+from ..config import env_bool, env_float, env_int
+from ..http_clients import UPSTREAM_SEARCH, UPSTREAM_WEATHER, UPSTREAM_YOUTUBE
+from .common import ToolResult, make_tool_result
+
+
+STATE_CLOSED = "closed"
+STATE_HALF_OPEN = "half_open"
+STATE_OPEN = "open"
+_STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+CIRCUIT_BREAKER_STATE = Gauge(
+    "aiyo_circuit_breaker_state",
+    "外部上游斷路器狀態（0=closed、1=half_open、2=open）",
+    ["upstream"],
+)
+CIRCUIT_BREAKER_TRANSITIONS = Counter(
+    "aiyo_circuit_breaker_transitions_total",
+    "斷路器狀態轉換次數（state 為轉換後的狀態）",
+    ["upstream", "state"],
+)
+CIRCUIT_BREAKER_REJECTIONS = Counter(
+    "aiyo_circuit_breaker_rejections_total",
+    "斷路器開啟期間直接回傳降級結果、未呼叫上游的次數",
+    ["upstream"],
+)
+TOOL_HEDGED_REQUESTS = Counter(
+    "aiyo_tool_hedged_requests_total",
+    "對沖請求（fired：第一次呼叫超過 p95 延遲後送出第二次；won：第二次先回來）",
+    ["upstream", "outcome"],
+)
+
+CIRCUIT_BREAKER_ENABLED = env_bool("CIRCUIT_BREAKER_ENABLED", True)
+CIRCUIT_BREAKER_WINDOW = max(1, env_int("CIRCUIT_BREAKER_WINDOW", 20))
+CIRCUIT_BREAKER_MIN_CALLS = max(1, env_int("CIRCUIT_BREAKER_MIN_CALLS", 5))
+CIRCUIT_BREAKER_FAILURE_RATE = min(1.0, max(0.0, env_float("CIRCUIT_BREAKER_FAILURE_RATE", 0.5)))
+CIRCUIT_BREAKER_SLOW_CALL_SEC = max(0.1, env_float("CIRCUIT_BREAKER_SLOW_CALL_SEC", 8.0))
+CIRCUIT_BREAKER_SLOW_CALL_RATE = min(1.0, max(0.0, env_float("CIRCUIT_BREAKER_SLOW_CALL_RATE", 0.8)))
+CIRCUIT_BREAKER_OPEN_SEC = max(1.0, env_float("CIRCUIT_BREAKER_OPEN_SEC", 30.0))
+TOOL_HEDGE_ENABLED = env_bool("TOOL_HEDGE_ENABLED", False)
+TOOL_HEDGE_MIN_DELAY_SEC = max(0.05, env_float("TOOL_HEDGE_MIN_DELAY_SEC", 0.3))
+TOOL_HEDGE_MIN_SAMPLES = max(1, env_int("TOOL_HEDGE_MIN_SAMPLES", 20))
+
+# 工具 → 上游；get_current_time、search_transport_options 不呼叫外部 API，不經過斷路器
+TOOL_UPSTREAMS: Dict[str, str] = {
+    "get_weather": UPSTREAM_WEATHER,
+    "search_youtube_videos": UPSTREAM_YOUTUBE,
+    "search_travel_information": UPSTREAM_SEARCH,
+}
+
+_RETRYABLE_STATUS_RE = re.compile(r"\b(?:429|5\d\d)\b")
+
+
+def is_retryable_error(error_text: Optional[str]) -> bool:
+    """工具回傳的錯誤是否來自上游暫時性問題（429、5xx、逾時、連線失敗）。"""
+    text = (error_text or "").lower()
+    if not text:
+        return False
+    return bool(_RETRYABLE_STATUS_RE.search(text)) or "timeout" in text or "connection" in text
+
+
+def is_retryable_exception(exc: BaseException) -> bool:
+    return isinstance(exc, (httpx.TransportError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    """單一上游的斷路器。
+
+    closed：以最近 window_size 次呼叫計算失敗率與慢呼叫率，任一超過門檻（且樣本數達 min_calls）即 open；
+    open：open_sec 內直接拒絕；之後轉 half_open，只放行一個探測呼叫，成功回到 closed、失敗重新 open。
+    成功呼叫的耗時另外保留，作為對沖請求的 p95 延遲。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        window_size: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_sec: float = 8.0,
+        slow_call_rate: float = 0.8,
+        open_sec: float = 30.0,
+        latency_samples: int = 200,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.slow_call_sec = slow_call_sec
+        self.slow_call_rate = slow_call_rate
+        self.open_sec = open_sec
+        self._clock = clock
+        self._window: Deque[Tuple[bool, bool]] = deque(maxlen=max(1, window_size))
+        self._latencies: Deque[float] = deque(maxlen=max(1, latency_samples))
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probe_inflight = False
+        CIRCUIT_BREAKER_STATE.labels(upstream=name).set(_STATE_VALUES[STATE_CLOSED])
+
+    @property
+    def state(self) -> str:
+        if self._state == STATE_OPEN and self._clock() - self._opened_at >= self.open_sec:
+            self._transition(STATE_HALF_OPEN)
+        return self._state
+
+    def retry_after(self) -> float:
+        if self._state != STATE_OPEN:
+            return 0.0
+        return max(0.0, self.open_sec - (self._clock() - self._opened_at))
+
+    def _transition(self, state: str) -> None:
+        if state == self._state:
+            return
+        self._state = state
+        if state == STATE_OPEN:
+            self._opened_at = self._clock()
+        if state == STATE_CLOSED:
+            self._window.clear()
+        self._probe_inflight = False
+        CIRCUIT_BREAKER_STATE.labels(upstream=self.name).set(_STATE_VALUES[state])
+        CIRCUIT_BREAKER_TRANSITIONS.labels(upstream=self.name, state=state).inc()
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == STATE_CLOSED:
+            return True
+        if state == STATE_HALF_OPEN and not self._probe_inflight:
+            self._probe_inflight = True
+            return True
+        CIRCUIT_BREAKER_REJECTIONS.labels(upstream=self.name).inc()
+        return False
+
+    def record_success(self, duration_sec: float) -> None:
+        self._latencies.append(duration_sec)
+        self._record(True, duration_sec)
+
+    def record_failure(self, duration_sec: float) -> None:
+        self._record(False, duration_sec)
+
+    def _record(self, ok: bool, duration_sec: float) -> None:
+        slow = duration_sec >= self.slow_call_sec
+        if self._state == STATE_HALF_OPEN:
+            self._transition(STATE_CLOSED if ok and not slow else STATE_OPEN)
+            return
+        if self._state == STATE_OPEN:
+            return
+        self._window.append((ok, slow))
+        total = len(self._window)
+        if total < self.min_calls:
+            return
+        failures = sum(1 for item_ok, _ in self._window if not item_ok)
+        slow_calls = sum(1 for _, item_slow in self._window if item_slow)
+        if failures / total >= self.failure_rate or slow_calls / total >= self.slow_call_rate:
+            self._transition(STATE_OPEN)
+
+    def latency_quantile(self, quantile: float, min_samples: int = 1) -> Optional[float]:
+        if len(self._latencies) < max(1, min_samples):
+            return None
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(quantile * len(ordered)))
+        return ordered[index]
+
+    def hedge_delay(self, min_samples: int = 20, min_delay_sec: float = 0.3) -> Optional[float]:
+        """第一次呼叫超過 p95 仍未回來才送出第二次；樣本不足時不對沖。"""
+        p95 = self.latency_quantile(0.95, min_samples)
+        if p95 is None:
+            return None
+        return max(min_delay_sec, p95)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(upstream: Optional[str]) -> Optional[CircuitBreaker]:
+    if not CIRCUIT_BREAKER_ENABLED or not upstream:
+        return None
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        breaker = CircuitBreaker(
+            upstream,
+            window_size=CIRCUIT_BREAKER_WINDOW,
+            min_calls=CIRCUIT_BREAKER_MIN_CALLS,
+            failure_rate=CIRCUIT_BREAKER_FAILURE_RATE,
+            slow_call_sec=CIRCUIT_BREAKER_SLOW_CALL_SEC,
+            slow_call_rate=CIRCUIT_BREAKER_SLOW_CALL_RATE,
+            open_sec=CIRCUIT_BREAKER_OPEN_SEC,
+        )
+        _breakers[upstream] = breaker
+    return breaker
+
+
+def reset_circuit_breakers() -> None:
+    _breakers.clear()
+
+
+class CircuitOpenError(Exception):
+    """斷路器開啟且快取沒有結果、真的需要呼叫上游時拋出。"""
+
+    def __init__(self, breaker: CircuitBreaker) -> None:
+        super().__init__(f"{breaker.name} circuit open")
+        self.breaker = breaker
+
+
+class UpstreamCallGate:
+    """一次工具呼叫（含對沖）中實際打到上游的次數。
+
+    快取命中不經過這裡：只有 calls > 0 的呼叫才計入斷路器的失敗率、慢呼叫率與對沖用的 p95 延遲；
+    斷路器開啟時快取命中照常回傳，只有要打上游時才被拒絕。
+    """
+
+    def __init__(self, breaker: Optional[CircuitBreaker]) -> None:
+        self.breaker = breaker
+        self.calls = 0
+        # 工具內呼叫其他上游（guarded_upstream_call）花掉的秒數，不算進這個上游的延遲
+        self.nested_sec = 0.0
+
+    def enter(self) -> None:
+        # 同一次呼叫內第二個上游請求（例如地理編碼後查天氣、對沖）不再重新申請，避免 half_open 探測被自己擋下
+        if self.calls == 0 and self.breaker is not None and not self.breaker.allow():
+            raise CircuitOpenError(self.breaker)
+        self.calls += 1
+
+
+_UPSTREAM_GATE: ContextVar[Optional[UpstreamCallGate]] = ContextVar("tool_upstream_gate", default=None)
+
+
+@contextmanager
+def upstream_call_gate(breaker: Optional[CircuitBreaker]) -> Iterator[UpstreamCallGate]:
+    gate = UpstreamCallGate(breaker)
+    token = _UPSTREAM_GATE.set(gate)
+    try:
+        yield gate
+    finally:
+        _UPSTREAM_GATE.reset(token)
+
+
+def before_upstream_call() -> None:
+    """結果快取未命中、即將呼叫外部 API 前呼叫；不在工具執行器內（沒有 gate）時不做任何事。"""
+    gate = _UPSTREAM_GATE.get()
+    if gate is not None:
+        gate.enter()
+
+
+T = TypeVar("T")
+
+
+async def guarded_upstream_call(upstream: str, call: Callable[[], Awaitable[T]]) -> T:
+    """工具內另一個上游的呼叫（例如天氣工具的 Nominatim 地理編碼）改用該上游自己的斷路器。
+
+    成功、例外與延遲只記在 upstream 的斷路器，所屬工具的斷路器不會因為它被限流或變慢而開啟；
+    斷路器開啟且快取未命中時拋出 CircuitOpenError，由呼叫端決定如何降級。
+    """
+    outer = _UPSTREAM_GATE.get()
+    breaker = get_circuit_breaker(upstream)
+    started = time.monotonic()
+    try:
+        with upstream_call_gate(breaker) as gate:
+            try:
+                result = await call()
+            except BaseException:
+                if breaker is not None and gate.calls:
+                    breaker.record_failure(time.monotonic() - started)
+                raise
+            if breaker is not None and gate.calls:
+                breaker.record_success(time.monotonic() - started)
+            return result
+    finally:
+        if outer is not None:
+            outer.nested_sec += time.monotonic() - started
+
+
+_HEDGE_ATTEMPT: ContextVar[bool] = ContextVar("tool_hedge_attempt", default=False)
+
+
+def is_hedge_attempt() -> bool:
+    """目前是否在對沖的第二次呼叫中；結果快取據此不併入第一次仍在進行的呼叫。"""
+    return _HEDGE_ATTEMPT.get()
+
+
+async def _hedge_attempt(call: Callable[[], Awaitable[T]]) -> T:
+    # 在新 task 的 context 內設定，不影響第一次呼叫
+    _HEDGE_ATTEMPT.set(True)
+    return await call()
+
+
+async def hedged_call(
+    call: Callable[[], Awaitable[T]],
+    delay_sec: Optional[float],
+    is_ok: Callable[[T], bool],
+    upstream: str = "",
+) -> T:
+    """第一次呼叫在 delay_sec 內沒回來時並行送出第二次，採用先成功的結果並取消另一個。
+
+    兩次都失敗時回傳（或拋出）最後完成的那一次結果；delay_sec 為 None 時等同直接呼叫。
+    只適用於可重複執行的讀取型呼叫。
+    """
+    if delay_sec is None:
+        return await call()
+    first: "asyncio.Future[T]" = asyncio.ensure_future(call())
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait({first}, timeout=delay_sec)
+        if done:
+            return first.result()
+        TOOL_HEDGED_REQUESTS.labels(upstream=upstream, outcome="fired").inc()
+        second: "asyncio.Future[T]" = asyncio.ensure_future(_hedge_attempt(call))
+        tasks.append(second)
+        pending = {first, second}
+        last: "asyncio.Future[T]" = first
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                last = task
+                if task.exception() is None and is_ok(task.result()):
+                    if task is second:
+                        TOOL_HEDGED_REQUESTS.labels(upstream=upstream, outcome="won").inc()
+                    return task.result()
+        return last.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+def degraded_tool_result(tool_name: str, breaker: CircuitBreaker) -> ToolResult:
+    return make_tool_result(
+        ok=False,
+        source=tool_name,
+        data={"degraded": True, "upstream": breaker.name, "retry_after_sec": round(breaker.retry_after(), 1)},
+        error=f"{breaker.name} temporarily unavailable (circuit open)",
+    )
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .weather import is_weather_query
+
+# skip：不需要工具，直接產生回覆；direct：規則即可決定工具與參數，直接執行；llm：交給 LLM 規劃工具
+ROUTE_SKIP = "skip"
+ROUTE_DIRECT = "direct"
+ROUTE_LLM = "llm"
+
+TIME_KEYWORDS = (
+    "現在幾點", "幾點了", "現在時間", "目前時間", "今天幾號", "今天日期", "今天是幾月幾號",
+    "星期幾", "禮拜幾", "what time", "current time", "today's date",
+)
+TRANSPORT_KEYWORDS = (
+    "交通", "怎麼去", "如何前往", "怎麼到", "怎麼搭", "搭車", "高鐵", "台鐵", "火車", "客運",
+    "捷運", "公車", "轉乘", "車票", "班次",
+)
+# 需要即時搜尋、但參數無法以規則決定的問題，交給 LLM 規劃
+LLM_PLANNING_KEYWORDS = (
+    "最新", "活動", "展覽", "營業時間", "開放時間", "休館", "門票", "新聞", "演唱會", "祭典",
+    "youtube", "vlog", "影片", "搜尋", "查一下", "查查", "幫我查", "幫我找",
+)
+
+_PLACE = r"[^\s，,。.？?！!、]{1,12}?"
+_TRANSPORT_ROUTE_RE = re.compile(
+    rf"(?:從|由)\s*(?P<departure>{_PLACE})\s*(?:到|去|前往|至)\s*(?P<destination>{_PLACE})"
+    r"(?=怎|要|的|該|交通|搭|坐|開車|多久|多少|最|有|可以|[\s，,。.？?！!]|$)"
+)
+
+
+@dataclass(frozen=True)
+class ToolRoute:
+    path: str
+    calls: Tuple[Dict[str, Any], ...] = field(default_factory=tuple)
+    reason: str = ""
+
+    def summary(self) -> Dict[str, Any]:
+        """放在 tool_calls_summary 第一筆，標示本次採用的工具路徑（前端以 kind 過濾，不顯示為工具）。"""
+        return {
+            "tool": "tool_router",
+            "kind": "route",
+            "route": self.path,
+            "reason": self.reason,
+            "ok": True,
+            "source": "pre-router",
+            "error": None,
+            "arguments": {"planned_tools": [call["name"] for call in self.calls]},
+        }
+
+
+def _contains_any(text: str, keywords: Tuple[str, ...]) -> bool:
+    return any(keyword in text for keyword in keywords)
+
+
+def extract_transport_endpoints(text: str) -> Optional[Tuple[str, str]]:
+    match = _TRANSPORT_ROUTE_RE.search(text or "")
+    if not match:
+        return None
+    departure = match.group("departure").strip()
+    destination = match.group("destination").strip()
+    if not departure or not destination or departure == destination:
+        return None
+    return departure, destination
+
+
+def route_tools(message: str, tool_flags: Dict[str, bool]) -> ToolRoute:
+    """以關鍵字規則決定工具路徑，省去多數對話的非串流規劃回合。"""
+    text = (message or "").strip()
+    lowered = text.lower()
+    calls: List[Dict[str, Any]] = []
+    reasons: List[str] = []
+    needs_llm = False
+
+    if _contains_any(lowered, TIME_KEYWORDS):
+        calls.append({"name": "get_current_time", "arguments": {}})
+        reasons.append("time")
+    if tool_flags.get("weather", True) and is_weather_query(text):
+        calls.append({"name": "get_weather", "arguments": {}})
+        reasons.append("weather")
+    transport_query = _contains_any(text, TRANSPORT_KEYWORDS)
+    endpoints = extract_transport_endpoints(text)
+    if tool_flags.get("transport", True) and (transport_query or endpoints):
+        if endpoints:
+            calls.append(
+                {
+                    "name": "search_transport_options",
+                    "arguments": {"departure": endpoints[0], "destination": endpoints[1]},
+                }
+            )
+            reasons.append("transport")
+        elif transport_query:
+            needs_llm = True
+            reasons.append("transport-without-endpoints")
+    if (tool_flags.get("travel_info", True) or tool_flags.get("youtube", True)) and _contains_any(
+        lowered, LLM_PLANNING_KEYWORDS
+    ):
+        needs_llm = True
+        reasons.append("search")
+
+    if needs_llm:
+        return ToolRoute(path=ROUTE_LLM, reason=",".join(reasons))
+    if calls:
+        return ToolRoute(path=ROUTE_DIRECT, calls=tuple(calls), reason=",".join(reasons))
+    return ToolRoute(path=ROUTE_SKIP, reason="no-tool-intent")
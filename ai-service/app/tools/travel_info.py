@@ -3,8 +3,8 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Any, Dict, List, Optional
 
-import httpx
-
+from ..http_clients import UPSTREAM_SEARCH, HttpClientRegistry, upstream_client
+from .cache import CACHE_TRAVEL_SEARCH, TOOL_RESULT_CACHE
 from .common import ToolResult, make_tool_result
 
 
@@ -33,13 +33,30 @@ def _flatten_duckduckgo_related_topics(items: Any, output: List[Dict[str, str]],
         )
 
 
-async def search_travel_information(query: str, region: Optional[str], limit: int) -> ToolResult:
+async def search_travel_information(
+    query: str,
+    region: Optional[str],
+    limit: int,
+    http_clients: Optional[HttpClientRegistry] = None,
+) -> ToolResult:
     q = (query or "").strip()
     if not q:
         return make_tool_result(ok=False, source="duckduckgo", error="query is required")
     region_text = (region or "").strip()
     full_query = f"{q} {region_text}".strip() if region_text else q
     top_n = max(1, min(8, int(limit or 5)))
+    return await TOOL_RESULT_CACHE.get_or_load(
+        CACHE_TRAVEL_SEARCH,
+        {"q": full_query, "limit": top_n},
+        lambda: _fetch_duckduckgo(full_query, top_n, http_clients),
+    )
+
+
+async def _fetch_duckduckgo(
+    full_query: str,
+    top_n: int,
+    http_clients: Optional[HttpClientRegistry],
+) -> ToolResult:
     params = {
         "q": full_query,
         "format": "json",
@@ -47,7 +64,7 @@ async def search_travel_information(query: str, region: Optional[str], limit: in
         "skip_disambig": "1",
         "no_redirect": "1",
     }
-    async with httpx.AsyncClient(timeout=httpx.Timeout(15.0, connect=5.0)) as client:
+    async with upstream_client(UPSTREAM_SEARCH, http_clients) as client:
         response = await client.get("https://api.duckduckgo.com/", params=params)
     if response.status_code >= 400:
         return make_tool_result(ok=False, source="duckduckgo", error=f"search api error: {response.status_code}")
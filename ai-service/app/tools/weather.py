@@ -1,12 +1,17 @@
 from __future__ import annotations
 
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
 from zoneinfo import ZoneInfo
 
 import httpx
 
+from ..http_clients import UPSTREAM_GEOCODE, UPSTREAM_WEATHER, HttpClientRegistry, upstream_client
+from .cache import CACHE_GEOCODE, CACHE_REVERSE_GEOCODE, CACHE_WEATHER, TOOL_RESULT_CACHE
 from .common import ToolResult, make_tool_result
+from .resilience import CircuitOpenError, guarded_upstream_call
+
+T = TypeVar("T")
 
 
 def is_weather_query(text: str) -> bool:
@@ -37,13 +42,51 @@ async def get_current_time(timezone: str, default_timezone: str) -> ToolResult:
     )
 
 
-async def resolve_region_from_coordinates(lat: float, lng: float, user_agent: str) -> Optional[str]:
-    async with httpx.AsyncClient(timeout=httpx.Timeout(8.0, connect=3.0)) as client:
+async def resolve_region_from_coordinates(
+    lat: float,
+    lng: float,
+    user_agent: str,
+    http_clients: Optional[HttpClientRegistry] = None,
+) -> Optional[str]:
+    # 座標取到小數第三位（約 100 公尺）作為快取 key，附近位置共用同一個地名
+    return await _nominatim_call(
+        lambda: TOOL_RESULT_CACHE.get_or_load(
+            CACHE_REVERSE_GEOCODE,
+            {"lat": round(lat, 3), "lng": round(lng, 3)},
+            lambda: _reverse_geocode(lat, lng, user_agent, http_clients),
+        )
+    )
+
+
+async def _nominatim_call(call: Callable[[], Awaitable[Optional[T]]]) -> Optional[T]:
+    """Nominatim 呼叫走自己的斷路器（UPSTREAM_GEOCODE）：它的限流與延遲不算在天氣工具的 Open-Meteo 上；
+    失敗或斷路器開啟時視為查無結果。"""
+    try:
+        return await guarded_upstream_call(UPSTREAM_GEOCODE, call)
+    except (CircuitOpenError, httpx.HTTPError) as exc:
+        print(f"[weather] nominatim unavailable: {type(exc).__name__}: {exc}")
+        return None
+
+
+def _raise_for_upstream_error(response: httpx.Response) -> None:
+    # 429 / 5xx 計入 geocode 斷路器；其他 4xx 仍視為查無結果
+    if response.status_code == 429 or response.status_code >= 500:
+        response.raise_for_status()
+
+
+async def _reverse_geocode(
+    lat: float,
+    lng: float,
+    user_agent: str,
+    http_clients: Optional[HttpClientRegistry],
+) -> Optional[str]:
+    async with upstream_client(UPSTREAM_GEOCODE, http_clients) as client:
         response = await client.get(
             "https://nominatim.openstreetmap.org/reverse",
             params={"format": "jsonv2", "lat": lat, "lon": lng, "accept-language": "zh-TW"},
             headers={"User-Agent": user_agent},
         )
+    _raise_for_upstream_error(response)
     if response.status_code >= 400:
         return None
     data = response.json() if response.content else {}
@@ -65,6 +108,7 @@ async def infer_weather_region(
     user_ai_settings: Dict[str, Any],
     default_region: Optional[str],
     user_agent: str,
+    http_clients: Optional[HttpClientRegistry] = None,
 ) -> Dict[str, str]:
     region = (explicit_region or "").strip()
     if region:
@@ -89,7 +133,7 @@ async def infer_weather_region(
         lat = user_ai_settings.get("current_lat")
         lng = user_ai_settings.get("current_lng")
         if isinstance(lat, (int, float)) and isinstance(lng, (int, float)):
-            resolved = await resolve_region_from_coordinates(float(lat), float(lng), user_agent)
+            resolved = await resolve_region_from_coordinates(float(lat), float(lng), user_agent, http_clients)
             if resolved:
                 return {"region": resolved, "location_source": "reverse_geocode"}
 
@@ -109,14 +153,33 @@ def _parse_geocode_result(lat: float, lng: float, name: str, country: str) -> Op
     return {"latitude": lat, "longitude": lng, "name": name or "", "country": country or ""}
 
 
-async def _geocode_region_nominatim(region: str, user_agent: str) -> Optional[Dict[str, Any]]:
+async def _geocode_region_nominatim(
+    region: str,
+    user_agent: str,
+    http_clients: Optional[HttpClientRegistry] = None,
+) -> Optional[Dict[str, Any]]:
     """當 Open-Meteo 無結果時使用 Nominatim 解析地名（支援日文等，如熊本）。"""
-    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, connect=3.0)) as client:
+    return await _nominatim_call(
+        lambda: TOOL_RESULT_CACHE.get_or_load(
+            CACHE_GEOCODE,
+            {"provider": "nominatim", "region": region},
+            lambda: _fetch_nominatim_geocode(region, user_agent, http_clients),
+        )
+    )
+
+
+async def _fetch_nominatim_geocode(
+    region: str,
+    user_agent: str,
+    http_clients: Optional[HttpClientRegistry],
+) -> Optional[Dict[str, Any]]:
+    async with upstream_client(UPSTREAM_GEOCODE, http_clients) as client:
         response = await client.get(
             "https://nominatim.openstreetmap.org/search",
             params={"q": region, "format": "json", "limit": 1},
             headers={"User-Agent": user_agent},
         )
+    _raise_for_upstream_error(response)
     if response.status_code >= 400:
         return None
     data = response.json() if response.content else []
@@ -134,46 +197,69 @@ async def _geocode_region_nominatim(region: str, user_agent: str) -> Optional[Di
     return _parse_geocode_result(lat, lng, name, country)
 
 
-async def get_weather(region: str, user_agent: str, query: str, location_source: str) -> ToolResult:
-    if not region.strip():
-        return make_tool_result(
-            ok=False,
-            source="open-meteo",
-            error="missing region",
-            data={"query": query, "location_source": location_source},
-        )
-    async with httpx.AsyncClient(timeout=httpx.Timeout(12.0, connect=4.0)) as client:
+async def geocode_region(
+    region: str,
+    user_agent: str,
+    http_clients: Optional[HttpClientRegistry] = None,
+) -> Dict[str, Any]:
+    """地名 → 座標（先查 Open-Meteo，查無再用 Nominatim）；失敗時回傳 {"error": ...}。"""
+    return await TOOL_RESULT_CACHE.get_or_load(
+        CACHE_GEOCODE,
+        {"provider": "open-meteo", "region": region},
+        lambda: _fetch_open_meteo_geocode(region, user_agent, http_clients),
+    )
+
+
+async def _fetch_open_meteo_geocode(
+    region: str,
+    user_agent: str,
+    http_clients: Optional[HttpClientRegistry],
+) -> Dict[str, Any]:
+    async with upstream_client(UPSTREAM_WEATHER, http_clients) as client:
         geo = await client.get(
             "https://geocoding-api.open-meteo.com/v1/search",
             params={"name": region, "count": 1, "language": "zh", "format": "json"},
             headers={"User-Agent": user_agent},
         )
-        if geo.status_code >= 400:
-            return make_tool_result(ok=False, source="open-meteo", error=f"geocoding error: {geo.status_code}")
-        geo_data = geo.json() if geo.content else {}
-        geo_rows = geo_data.get("results") if isinstance(geo_data, dict) else None
-        if isinstance(geo_rows, list) and geo_rows:
-            top = geo_rows[0]
-            lat = top.get("latitude")
-            lng = top.get("longitude")
-            if isinstance(lat, (int, float)) and isinstance(lng, (int, float)):
-                resolved_name = top.get("name") or region
-                country = top.get("country") or ""
-            else:
-                top = None
-        else:
-            top = None
-        if top is None:
-            nominatim = await _geocode_region_nominatim(region, user_agent)
-            if not nominatim:
-                return make_tool_result(ok=False, source="open-meteo", error="geocoding no result")
-            lat = nominatim["latitude"]
-            lng = nominatim["longitude"]
-            resolved_name = nominatim["name"]
-            country = nominatim["country"]
-        else:
-            resolved_name = top.get("name") or region
-            country = top.get("country") or ""
+    if geo.status_code >= 400:
+        return {"error": f"geocoding error: {geo.status_code}"}
+    geo_data = geo.json() if geo.content else {}
+    geo_rows = geo_data.get("results") if isinstance(geo_data, dict) else None
+    if isinstance(geo_rows, list) and geo_rows:
+        top = geo_rows[0]
+        lat = top.get("latitude")
+        lng = top.get("longitude")
+        if isinstance(lat, (int, float)) and isinstance(lng, (int, float)):
+            return _parse_geocode_result(lat, lng, top.get("name") or region, top.get("country") or "") or {
+                "error": "geocoding no result"
+            }
+    nominatim = await _geocode_region_nominatim(region, user_agent, http_clients)
+    if not nominatim:
+        return {"error": "geocoding no result"}
+    return nominatim
+
+
+async def fetch_current_weather(
+    lat: float,
+    lng: float,
+    user_agent: str,
+    http_clients: Optional[HttpClientRegistry] = None,
+) -> Dict[str, Any]:
+    """座標 → 目前天氣（timezone、current、fetched_at）；失敗時回傳 {"error": ...}。"""
+    return await TOOL_RESULT_CACHE.get_or_load(
+        CACHE_WEATHER,
+        {"lat": round(lat, 2), "lng": round(lng, 2)},
+        lambda: _fetch_open_meteo_forecast(lat, lng, user_agent, http_clients),
+    )
+
+
+async def _fetch_open_meteo_forecast(
+    lat: float,
+    lng: float,
+    user_agent: str,
+    http_clients: Optional[HttpClientRegistry],
+) -> Dict[str, Any]:
+    async with upstream_client(UPSTREAM_WEATHER, http_clients) as client:
         weather = await client.get(
             "https://api.open-meteo.com/v1/forecast",
             params={
@@ -185,19 +271,46 @@ async def get_weather(region: str, user_agent: str, query: str, location_source:
             headers={"User-Agent": user_agent},
         )
     if weather.status_code >= 400:
-        return make_tool_result(ok=False, source="open-meteo", error=f"weather api error: {weather.status_code}")
+        return {"error": f"weather api error: {weather.status_code}"}
     weather_data = weather.json() if weather.content else {}
+    return {
+        "timezone": weather_data.get("timezone"),
+        "current": (weather_data.get("current") or {}),
+        "fetched_at": datetime.utcnow().isoformat() + "Z",
+    }
+
+
+async def get_weather(
+    region: str,
+    user_agent: str,
+    query: str,
+    location_source: str,
+    http_clients: Optional[HttpClientRegistry] = None,
+) -> ToolResult:
+    if not region.strip():
+        return make_tool_result(
+            ok=False,
+            source="open-meteo",
+            error="missing region",
+            data={"query": query, "location_source": location_source},
+        )
+    place = await geocode_region(region, user_agent, http_clients)
+    if place.get("error") or "latitude" not in place:
+        return make_tool_result(ok=False, source="open-meteo", error=place.get("error") or "geocoding no result")
+    weather = await fetch_current_weather(place["latitude"], place["longitude"], user_agent, http_clients)
+    if weather.get("error"):
+        return make_tool_result(ok=False, source="open-meteo", error=weather["error"])
     return make_tool_result(
         ok=True,
         source="open-meteo",
         data={
             "query": query,
             "region": region,
-            "resolved_name": resolved_name,
-            "country": country,
-            "timezone": weather_data.get("timezone"),
-            "current": (weather_data.get("current") or {}),
+            "resolved_name": place.get("name") or region,
+            "country": place.get("country") or "",
+            "timezone": weather.get("timezone"),
+            "current": weather.get("current") or {},
             "location_source": location_source,
-            "fetched_at": datetime.utcnow().isoformat() + "Z",
+            "fetched_at": weather.get("fetched_at"),
         },
     )
@@ -2,8 +2,8 @@ from __future__ import annotations
 
 from typing import Any, Dict, Optional
 
-import httpx
-
+from ..http_clients import UPSTREAM_YOUTUBE, HttpClientRegistry, upstream_client
+from .cache import CACHE_YOUTUBE_SEARCH, TOOL_RESULT_CACHE
 from .common import ToolResult, make_tool_result
 
 
@@ -12,6 +12,7 @@ async def search_youtube_videos(
     location: Optional[str],
     max_results: int,
     youtube_api_key: str,
+    http_clients: Optional[HttpClientRegistry] = None,
 ) -> ToolResult:
     if not youtube_api_key:
         return make_tool_result(ok=False, source="youtube", error="missing YOUTUBE_API_KEY")
@@ -21,6 +22,20 @@ async def search_youtube_videos(
     location_text = (location or "").strip()
     full_query = f"{q} 旅遊 {location_text}".strip()
     top_n = max(1, min(10, int(max_results or 5)))
+    # API key 不放進快取 key；失敗結果（含配額用盡）不快取
+    return await TOOL_RESULT_CACHE.get_or_load(
+        CACHE_YOUTUBE_SEARCH,
+        {"q": full_query, "max_results": top_n},
+        lambda: _fetch_youtube_search(full_query, top_n, youtube_api_key, http_clients),
+    )
+
+
+async def _fetch_youtube_search(
+    full_query: str,
+    top_n: int,
+    youtube_api_key: str,
+    http_clients: Optional[HttpClientRegistry],
+) -> ToolResult:
     params: Dict[str, Any] = {
         "part": "snippet",
         "q": full_query,
@@ -28,7 +43,7 @@ async def search_youtube_videos(
         "maxResults": top_n,
         "key": youtube_api_key,
     }
-    async with httpx.AsyncClient(timeout=httpx.Timeout(15.0, connect=5.0)) as client:
+    async with upstream_client(UPSTREAM_YOUTUBE, http_clients) as client:
         response = await client.get("https://www.googleapis.com/youtube/v3/search", params=params)
     if response.status_code >= 400:
         return make_tool_result(ok=False, source="youtube", error=f"youtube api error: {response.status_code}")
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter
+
+from app import db
+
+USER_CONTEXT_CACHE_REQUESTS = Counter(
+    "aiyo_user_context_cache_total",
+    "使用者 context 快照查詢（hit：快取命中、miss：查 DB、coalesced：併入進行中的查詢）",
+    ["result"],
+)
+USER_CONTEXT_INVALIDATIONS = Counter(
+    "aiyo_user_context_invalidations_total",
+    "使用者 context 快照被明確失效的次數",
+)
+
+# 各消費端需要的最大筆數（profile context 取 12、features 取 15、personalization signals 取 20）
+SNAPSHOT_MEMORY_LIMIT = 20
+SNAPSHOT_DIALOGUE_LIMIT = 10
+
+# profile、記憶、偏好與 AI 設定只在使用者明確修改時變動（寫入端會 invalidate），可快取；
+# user_preferences 有 RLS，需在同一交易設定 app.user_id
+USER_CONTEXT_STABLE_COLUMNS = f"""
+      (
+        SELECT to_jsonb(p)
+        FROM (
+          SELECT display_name, travel_style, budget_pref, pace_pref, transport_pref, dietary_pref, preferred_cities
+          FROM user_profiles
+          WHERE user_id = %(user_id)s
+        ) p
+      ) AS profile,
+      (
+        SELECT COALESCE(jsonb_agg(to_jsonb(m) ORDER BY m.created_at DESC), '[]'::jsonb)
+        FROM (
+          SELECT memory_type, memory_text, confidence, source, created_at
+          FROM user_memories
+          WHERE user_id = %(user_id)s
+          ORDER BY created_at DESC
+          LIMIT {SNAPSHOT_MEMORY_LIMIT}
+        ) m
+      ) AS memories,
+      (
+        SELECT preferences_json
+        FROM user_preferences
+        WHERE user_id = %(user_id)s
+        ORDER BY updated_at DESC
+        LIMIT 1
+      ) AS preferences_json,
+      (
+        SELECT to_jsonb(s)
+        FROM (
+          SELECT tool_policy_json, weather_default_region, auto_use_current_location,
+                 current_lat, current_lng, current_region, updated_at
+          FROM user_ai_settings
+          WHERE user_id = %(user_id)s
+        ) s
+      ) AS ai_settings
+"""
+
+# 近期對話與互動分數每則訊息、每次點擊都會變，沒有失效通知，每個請求都重新查
+USER_CONTEXT_VOLATILE_COLUMNS = f"""
+      (
+        SELECT COALESCE(jsonb_agg(to_jsonb(d) ORDER BY d.created_at DESC), '[]'::jsonb)
+        FROM (
+          SELECT m.role, m.content, m.created_at
+          FROM chat_messages m
+          JOIN chat_sessions cs ON cs.id = m.session_id
+          WHERE cs.user_id = %(user_id)s
+          ORDER BY m.created_at DESC
+          LIMIT {SNAPSHOT_DIALOGUE_LIMIT}
+        ) d
+      ) AS recent_dialogue,
+      (
+        SELECT COALESCE(jsonb_object_agg(i.youtube_id, i.weighted_score), '{{}}'::jsonb)
+        FROM (
+          SELECT COALESCE(re.youtube_id, v.youtube_id) AS youtube_id,
+                 SUM(
+                   CASE re.event_type
+                     WHEN 'click' THEN 1.0
+                     WHEN 'segment_jump' THEN 0.8
+                     WHEN 'itinerary_adopt' THEN 1.5
+                     WHEN 'like' THEN 1.2
+                     WHEN 'dismiss' THEN -1.2
+                     WHEN 'unlike' THEN -1.0
+                     ELSE 0.0
+                   END
+                 ) AS weighted_score
+          FROM recommendation_events re
+          LEFT JOIN videos v ON v.id = re.video_id
+          WHERE re.user_id = %(user_id)s
+            AND re.created_at >= NOW() - INTERVAL '90 days'
+            AND COALESCE(re.youtube_id, v.youtube_id) IS NOT NULL
+          GROUP BY COALESCE(re.youtube_id, v.youtube_id)
+        ) i
+        WHERE i.weighted_score <> 0
+      ) AS interaction_scores
+"""
+
+# 快取未命中時一次往返取回全部
+USER_CONTEXT_SNAPSHOT_SQL = f"SELECT{USER_CONTEXT_STABLE_COLUMNS.rstrip()},{USER_CONTEXT_VOLATILE_COLUMNS}"
+USER_CONTEXT_VOLATILE_SQL = f"SELECT{USER_CONTEXT_VOLATILE_COLUMNS}"
+
+
+@dataclass(frozen=True)
+class UserContextSnapshot:
+    """單一使用者的個人化資料快照；同一請求內的各消費端共用同一個物件。
+
+    memories 與 recent_dialogue 皆為新到舊排序。
+    """
+
+    user_id: int
+    profile: Optional[Dict[str, Any]] = None
+    memories: List[Dict[str, Any]] = field(default_factory=list)
+    preferences_json: Optional[Dict[str, Any]] = None
+    ai_settings: Dict[str, Any] = field(default_factory=dict)
+    recent_dialogue: List[Dict[str, Any]] = field(default_factory=list)
+    interaction_scores: Dict[str, float] = field(default_factory=dict)
+
+
+def _dict_or_none(value: Any) -> Optional[Dict[str, Any]]:
+    return value if isinstance(value, dict) else None
+
+
+def _dict_list(value: Any) -> List[Dict[str, Any]]:
+    if not isinstance(value, list):
+        return []
+    return [item for item in value if isinstance(item, dict)]
+
+
+def _interaction_scores(value: Any) -> Dict[str, float]:
+    scores: Dict[str, float] = {}
+    if isinstance(value, dict):
+        for youtube_id, score in value.items():
+            if not isinstance(youtube_id, str) or not youtube_id.strip():
+                continue
+            try:
+                scores[youtube_id.strip()] = float(score or 0.0)
+            except (TypeError, ValueError):
+                continue
+    return scores
+
+
+def snapshot_from_row(user_id: int, row: Optional[Dict[str, Any]]) -> UserContextSnapshot:
+    row = row or {}
+    return UserContextSnapshot(
+        user_id=user_id,
+        profile=_dict_or_none(row.get("profile")),
+        memories=_dict_list(row.get("memories")),
+        preferences_json=_dict_or_none(row.get("preferences_json")),
+        ai_settings=_dict_or_none(row.get("ai_settings")) or {},
+        recent_dialogue=_dict_list(row.get("recent_dialogue")),
+        interaction_scores=_interaction_scores(row.get("interaction_scores")),
+    )
+
+
+def with_volatile_row(snapshot: UserContextSnapshot, row: Optional[Dict[str, Any]]) -> UserContextSnapshot:
+    """以最新的近期對話與互動分數取代快取快照中的舊值。"""
+    row = row or {}
+    return replace(
+        snapshot,
+        recent_dialogue=_dict_list(row.get("recent_dialogue")),
+        interaction_scores=_interaction_scores(row.get("interaction_scores")),
+    )
+
+
+async def load_user_context_snapshot(user_id: int) -> UserContextSnapshot:
+    rows = await db.afetch_all_with_settings(
+        (("app.user_id", str(user_id)),),
+        USER_CONTEXT_SNAPSHOT_SQL,
+        {"user_id": user_id},
+    )
+    return snapshot_from_row(user_id, rows[0] if rows else None)
+
+
+async def load_user_volatile_context(user_id: int) -> Optional[Dict[str, Any]]:
+    return await db.afetch_one(USER_CONTEXT_VOLATILE_SQL, {"user_id": user_id})
+
+
+SnapshotLoader = Callable[[int], Awaitable[UserContextSnapshot]]
+VolatileLoader = Callable[[int], Awaitable[Optional[Dict[str, Any]]]]
+
+
+class UserContextCache:
+    """以 user_id 為 key 的快照快取（TTL + LRU 上限）。
+
+    同一使用者同時有多個查詢時只打一次 DB；寫入偏好、記憶或設定後呼叫 invalidate，
+    失效前已發出的查詢結果不會寫回快取，避免把舊資料放回去。
+    有 volatile_loader 時，命中快取仍會重新查近期對話與互動分數（沒有寫入端通知），查詢失敗才沿用快取中的值。
+    """
+
+    def __init__(
+        self,
+        loader: SnapshotLoader = load_user_context_snapshot,
+        *,
+        volatile_loader: Optional[VolatileLoader] = None,
+        ttl_sec: float = 60.0,
+        max_entries: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._loader = loader
+        self._volatile_loader = volatile_loader
+        self.ttl_sec = max(0.0, ttl_sec)
+        self.max_entries = max(1, max_entries)
+        self._clock = clock
+        self._entries: "OrderedDict[int, Tuple[float, UserContextSnapshot]]" = OrderedDict()
+        self._inflight: Dict[int, "asyncio.Future[UserContextSnapshot]"] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, user_id: int) -> UserContextSnapshot:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            expires_at, snapshot = entry
+            if self._clock() < expires_at:
+                self._entries.move_to_end(user_id)
+                USER_CONTEXT_CACHE_REQUESTS.labels(result="hit").inc()
+                return await self._refresh_volatile(snapshot)
+            self._entries.pop(user_id, None)
+
+        pending = self._inflight.get(user_id)
+        if pending is not None:
+            USER_CONTEXT_CACHE_REQUESTS.labels(result="coalesced").inc()
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # 發起查詢的一方被取消（例如逾時）時，由目前的呼叫者重新查詢；自己也被取消時照常拋出
+                task = asyncio.current_task()
+                if pending.cancelled() and task is not None and not task.cancelling():
+                    return await self.get(user_id)
+                raise
+
+        USER_CONTEXT_CACHE_REQUESTS.labels(result="miss").inc()
+        future: "asyncio.Future[UserContextSnapshot]" = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        try:
+            snapshot = await self._loader(user_id)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # 沒有其他等待者時避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(snapshot)
+            # 查詢期間被 invalidate 時 _inflight 已移除，結果只回給這次的呼叫者
+            if self.ttl_sec > 0 and self._inflight.get(user_id) is future:
+                self._store(user_id, snapshot)
+            return snapshot
+        finally:
+            if self._inflight.get(user_id) is future:
+                del self._inflight[user_id]
+
+    async def _refresh_volatile(self, snapshot: UserContextSnapshot) -> UserContextSnapshot:
+        if self._volatile_loader is None:
+            return snapshot
+        try:
+            row = await self._volatile_loader(snapshot.user_id)
+        except Exception as exc:
+            print(f"[user_context] volatile reload failed for user {snapshot.user_id}: {type(exc).__name__}: {exc}")
+            return snapshot
+        return with_volatile_row(snapshot, row)
+
+    def _store(self, user_id: int, snapshot: UserContextSnapshot) -> None:
+        self._entries[user_id] = (self._clock() + self.ttl_sec, snapshot)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        self._entries.pop(user_id, None)
+        self._inflight.pop(user_id, None)
+        USER_CONTEXT_INVALIDATIONS.inc()
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._inflight.clear()
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from app.admission import (
+    REJECT_QUEUE_FULL,
+    REJECT_TIMEOUT,
+    REJECT_USER_QUEUE_FULL,
+    AdmissionController,
+    AdmissionRejected,
+)
+
+
+class AdmissionControllerTests(unittest.IsolatedAsyncioTestCase):
+    async def test_admits_up_to_capacity_then_queues(self) -> None:
+        controller = AdmissionController(2, max_queue=4)
+        first = await controller.acquire("u1")
+        second = await controller.acquire("u2")
+        waiter = asyncio.create_task(controller.acquire("u3"))
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+        self.assertEqual(controller.waiting, 1)
+        first.release()
+        ticket = await asyncio.wait_for(waiter, timeout=1)
+        self.assertEqual(controller.active, 2)
+        ticket.release()
+        ticket.release()
+        self.assertEqual(controller.active, 1)
+        second.release()
+
+    async def test_round_robin_across_users(self) -> None:
+        controller = AdmissionController(1, max_queue=10, max_queue_per_user=5)
+        holder = await controller.acquire("busy")
+        order = []
+
+        async def request(user: str) -> None:
+            ticket = await controller.acquire(user)
+            order.append(user)
+            ticket.release()
+
+        tasks = [asyncio.create_task(request(user)) for user in ("heavy", "heavy", "heavy", "light")]
+        await asyncio.sleep(0)
+        holder.release()
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=1)
+        self.assertEqual(order, ["heavy", "light", "heavy", "heavy"])
+
+    async def test_rejects_with_status_codes(self) -> None:
+        controller = AdmissionController(1, max_queue=2, max_queue_per_user=1)
+        holder = await controller.acquire("u1")
+        pending = asyncio.create_task(controller.acquire("u2"))
+        await asyncio.sleep(0)
+        with self.assertRaises(AdmissionRejected) as user_full:
+            await controller.acquire("u2")
+        self.assertEqual(user_full.exception.reason, REJECT_USER_QUEUE_FULL)
+        self.assertEqual(user_full.exception.status_code, 429)
+        other = asyncio.create_task(controller.acquire("u3"))
+        await asyncio.sleep(0)
+        with self.assertRaises(AdmissionRejected) as queue_full:
+            await controller.acquire("u4")
+        self.assertEqual(queue_full.exception.reason, REJECT_QUEUE_FULL)
+        self.assertEqual(queue_full.exception.status_code, 503)
+        self.assertGreaterEqual(queue_full.exception.retry_after_sec, 1)
+        for task in (pending, other):
+            task.cancel()
+        await asyncio.gather(pending, other, return_exceptions=True)
+        self.assertEqual(controller.waiting, 0)
+        holder.release()
+
+    async def test_queue_timeout(self) -> None:
+        controller = AdmissionController(1, queue_timeout_sec=0.01)
+        holder = await controller.acquire("u1")
+        with self.assertRaises(AdmissionRejected) as ctx:
+            await controller.acquire("u2")
+        self.assertEqual(ctx.exception.reason, REJECT_TIMEOUT)
+        self.assertEqual(controller.waiting, 0)
+        holder.release()
+
+    async def test_dropped_ticket_is_released(self) -> None:
+        controller = AdmissionController(1)
+        await controller.acquire("u1")
+        self.assertEqual(controller.active, 0)
+
+    async def test_handed_off_ticket_survives_block(self) -> None:
+        controller = AdmissionController(1)
+        ticket = await controller.acquire("u1")
+        async with ticket:
+            ticket.hand_off()
+        self.assertEqual(controller.active, 1)
+        ticket.release()
+        self.assertEqual(controller.active, 0)
+
+    async def test_dynamic_capacity(self) -> None:
+        capacity = {"value": 1}
+        controller = AdmissionController(lambda: capacity["value"])
+        holder = await controller.acquire("u1")
+        waiter = asyncio.create_task(controller.acquire("u2"))
+        await asyncio.sleep(0)
+        capacity["value"] = 2
+        third = asyncio.create_task(controller.acquire("u3"))
+        await asyncio.wait_for(waiter, timeout=1)
+        self.assertFalse(third.done())
+        third.cancel()
+        await asyncio.gather(third, return_exceptions=True)
+        holder.release()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import unittest
+
+from app.audit_log import AUDIT_COLUMNS, AuditEntry, AuditLogWriter
+
+
+class _RecordingWriter:
+    def __init__(self, fail: bool = False) -> None:
+        self.batches = []
+        self.fail = fail
+
+    async def __call__(self, rows) -> None:
+        if self.fail:
+            raise RuntimeError("db down")
+        self.batches.append(list(rows))
+
+
+class AuditEntryTests(unittest.TestCase):
+    def test_row_masks_secrets_and_matches_columns(self) -> None:
+        row = AuditEntry(
+            trace_id="t1",
+            status_code=200,
+            request_json={"message": "hi", "token": "abc"},
+        ).to_row(max_payload_bytes=4096)
+        self.assertEqual(len(row), len(AUDIT_COLUMNS))
+        request = json.loads(row[AUDIT_COLUMNS.index("request_json")])
+        self.assertEqual(request, {"message": "hi", "token": "***MASKED***"})
+        self.assertEqual(row[AUDIT_COLUMNS.index("tool_calls_json")], "[]")
+
+    def test_oversized_payload_is_truncated(self) -> None:
+        row = AuditEntry(response_json={"text": "景" * 2000}).to_row(max_payload_bytes=512)
+        response = json.loads(row[AUDIT_COLUMNS.index("response_json")])
+        self.assertTrue(response["truncated"])
+        self.assertGreater(response["original_bytes"], 512)
+        self.assertLessEqual(len(response["preview"].encode("utf-8")), 512)
+
+
+class AuditLogWriterTests(unittest.IsolatedAsyncioTestCase):
+    async def test_flushes_in_batches_in_submit_order(self) -> None:
+        writer_fn = _RecordingWriter()
+        writer = AuditLogWriter(writer_fn, batch_size=2, flush_interval_ms=1000)
+        for index in range(5):
+            writer.submit(AuditEntry(trace_id=f"t{index}", status_code=200))
+        await writer.stop()
+        self.assertEqual([len(batch) for batch in writer_fn.batches], [2, 2, 1])
+        self.assertEqual([row[0] for batch in writer_fn.batches for row in batch], [f"t{i}" for i in range(5)])
+
+    async def test_full_queue_drops_oldest(self) -> None:
+        writer_fn = _RecordingWriter()
+        writer = AuditLogWriter(writer_fn, max_queue_size=2, batch_size=10)
+        for index in range(4):
+            writer.submit(AuditEntry(trace_id=f"t{index}"))
+        self.assertEqual(writer.queue_depth, 2)
+        await writer.stop()
+        self.assertEqual([row[0] for row in writer_fn.batches[0]], ["t2", "t3"])
+
+    async def test_sampling_always_keeps_errors(self) -> None:
+        writer = AuditLogWriter(_RecordingWriter(), sample_rate=0.0)
+        self.assertFalse(writer.submit(AuditEntry(status_code=200)))
+        self.assertTrue(writer.submit(AuditEntry(status_code=502)))
+        self.assertTrue(writer.submit(AuditEntry(status_code=200, error_text="boom")))
+        self.assertEqual(writer.queue_depth, 2)
+
+    async def test_background_flusher_writes_on_batch_size(self) -> None:
+        writer_fn = _RecordingWriter()
+        writer = AuditLogWriter(writer_fn, batch_size=3, flush_interval_ms=60000)
+        writer.start()
+        for index in range(3):
+            writer.submit(AuditEntry(trace_id=f"t{index}"))
+        for _ in range(20):
+            if writer_fn.batches:
+                break
+            await asyncio.sleep(0.01)
+        await writer.stop()
+        self.assertEqual(len(writer_fn.batches), 1)
+        self.assertEqual(len(writer_fn.batches[0]), 3)
+
+    async def test_write_failure_does_not_raise(self) -> None:
+        writer = AuditLogWriter(_RecordingWriter(fail=True))
+        writer.submit(AuditEntry(trace_id="t1"))
+        self.assertEqual(await writer.flush(), 0)
+        self.assertEqual(writer.queue_depth, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
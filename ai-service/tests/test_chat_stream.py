@@ -0,0 +1,245 @@
+"""/api/chat 串流事件順序。"""
+from __future__ import annotations
+
+import asyncio
+import json
+import unittest
+from typing import Any, Dict, List, Optional
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+
+from app import main
+from app.context_stages import StageOutcome
+
+
+class _FakeStream:
+    def __init__(self, tokens: List[str], delay_sec: float = 0.0, fail_after_tokens: bool = False) -> None:
+        self.status_code = 200
+        self.text = ""
+        self.tokens = tokens
+        self.delay_sec = delay_sec
+        self.fail_after_tokens = fail_after_tokens
+        self.closed = False
+
+    async def chunks(self):
+        for token in self.tokens:
+            await asyncio.sleep(self.delay_sec)
+            yield {"message": {"content": token}, "done": False}
+        if self.fail_after_tokens:
+            raise httpx.ReadError("connection reset")
+        yield {"message": {"content": ""}, "done": True}
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+def _outcomes(rag_items: List[Dict[str, Any]], videos: List[Dict[str, Any]]) -> Dict[str, StageOutcome]:
+    values = {
+        "rag": rag_items,
+        "user_snapshot": None,
+        "profile_context": "",
+        "ai_settings": {},
+        "preference_hits": [],
+        "recommended_videos": videos,
+    }
+    return {name: StageOutcome(name=name, value=value, status="ok", duration_ms=1) for name, value in values.items()}
+
+
+class _FakeRequest:
+    def __init__(self, disconnect_after_first_token: bool = False) -> None:
+        self.disconnected = False
+        self.disconnect_after_first_token = disconnect_after_first_token
+
+    async def is_disconnected(self) -> bool:
+        return self.disconnected
+
+
+def _parse_events(body: str) -> List[Dict[str, Any]]:
+    return [json.loads(block[len("data: "):]) for block in body.split("\n\n") if block.startswith("data: ")]
+
+
+class ChatStreamEventTests(unittest.IsolatedAsyncioTestCase):
+    async def _run_chat(
+        self,
+        stream: _FakeStream,
+        resolved: Dict[str, Any],
+        plan=None,
+        request: Optional[_FakeRequest] = None,
+        audit: Optional[MagicMock] = None,
+        open_stream: Optional[AsyncMock] = None,
+        resolve: Optional[AsyncMock] = None,
+    ) -> List[Dict[str, Any]]:
+        request = request or _FakeRequest()
+        rag_items = [{"id": 7, "video_id": 3, "video_title": "台南一日遊", "city": "台南", "start_sec": 60, "end_sec": 90, "summary": "赤崁樓"}]
+        videos = [{"youtube_id": "abc", "title": "台南美食"}]
+        payload = main.ChatRequest(message="台南有什麼好吃的", user_id=1, session_id="s1", stream=True)
+        with patch.object(main, "require_internal_caller"), patch.object(
+            main, "maybe_extract_and_store_preferences"
+        ), patch.object(main, "run_context_stages", AsyncMock(return_value=_outcomes(rag_items, videos))), patch.object(
+            main, "resolve_tool_context", resolve or AsyncMock(return_value=resolved)
+        ), patch.object(main.LLM_POOL, "open_stream", open_stream or AsyncMock(return_value=stream)), patch.object(
+            main, "build_chat_itinerary_plan_if_applicable", plan or AsyncMock(return_value=None)
+        ), patch.object(main, "write_audit_log", audit or MagicMock()), patch.object(main, "CHAT_DISCONNECT_POLL_SEC", 0.01):
+            response = await main.chat(payload, request)
+            body = ""
+            async for part in response.body_iterator:
+                body += part if isinstance(part, str) else part.decode("utf-8")
+                if request.disconnect_after_first_token and '"token"' in body:
+                    request.disconnected = True
+        return _parse_events(body)
+
+    async def test_context_event_precedes_tokens(self) -> None:
+        stream = _FakeStream(["台南", "必吃"])
+        events = await self._run_chat(stream, {"messages": [], "tool_calls_summary": [], "youtube_tool_videos": []})
+        self.assertEqual(events[0]["type"], "context")
+        self.assertEqual(events[0]["recommended_videos"][0]["youtube_id"], "abc")
+        self.assertEqual(events[0]["rag_sources"][0]["segment_id"], 7)
+        self.assertEqual("".join(event["token"] for event in events if "token" in event), "台南必吃")
+        self.assertTrue(events[-1]["done"])
+        self.assertTrue(stream.closed)
+        self.assertEqual(main.LLM_ADMISSION.active, 0)
+
+    async def test_tool_results_follow_in_second_context_event(self) -> None:
+        summary = [{"tool": "get_weather", "ok": True}]
+        resolved = {
+            "messages": [],
+            "used_tools": True,
+            "tool_calls_summary": summary,
+            "youtube_tool_videos": [{"youtube_id": "tool-1", "title": "工具影片"}],
+        }
+        events = await self._run_chat(_FakeStream(["好"]), resolved)
+        self.assertEqual(events[1]["type"], "context")
+        self.assertEqual(events[1]["tool_calls_summary"], summary)
+        self.assertEqual(events[1]["recommended_videos"][0]["youtube_id"], "tool-1")
+        self.assertEqual(events[2], {"token": "好"})
+
+    async def test_itinerary_plan_ready_mid_stream_is_sent_early(self) -> None:
+        plan = {"days": [{"day": 1}]}
+        events = await self._run_chat(
+            _FakeStream(["a", "b", "c"]),
+            {"messages": [], "tool_calls_summary": [], "youtube_tool_videos": []},
+            plan=AsyncMock(return_value=plan),
+        )
+        plan_events = [index for index, event in enumerate(events) if event.get("type") == "itinerary_plan"]
+        self.assertEqual(len(plan_events), 1)
+        self.assertLess(plan_events[0], len(events) - 1)
+        self.assertNotIn("itinerary_plan", events[-1])
+
+    async def test_slow_itinerary_plan_is_attached_to_done(self) -> None:
+        plan = {"days": [{"day": 1}]}
+
+        async def slow_plan(*_args):
+            await asyncio.sleep(0.05)
+            return plan
+
+        events = await self._run_chat(
+            _FakeStream(["a"]),
+            {"messages": [], "tool_calls_summary": [], "youtube_tool_videos": []},
+            plan=slow_plan,
+        )
+        self.assertTrue(events[-1]["done"])
+        self.assertEqual(events[-1]["itinerary_plan"], plan)
+
+    async def test_client_disconnect_aborts_upstream_and_audits_cancelled(self) -> None:
+        stream = _FakeStream(["一", "二", "三", "四"], delay_sec=0.05)
+        request = _FakeRequest(disconnect_after_first_token=True)
+        audit = MagicMock()
+        events = await self._run_chat(
+            stream,
+            {"messages": [], "tool_calls_summary": [], "youtube_tool_videos": []},
+            request=request,
+            audit=audit,
+        )
+        self.assertFalse(any(event.get("done") for event in events))
+        self.assertTrue(stream.closed)
+        self.assertEqual(main.LLM_ADMISSION.active, 0)
+        audit_kwargs = audit.call_args.kwargs
+        self.assertEqual(audit_kwargs["status_code"], 499)
+        self.assertEqual(audit_kwargs["response_json"]["outcome"], "cancelled")
+        self.assertEqual(audit_kwargs["response_json"]["phase"], "generating")
+        self.assertGreaterEqual(audit_kwargs["response_json"]["completion_tokens"], 1)
+        task = asyncio.current_task()
+        self.assertEqual(task.cancelling(), 0)
+
+    async def _assert_stream_error(self, events: List[Dict[str, Any]], audit: MagicMock) -> None:
+        self.assertEqual(events[0]["type"], "context")
+        self.assertTrue(events[-1]["error"].startswith("ollama error"))
+        self.assertFalse(any(event.get("done") for event in events))
+        self.assertEqual(audit.call_args.kwargs["status_code"], 502)
+        self.assertEqual(main.LLM_ADMISSION.active, 0)
+
+    async def test_unreachable_backends_end_stream_with_error_event(self) -> None:
+        audit = MagicMock()
+        events = await self._run_chat(
+            _FakeStream([]),
+            {"messages": [], "tool_calls_summary": [], "youtube_tool_videos": []},
+            audit=audit,
+            open_stream=AsyncMock(side_effect=httpx.ConnectError("refused")),
+        )
+        await self._assert_stream_error(events, audit)
+
+    async def test_tool_planning_failure_ends_stream_with_error_event(self) -> None:
+        audit = MagicMock()
+        events = await self._run_chat(
+            _FakeStream(["x"]),
+            {},
+            audit=audit,
+            resolve=AsyncMock(side_effect=httpx.ReadTimeout("planner timed out")),
+        )
+        await self._assert_stream_error(events, audit)
+
+    async def test_upstream_read_error_mid_stream_keeps_partial_reply(self) -> None:
+        audit = MagicMock()
+        stream = _FakeStream(["台南"], fail_after_tokens=True)
+        events = await self._run_chat(
+            stream, {"messages": [], "tool_calls_summary": [], "youtube_tool_videos": []}, audit=audit
+        )
+        await self._assert_stream_error(events, audit)
+        self.assertEqual("".join(event.get("token", "") for event in events), "台南")
+        self.assertEqual(audit.call_args.kwargs["response_json"]["reply_length"], 2)
+        self.assertTrue(stream.closed)
+
+
+class ChatNonStreamTests(unittest.IsolatedAsyncioTestCase):
+    async def test_llm_error_cancels_pending_itinerary_plan(self) -> None:
+        async def slow_plan(*_args):
+            await asyncio.sleep(10)
+
+        plan_tasks: List[asyncio.Task] = []
+        start_plan = main.start_itinerary_plan
+
+        def tracked_start(*args):
+            task = start_plan(*args)
+            plan_tasks.append(task)
+            return task
+
+        payload = main.ChatRequest(message="台南有什麼好吃的", user_id=1, session_id="s1", stream=False)
+        with patch.object(main, "require_internal_caller"), patch.object(
+            main, "maybe_extract_and_store_preferences"
+        ), patch.object(main, "run_context_stages", AsyncMock(return_value=_outcomes([], []))), patch.object(
+            main, "resolve_tool_context", AsyncMock(return_value={"messages": [], "tool_calls_summary": []})
+        ), patch.object(
+            main.LLM_POOL, "chat", AsyncMock(return_value=httpx.Response(503, text="busy"))
+        ), patch.object(main, "build_chat_itinerary_plan_if_applicable", slow_plan), patch.object(
+            main, "start_itinerary_plan", tracked_start
+        ), patch.object(main, "write_audit_log", MagicMock()):
+            with self.assertRaises(main.HTTPException) as ctx:
+                await main.chat(payload, _FakeRequest())
+        self.assertEqual(ctx.exception.status_code, 502)
+        self.assertEqual(len(plan_tasks), 1)
+        with self.assertRaises(asyncio.CancelledError):
+            await plan_tasks[0]
+        self.assertEqual(main.LLM_ADMISSION.active, 0)
+
+
+class RagSourcesTests(unittest.TestCase):
+    def test_sources_follow_rag_context_numbering(self) -> None:
+        sources = main.build_rag_sources([{"id": 1, "summary": "x" * 300}, {"id": 2}], limit=1)
+        self.assertEqual(len(sources), 1)
+        self.assertEqual(sources[0]["ref"], 1)
+        self.assertEqual(len(sources[0]["summary"]), 160)
+
+
+if __name__ == "__main__":
+    unittest.main()
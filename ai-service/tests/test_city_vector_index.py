@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import unittest
+
+from app.city_vector_index import (
+    CITY_INDEX_PREFIX,
+    CityVectorIndexPlanner,
+    city_index_ddl,
+    city_index_name,
+    plan_city_indexes,
+)
+from app.hybrid_search import build_hybrid_search_sql
+
+
+class CityIndexNameTests(unittest.TestCase):
+    def test_name_is_ascii_stable_and_short(self) -> None:
+        name = city_index_name("台南")
+        self.assertEqual(name, city_index_name(" 台南 "))
+        self.assertNotEqual(name, city_index_name("台北"))
+        self.assertTrue(name.startswith(CITY_INDEX_PREFIX))
+        self.assertTrue(name.isascii())
+        self.assertLessEqual(len(name), 63)
+
+    def test_ddl_predicate_matches_query_literal(self) -> None:
+        ddl = city_index_ddl("台南")
+        self.assertIn("CREATE INDEX CONCURRENTLY IF NOT EXISTS", ddl)
+        self.assertIn("USING hnsw (embedding_vector vector_cosine_ops)", ddl)
+        self.assertIn("city = '台南'", ddl)
+        self.assertNotIn("CONCURRENTLY", city_index_ddl("台南", concurrently=False))
+
+    def test_plan_city_indexes_uses_threshold(self) -> None:
+        counts = {"台北": 50000, "台南": 25000, "花蓮": 900}
+        self.assertEqual(plan_city_indexes(counts, 20000), ["台北", "台南"])
+        self.assertEqual(plan_city_indexes(counts, 100000), [])
+
+
+class CityVectorIndexPlannerTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.loads = 0
+        self.index_names = {city_index_name("台北")}
+
+    async def _loader(self):
+        self.loads += 1
+        return set(self.index_names)
+
+    def _planner(self, **kwargs) -> CityVectorIndexPlanner:
+        return CityVectorIndexPlanner(["台北", "台南"], clock=lambda: self.now, **kwargs)
+
+    async def test_indexed_city_uses_literal_predicate(self) -> None:
+        plan = await self._planner().plan("台北", self._loader)
+        self.assertEqual(plan.plan, "partial_index")
+        self.assertEqual(plan.city_predicate, "AND d.city = '台北'")
+        self.assertEqual(plan.settings, ())
+
+    async def test_unindexed_city_uses_iterative_scan(self) -> None:
+        plan = await self._planner(ef_search=80, max_scan_tuples=5000).plan("台南", self._loader)
+        self.assertEqual(plan.plan, "iterative_scan")
+        self.assertEqual(plan.city_predicate, "AND d.city = %(kw_city)s")
+        self.assertIn(("hnsw.iterative_scan", "strict_order"), plan.settings)
+        self.assertIn(("hnsw.ef_search", "80"), plan.settings)
+        self.assertIn(("hnsw.max_scan_tuples", "5000"), plan.settings)
+
+    async def test_iterative_scan_off_only_raises_ef_search(self) -> None:
+        plan = await self._planner(iterative_scan="off").plan("台南", self._loader)
+        self.assertEqual(plan.settings, (("hnsw.ef_search", "100"),))
+
+    async def test_no_city_uses_global_index(self) -> None:
+        plan = await self._planner().plan(None, self._loader)
+        self.assertEqual(plan.plan, "global")
+        self.assertEqual(plan.city_predicate, "")
+        self.assertEqual(self.loads, 0)
+
+    async def test_index_names_are_cached_until_refresh(self) -> None:
+        planner = self._planner(refresh_sec=60)
+        await planner.plan("台南", self._loader)
+        self.index_names.add(city_index_name("台南"))
+        self.assertEqual((await planner.plan("台南", self._loader)).plan, "iterative_scan")
+        self.now = 61.0
+        self.assertEqual((await planner.plan("台南", self._loader)).plan, "partial_index")
+        self.assertEqual(self.loads, 2)
+
+    async def test_loader_failure_keeps_previous_state(self) -> None:
+        planner = self._planner(refresh_sec=1)
+        await planner.plan("台北", self._loader)
+
+        async def failing_loader():
+            raise RuntimeError("db down")
+
+        self.now = 5.0
+        plan = await planner.plan("台北", failing_loader)
+        self.assertEqual(plan.plan, "partial_index")
+
+
+class HybridDensePredicateTests(unittest.TestCase):
+    def test_dense_predicate_override_keeps_sparse_city_param(self) -> None:
+        sql, params = build_hybrid_search_sql(
+            "d.segment_id",
+            "[0.1]",
+            ["夜市"],
+            "夜市",
+            "台北",
+            rrf_k=60,
+            vector_top_k=20,
+            keyword_top_k=20,
+            vector_weight=1.0,
+            keyword_weight=1.0,
+            limit=10,
+            dense_city_predicate="AND d.city = '台北'",
+        )
+        dense_cte = sql.split("dense AS")[0]
+        self.assertIn("AND d.city = '台北'", dense_cte)
+        self.assertNotIn("%(kw_city)s", dense_cte)
+        self.assertEqual(params["kw_city"], "台北")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import unittest
+from unittest.mock import patch
+
+from app.config import env_bool, env_float, env_int, get_env
+
+
+class EnvHelperTests(unittest.TestCase):
+    def test_empty_value_uses_default(self) -> None:
+        with patch.dict("os.environ", {"AIYO_TEST_VALUE": ""}):
+            self.assertEqual(get_env("AIYO_TEST_VALUE", "x"), "x")
+            self.assertEqual(env_int("AIYO_TEST_VALUE", 3), 3)
+            self.assertTrue(env_bool("AIYO_TEST_VALUE", True))
+
+    def test_invalid_number_uses_default(self) -> None:
+        with patch.dict("os.environ", {"AIYO_TEST_VALUE": "abc"}):
+            self.assertEqual(env_int("AIYO_TEST_VALUE", 3), 3)
+            self.assertEqual(env_float("AIYO_TEST_VALUE", 0.5), 0.5)
+            self.assertFalse(env_bool("AIYO_TEST_VALUE", True))
+
+    def test_parses_values(self) -> None:
+        with patch.dict("os.environ", {"AIYO_TEST_INT": "7", "AIYO_TEST_FLOAT": "1.5", "AIYO_TEST_BOOL": "TRUE"}):
+            self.assertEqual(env_int("AIYO_TEST_INT", 0), 7)
+            self.assertEqual(env_float("AIYO_TEST_FLOAT", 0.0), 1.5)
+            self.assertTrue(env_bool("AIYO_TEST_BOOL", False))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from app.context_stages import (
+    STAGE_ERROR,
+    STAGE_OK,
+    STAGE_TIMEOUT,
+    ContextStage,
+    run_context_stages,
+    stage_timings,
+)
+
+
+def _sleep_then(value, delay: float):
+    async def _run(_deps):
+        await asyncio.sleep(delay)
+        return value
+
+    return _run
+
+
+class RunContextStagesTests(unittest.IsolatedAsyncioTestCase):
+    async def test_independent_stages_run_concurrently(self) -> None:
+        stages = [
+            ContextStage(name=f"s{i}", run=_sleep_then(i, 0.1), timeout_sec=1.0, default_factory=int)
+            for i in range(4)
+        ]
+        started = time.monotonic()
+        outcomes = await run_context_stages(stages)
+        elapsed = time.monotonic() - started
+        self.assertLess(elapsed, 0.3)
+        self.assertEqual([outcomes[f"s{i}"].value for i in range(4)], [0, 1, 2, 3])
+        self.assertTrue(all(o.status == STAGE_OK for o in outcomes.values()))
+
+    async def test_slow_stage_degrades_to_default(self) -> None:
+        stages = [
+            ContextStage(name="fast", run=_sleep_then(["a"], 0.0), timeout_sec=1.0, default_factory=list),
+            ContextStage(name="slow", run=_sleep_then(["b"], 1.0), timeout_sec=0.05, default_factory=list),
+        ]
+        outcomes = await run_context_stages(stages)
+        self.assertEqual(outcomes["fast"].value, ["a"])
+        self.assertEqual(outcomes["slow"].value, [])
+        self.assertEqual(outcomes["slow"].status, STAGE_TIMEOUT)
+        self.assertEqual(stage_timings(outcomes)["slow"]["status"], STAGE_TIMEOUT)
+
+    async def test_failing_stage_degrades_and_dependents_receive_default(self) -> None:
+        async def boom(_deps):
+            raise RuntimeError("db down")
+
+        async def dependent(deps):
+            return {"settings": deps["settings"]}
+
+        stages = [
+            ContextStage(name="settings", run=boom, timeout_sec=1.0, default_factory=dict),
+            ContextStage(name="uses_settings", run=dependent, timeout_sec=1.0, depends_on=("settings",)),
+        ]
+        outcomes = await run_context_stages(stages)
+        self.assertEqual(outcomes["settings"].status, STAGE_ERROR)
+        self.assertEqual(outcomes["uses_settings"].value, {"settings": {}})
+
+    async def test_rejects_dependency_on_later_stage(self) -> None:
+        stages = [
+            ContextStage(name="a", run=_sleep_then(1, 0), timeout_sec=1.0, depends_on=("b",)),
+            ContextStage(name="b", run=_sleep_then(2, 0), timeout_sec=1.0),
+        ]
+        with self.assertRaises(ValueError):
+            await run_context_stages(stages)
+
+
+
+class ChatContextStagesTests(unittest.IsolatedAsyncioTestCase):
+    async def test_snapshot_timeout_is_not_refetched_by_dependents(self) -> None:
+        from app import main
+
+        calls = []
+
+        async def slow_get(user_id):
+            calls.append(user_id)
+            await asyncio.sleep(1.0)
+
+        payload = main.ChatRequest(message="台南", user_id=1, session_id="s1")
+        with patch.object(main, "CHAT_STAGE_PROFILE_TIMEOUT_SEC", 0.05), patch.object(
+            main.USER_CONTEXT_CACHE, "get", slow_get
+        ):
+            stages = [
+                stage
+                for stage in main.build_chat_context_stages(payload, {}, "台南", None)
+                if stage.name in ("user_snapshot", "profile_context", "ai_settings")
+            ]
+            started = time.monotonic()
+            outcomes = await run_context_stages(stages)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(calls, [1])
+        self.assertEqual(outcomes["user_snapshot"].status, STAGE_TIMEOUT)
+        self.assertEqual(outcomes["user_snapshot"].value.user_id, 1)
+        self.assertEqual(outcomes["profile_context"].value, "")
+        self.assertEqual(outcomes["ai_settings"].value, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
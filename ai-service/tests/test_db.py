@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import unittest
+from contextlib import asynccontextmanager, contextmanager
+from unittest.mock import patch
+
+from app import db
+
+
+class _FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    def execute(self, query, params):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+class _FakeConnection:
+    def __init__(self, rows):
+        self.cursor_obj = _FakeCursor(rows)
+
+    def cursor(self):
+        return self.cursor_obj
+
+
+class _FakePool:
+    def __init__(self, rows, stats=None):
+        self.conn = _FakeConnection(rows)
+        self.checkouts = 0
+        self.stats = stats or {}
+
+    @contextmanager
+    def connection(self):
+        self.checkouts += 1
+        yield self.conn
+
+    def get_stats(self):
+        return dict(self.stats)
+
+
+class _FakeAsyncCursor(_FakeCursor):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_exc):
+        return False
+
+    async def execute(self, query, params):
+        self.executed.append((query, params))
+
+    async def fetchall(self):
+        return list(self.rows)
+
+    async def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+class _FakeAsyncPool:
+    def __init__(self, rows):
+        self.conn = _FakeConnection(rows)
+        self.conn.cursor_obj = _FakeAsyncCursor(rows)
+        self.checkouts = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        self.checkouts += 1
+        yield self.conn
+
+
+class PooledHelperTests(unittest.TestCase):
+    def test_fetch_helpers_borrow_from_shared_pool(self) -> None:
+        pool = _FakePool([{"id": 1}, {"id": 2}])
+        with patch.object(db, "get_pool", return_value=pool):
+            rows = db.fetch_all("SELECT id FROM videos WHERE city = %s", ("台南",))
+            row = db.fetch_one("SELECT id FROM videos LIMIT 1")
+            db.execute("UPDATE videos SET city = %s", ("台南",))
+        self.assertEqual([r["id"] for r in rows], [1, 2])
+        self.assertEqual(row, {"id": 1})
+        self.assertEqual(pool.checkouts, 3)
+        self.assertEqual(pool.conn.cursor_obj.executed[0][1], ("台南",))
+
+    def test_pool_stats_report_in_use_connections(self) -> None:
+        pool = _FakePool([], stats={"pool_size": 5, "pool_available": 2, "requests_waiting": 3})
+        with patch.object(db, "_pool", pool):
+            self.assertEqual(db._pool_stat("in_use"), 3.0)
+            self.assertEqual(db._pool_stat("requests_waiting"), 3.0)
+        with patch.object(db, "_pool", None):
+            self.assertEqual(db._pool_stat("in_use"), 0.0)
+
+
+class AsyncPooledHelperTests(unittest.IsolatedAsyncioTestCase):
+    async def test_async_helpers_borrow_from_async_pool(self) -> None:
+        pool = _FakeAsyncPool([{"id": 7}])
+
+        async def fake_get_async_pool():
+            return pool
+
+        with patch.object(db, "get_async_pool", fake_get_async_pool):
+            rows = await db.afetch_all("SELECT id FROM segments WHERE city = %s", ("高雄",))
+            row = await db.afetch_one("SELECT id FROM segments LIMIT 1")
+            await db.aexecute("DELETE FROM segments WHERE id = %s", (7,))
+        self.assertEqual(rows, [{"id": 7}])
+        self.assertEqual(row, {"id": 7})
+        self.assertEqual(pool.checkouts, 3)
+        self.assertEqual(pool.conn.cursor_obj.executed[-1][1], (7,))
+
+
+class VectorParamTests(unittest.TestCase):
+    def test_falls_back_to_float_list_without_adapter(self) -> None:
+        with patch.object(db, "PGVECTOR_ADAPTER_AVAILABLE", False):
+            self.assertEqual(db.vector_param([1, 0.5, -2]), [1.0, 0.5, -2.0])
+
+    def test_named_vector_param_is_sent_once(self) -> None:
+        from psycopg._queries import PostgresQuery
+        from psycopg.adapt import Transformer
+
+        query = PostgresQuery(Transformer())
+        query.convert(
+            "SELECT %(vector)s::vector AS a ORDER BY x <=> %(vector)s::vector LIMIT %(limit)s",
+            {"vector": db.vector_param([0.1, 0.2]), "limit": 5},
+        )
+        self.assertIn(b"$1::vector AS a ORDER BY x <=> $1::vector", query.query)
+        self.assertEqual(len(query.params or ()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
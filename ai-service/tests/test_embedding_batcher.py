@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from app.embedding_batcher import EmbeddingBatcher
+
+
+class _RecordingSender:
+    def __init__(self, fail: bool = False) -> None:
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, model, texts):
+        self.calls.append((model, list(texts)))
+        await asyncio.sleep(0)
+        if self.fail:
+            return None
+        return [[float(len(text)), float(index)] for index, text in enumerate(texts)]
+
+
+class EmbeddingBatcherTests(unittest.IsolatedAsyncioTestCase):
+    async def test_concurrent_requests_share_one_batch(self) -> None:
+        sender = _RecordingSender()
+        batcher = EmbeddingBatcher(sender, max_batch_size=16, max_wait_ms=20)
+        texts = ["台南", "高雄美食", "花蓮"]
+        vectors = await asyncio.gather(*(batcher.embed("bge-m3", t) for t in texts))
+        self.assertEqual(len(sender.calls), 1)
+        self.assertEqual(sender.calls[0], ("bge-m3", texts))
+        self.assertEqual(vectors, [[2.0, 0.0], [4.0, 1.0], [2.0, 2.0]])
+
+    async def test_full_batch_flushes_without_waiting(self) -> None:
+        sender = _RecordingSender()
+        batcher = EmbeddingBatcher(sender, max_batch_size=2, max_wait_ms=10_000)
+        vectors = await asyncio.wait_for(
+            asyncio.gather(batcher.embed("m", "a"), batcher.embed("m", "bb")),
+            timeout=1.0,
+        )
+        self.assertEqual([v[0] for v in vectors], [1.0, 2.0])
+
+    async def test_models_are_batched_separately(self) -> None:
+        sender = _RecordingSender()
+        batcher = EmbeddingBatcher(sender, max_batch_size=8, max_wait_ms=5)
+        await asyncio.gather(batcher.embed("m1", "a"), batcher.embed("m2", "b"), batcher.embed("m1", "c"))
+        self.assertEqual(sorted(sender.calls), [("m1", ["a", "c"]), ("m2", ["b"])])
+
+    async def test_failed_batch_returns_none_to_every_caller(self) -> None:
+        batcher = EmbeddingBatcher(_RecordingSender(fail=True), max_batch_size=4, max_wait_ms=5)
+        vectors = await asyncio.gather(batcher.embed("m", "a"), batcher.embed("m", "b"))
+        self.assertEqual(vectors, [None, None])
+
+    async def test_queue_overflow_sends_directly(self) -> None:
+        sender = _RecordingSender()
+        batcher = EmbeddingBatcher(sender, max_batch_size=8, max_wait_ms=50, max_queue_depth=1)
+        first = asyncio.ensure_future(batcher.embed("m", "queued"))
+        await asyncio.sleep(0)
+        direct = await batcher.embed("m", "direct")
+        self.assertEqual(sender.calls[0], ("m", ["direct"]))
+        self.assertEqual(direct, [6.0, 0.0])
+        await batcher.drain()
+        self.assertEqual(await first, [6.0, 0.0])
+
+    async def test_overflow_failure_returns_none_like_batched_path(self) -> None:
+        async def broken(model, texts):
+            raise RuntimeError("ollama down")
+
+        batcher = EmbeddingBatcher(broken, max_batch_size=8, max_wait_ms=50, max_queue_depth=1)
+        first = asyncio.ensure_future(batcher.embed("m", "queued"))
+        await asyncio.sleep(0)
+        self.assertIsNone(await batcher.embed("m", "direct"))
+        await batcher.drain()
+        self.assertIsNone(await first)
+
+
+if __name__ == "__main__":
+    unittest.main()
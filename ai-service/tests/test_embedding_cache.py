@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from app.embedding_cache import EmbeddingCache, normalize_embedding_text
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class NormalizeEmbeddingTextTests(unittest.TestCase):
+    def test_collapses_whitespace_and_fullwidth(self) -> None:
+        self.assertEqual(normalize_embedding_text("  台南　 美食 "), "台南 美食")
+        self.assertEqual(normalize_embedding_text("ＡＢＣ"), "ABC")
+
+
+class EmbeddingCacheTests(unittest.IsolatedAsyncioTestCase):
+    async def test_hit_after_first_compute(self) -> None:
+        cache = EmbeddingCache(max_entries=4, ttl_sec=60)
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return [0.1, 0.2]
+
+        first = await cache.get_or_compute("nomic", "台南 美食", compute)
+        second = await cache.get_or_compute("nomic", "台南  美食", compute)
+        self.assertEqual(first, second)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    async def test_model_is_part_of_key(self) -> None:
+        cache = EmbeddingCache()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return [1.0]
+
+        await cache.get_or_compute("a", "x", compute)
+        await cache.get_or_compute("b", "x", compute)
+        self.assertEqual(len(calls), 2)
+
+    async def test_ttl_expiry_and_lru_eviction(self) -> None:
+        clock = _Clock()
+        cache = EmbeddingCache(max_entries=2, ttl_sec=10, clock=clock)
+        calls = []
+
+        def make(value):
+            async def compute():
+                calls.append(value)
+                return [value]
+
+            return compute
+
+        await cache.get_or_compute("m", "a", make(1.0))
+        await cache.get_or_compute("m", "b", make(2.0))
+        await cache.get_or_compute("m", "a", make(9.0))  # hit，a 變為最近使用
+        await cache.get_or_compute("m", "c", make(3.0))  # 淘汰 b
+        await cache.get_or_compute("m", "b", make(4.0))
+        self.assertEqual(calls, [1.0, 2.0, 3.0, 4.0])
+        clock.now = 11
+        self.assertEqual(await cache.get_or_compute("m", "b", make(5.0)), [5.0])
+
+    async def test_concurrent_identical_requests_share_one_call(self) -> None:
+        cache = EmbeddingCache()
+        calls = []
+        release = asyncio.Event()
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return [0.5]
+
+        tasks = [asyncio.create_task(cache.get_or_compute("m", "台南 美食", compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r == [0.5] for r in results))
+        self.assertEqual(cache.stats()["coalesced"], 4)
+
+    async def test_failed_compute_is_not_cached(self) -> None:
+        cache = EmbeddingCache()
+        results = [None, [1.0]]
+
+        async def compute():
+            return results.pop(0)
+
+        self.assertIsNone(await cache.get_or_compute("m", "q", compute))
+        self.assertEqual(await cache.get_or_compute("m", "q", compute), [1.0])
+
+    async def test_exception_propagates_to_waiters(self) -> None:
+        cache = EmbeddingCache()
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            raise RuntimeError("ollama down")
+
+        tasks = [asyncio.create_task(cache.get_or_compute("m", "q", compute)) for _ in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertTrue(all(isinstance(r, RuntimeError) for r in results))
+
+    async def test_waiter_recomputes_when_leader_is_cancelled(self) -> None:
+        cache = EmbeddingCache()
+        release = asyncio.Event()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            if len(calls) == 1:
+                await release.wait()
+            return [2.0]
+
+        leader = asyncio.create_task(cache.get_or_compute("m", "q", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_compute("m", "q", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        self.assertEqual(await waiter, [2.0])
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+from app import http_clients
+from app.http_clients import (
+    UPSTREAM_OLLAMA,
+    UPSTREAM_YOUTUBE,
+    HttpClientRegistry,
+    UpstreamConfig,
+    upstream_client,
+)
+
+
+def _config(**overrides) -> UpstreamConfig:
+    values = {"timeout": httpx.Timeout(5.0), "max_connections": 4, "max_keepalive_connections": 2}
+    values.update(overrides)
+    return UpstreamConfig(**values)
+
+
+class HttpClientRegistryTests(unittest.IsolatedAsyncioTestCase):
+    async def test_registry_reuses_one_client_per_upstream(self) -> None:
+        registry = HttpClientRegistry({UPSTREAM_OLLAMA: _config(), UPSTREAM_YOUTUBE: _config()})
+        first = registry.get(UPSTREAM_OLLAMA)
+        self.assertIs(registry.get(UPSTREAM_OLLAMA), first)
+        self.assertIsNot(registry.get(UPSTREAM_YOUTUBE), first)
+        self.assertEqual(first.timeout, httpx.Timeout(5.0))
+        await registry.aclose()
+        self.assertTrue(first.is_closed)
+
+    async def test_unknown_upstream_raises(self) -> None:
+        registry = HttpClientRegistry({UPSTREAM_OLLAMA: _config()})
+        with self.assertRaises(KeyError):
+            registry.get("nope")
+
+    async def test_upstream_client_prefers_injected_registry(self) -> None:
+        registry = HttpClientRegistry({UPSTREAM_YOUTUBE: _config()})
+        async with upstream_client(UPSTREAM_YOUTUBE, registry) as client:
+            self.assertIs(client, registry.get(UPSTREAM_YOUTUBE))
+        self.assertFalse(client.is_closed)
+        await registry.aclose()
+
+    async def test_upstream_client_without_registry_is_ephemeral(self) -> None:
+        with patch.object(http_clients, "_registry", None):
+            async with upstream_client(UPSTREAM_YOUTUBE) as client:
+                self.assertFalse(client.is_closed)
+        self.assertTrue(client.is_closed)
+
+    async def test_open_and_close_shared_registry(self) -> None:
+        with patch.object(http_clients, "_registry", None):
+            registry = http_clients.open_http_clients()
+            self.assertIs(http_clients.open_http_clients(), registry)
+            async with upstream_client(UPSTREAM_OLLAMA) as client:
+                self.assertIs(client, registry.get(UPSTREAM_OLLAMA))
+            await http_clients.close_http_clients()
+            self.assertIsNone(http_clients.get_http_clients())
+            self.assertTrue(client.is_closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import random
+import unittest
+
+from app.hybrid_search import build_hybrid_search_sql, hybrid_mode, strip_hybrid_helpers
+from app.main import reciprocal_rank_fusion
+
+
+def _sql_fusion_order(dense_ids, sparse_ids, k, vector_weight, keyword_weight, limit):
+    """以 Python 重現 SQL 版本的計分與 ORDER BY，用來比對與 reciprocal_rank_fusion 一致。"""
+    dense_rank = {sid: rank for rank, sid in enumerate(dense_ids, start=1)}
+    sparse_rank = {sid: rank for rank, sid in enumerate(sparse_ids, start=1)}
+    fused = []
+    for sid in set(dense_rank) | set(sparse_rank):
+        d = dense_rank.get(sid)
+        sp = sparse_rank.get(sid)
+        score = (vector_weight * (1.0 / (k + d)) if d else 0) + (keyword_weight * (1.0 / (k + sp)) if sp else 0)
+        fused.append((score, d, sp, sid))
+    fused.sort(key=lambda item: (-item[0], item[1] is None, item[1] if item[1] is not None else item[2]))
+    return [item[3] for item in fused[:limit]]
+
+
+class HybridSqlParityTests(unittest.TestCase):
+    def test_sql_ordering_matches_python_fusion(self) -> None:
+        rng = random.Random(7)
+        for _ in range(200):
+            dense_ids = rng.sample(range(40), rng.randint(0, 20))
+            sparse_ids = rng.sample(range(40), rng.randint(0, 20))
+            k = rng.choice([1, 10, 60])
+            weights = rng.choice([(1.0, 1.0), (0.7, 1.3), (2.0, 0.5)])
+            limit = rng.randint(1, 25)
+            expected = [
+                row["id"]
+                for row in reciprocal_rank_fusion(
+                    [{"id": i} for i in dense_ids],
+                    [{"id": i} for i in sparse_ids],
+                    k=k,
+                    final_limit=limit,
+                    vector_weight=weights[0],
+                    keyword_weight=weights[1],
+                )
+            ]
+            self.assertEqual(_sql_fusion_order(dense_ids, sparse_ids, k, *weights, limit), expected)
+
+
+class HybridSqlBuilderTests(unittest.TestCase):
+    def test_builds_single_statement_with_both_legs(self) -> None:
+        sql, params = build_hybrid_search_sql(
+            "d.segment_id AS id",
+            "[0.1,0.2]",
+            ["夜市"],
+            "夜市",
+            "高雄",
+            rrf_k=60,
+            vector_top_k=20,
+            keyword_top_k=15,
+            vector_weight=1.0,
+            keyword_weight=0.5,
+            limit=5,
+        )
+        self.assertIn("FULL OUTER JOIN sparse", sql)
+        self.assertIn("sparse_hits AS (", sql)
+        self.assertIn("AND d.city = %(kw_city)s", sql)
+        self.assertEqual(params["kw_city"], "高雄")
+        self.assertEqual(params["kw_limit"], 15)
+        self.assertEqual(params["hy_keyword_weight"], 0.5)
+
+    def test_without_terms_sparse_leg_is_empty(self) -> None:
+        sql, params = build_hybrid_search_sql(
+            "d.segment_id AS id", "[0.1]", [], "", None,
+            rrf_k=60, vector_top_k=20, keyword_top_k=20, vector_weight=1.0, keyword_weight=1.0, limit=5,
+        )
+        self.assertNotIn("sparse_hits", sql)
+        self.assertNotIn("kw_city", params)
+
+    def test_mode_and_helper_columns(self) -> None:
+        rows = [{"id": 1, "rrf_score": 0.1, "dense_rank": 1, "sparse_rank": None, "dense_count": 3, "sparse_count": 0}]
+        self.assertEqual(hybrid_mode(rows), "pgvector")
+        self.assertEqual(strip_hybrid_helpers(rows), [{"id": 1}])
+        self.assertEqual(hybrid_mode([{"dense_count": 2, "sparse_count": 1}]), "hybrid-rrf")
+        self.assertEqual(hybrid_mode([{"dense_count": 0, "sparse_count": 4}]), "keyword-only")
+
+
+if __name__ == "__main__":
+    unittest.main()
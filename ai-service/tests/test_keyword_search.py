@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import unittest
+
+from app.keyword_search import (
+    bigram_tsquery,
+    build_segment_keyword_search,
+    keyword_params,
+    keyword_phrase,
+    keyword_terms,
+    like_pattern,
+    segment_doc_match_sql,
+)
+
+
+class KeywordTermsTests(unittest.TestCase):
+    def test_splits_on_whitespace_and_cjk_punctuation(self) -> None:
+        self.assertEqual(keyword_terms("台南  美食，夜市、小吃"), ["台南", "美食", "夜市", "小吃"])
+
+    def test_drops_single_characters_and_duplicates(self) -> None:
+        self.assertEqual(keyword_terms("的 台南 台南 a"), ["台南"])
+        self.assertEqual(keyword_terms("湯"), ["湯"])
+        self.assertEqual(keyword_terms("  "), [])
+
+    def test_limits_number_of_terms(self) -> None:
+        self.assertEqual(len(keyword_terms("一一 二二 三三 四四 五五 六六")), 4)
+
+    def test_like_pattern_escapes_wildcards(self) -> None:
+        self.assertEqual(like_pattern("100%_off"), "%100\\%\\_off%")
+
+
+class SegmentKeywordSqlTests(unittest.TestCase):
+    def test_builder_uses_named_params_for_every_term(self) -> None:
+        sql, params = build_segment_keyword_search("d.segment_id", ["台南", "赤崁樓"], "台南 赤崁樓", "台南", 20)
+        self.assertIn("d.summary ILIKE %(kw1)s", sql)
+        self.assertIn("d.place_names ILIKE %(kw0)s", sql)
+        self.assertIn("FROM segment_search_doc d", sql)
+        self.assertIn("AND d.city = %(kw_city)s", sql)
+        self.assertIn("ORDER BY keyword_score DESC", sql)
+        self.assertEqual(params["kw0"], "%台南%")
+        self.assertEqual(params["kw_city"], "台南")
+        self.assertEqual(params["kw_limit"], 20)
+
+    def test_builder_without_city_has_no_city_filter(self) -> None:
+        sql, params = build_segment_keyword_search("d.segment_id", ["夜市"], "夜市", None, 5)
+        self.assertNotIn("kw_city", sql)
+        self.assertNotIn("kw_city", params)
+
+    def test_two_character_terms_use_bigram_index(self) -> None:
+        sql, params = build_segment_keyword_search("d.segment_id", ["台南", "赤崁樓"], "台南 赤崁樓", None, 20)
+        where = sql.split("WHERE", 1)[1]
+        self.assertIn("d.search_bigrams @@ %(kwb0)s::tsquery", where)
+        self.assertNotIn("ILIKE %(kw0)s", where)
+        self.assertIn("d.summary ILIKE %(kw1)s", where)
+        self.assertEqual(params["kwb0"], "'台南'")
+        # 排名仍以 ILIKE 逐欄計分
+        self.assertIn("d.place_names ILIKE %(kw0)s THEN", sql)
+
+    def test_bigram_tsquery_quotes_lexeme(self) -> None:
+        self.assertEqual(bigram_tsquery("A'"), "'a'''")
+        self.assertEqual(bigram_tsquery("a\\"), "'a\\\\'")
+
+    def test_match_terms_override_candidate_filter(self) -> None:
+        sql, params = build_segment_keyword_search(
+            "d.segment_id", ["台南", "夜市"], "台南 夜市", None, 20, match_terms=[keyword_phrase(" 台南  夜市 ")]
+        )
+        where = sql.split("WHERE", 1)[1]
+        self.assertIn("d.summary ILIKE %(km0)s", where)
+        self.assertNotIn("kwb0", where)
+        self.assertEqual(params["km0"], "%台南 夜市%")
+
+    def test_match_without_terms_matches_nothing(self) -> None:
+        self.assertEqual(segment_doc_match_sql([]), ("FALSE", {}))
+        self.assertEqual(keyword_params([], "  x ")["kw_query"], "x")
+
+
+if __name__ == "__main__":
+    unittest.main()
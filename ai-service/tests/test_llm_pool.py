@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import json
+import unittest
+
+import httpx
+
+from app.http_clients import UPSTREAM_OLLAMA
+from app.llm_pool import (
+    PROTOCOL_OLLAMA,
+    PROTOCOL_OPENAI,
+    STRATEGY_EWMA,
+    LlmBackend,
+    LlmPool,
+    from_openai_response,
+    parse_backends,
+    to_openai_request,
+)
+
+
+class _Registry:
+    def __init__(self, handler) -> None:
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        assert name == UPSTREAM_OLLAMA
+        return self.client
+
+
+def _backends(*names: str) -> list:
+    return [LlmBackend(name=name, base_url=f"http://{name}:11434") for name in names]
+
+
+class ParseBackendsTests(unittest.TestCase):
+    def test_defaults_to_ollama_base_url(self) -> None:
+        backends = parse_backends("", "http://localhost:11434/")
+        self.assertEqual(len(backends), 1)
+        self.assertEqual(backends[0].base_url, "http://localhost:11434")
+        self.assertEqual(backends[0].protocol, PROTOCOL_OLLAMA)
+
+    def test_parses_protocols_and_skips_duplicates(self) -> None:
+        backends = parse_backends(
+            "http://a:11434, openai|http://vllm:8000/v1/,http://a:11434,grpc|http://x",
+            "http://localhost:11434",
+            api_key="secret",
+        )
+        self.assertEqual([item.name for item in backends], ["ollama:a:11434", "openai:vllm:8000"])
+        self.assertEqual(backends[1].chat_url, "http://vllm:8000/v1/chat/completions")
+        self.assertEqual(backends[1].headers(), {"Authorization": "Bearer secret"})
+
+
+class OpenAiTranslationTests(unittest.TestCase):
+    def test_request_maps_ollama_options(self) -> None:
+        request = to_openai_request(
+            {
+                "model": "qwen",
+                "messages": [{"role": "user", "content": "hi"}],
+                "format": "json",
+                "options": {"num_predict": 256, "temperature": 0.1, "num_ctx": 4096},
+            }
+        )
+        self.assertEqual(request["max_tokens"], 256)
+        self.assertEqual(request["temperature"], 0.1)
+        self.assertEqual(request["response_format"], {"type": "json_object"})
+        self.assertNotIn("num_ctx", request)
+
+    def test_response_is_normalized_to_ollama_shape(self) -> None:
+        data = from_openai_response({"choices": [{"message": {"role": "assistant", "content": "好"}}]})
+        self.assertEqual(data["message"]["content"], "好")
+        self.assertTrue(data["done"])
+
+
+class PickTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.pool = LlmPool(_backends("a", "b", "c"), session_affinity=False, clock=lambda: self.now)
+
+    def test_least_outstanding(self) -> None:
+        a, b, c = self.pool.backends
+        a.outstanding, b.outstanding, c.outstanding = 3, 1, 2
+        self.assertIs(self.pool.pick(), b)
+
+    def test_ewma_prefers_fast_backend(self) -> None:
+        pool = LlmPool(_backends("a", "b"), strategy=STRATEGY_EWMA, session_affinity=False)
+        a, b = pool.backends
+        a.ewma_sec, b.ewma_sec = 4.0, 1.0
+        a.outstanding, b.outstanding = 0, 2
+        self.assertIs(pool.pick(), b)
+
+    def test_session_affinity_is_stable_until_overloaded(self) -> None:
+        pool = LlmPool(_backends("a", "b", "c"), affinity_max_skew=2)
+        first = pool.pick("session-1")
+        for _ in range(5):
+            self.assertIs(pool.pick("session-1"), first)
+        first.outstanding = 3
+        self.assertIsNot(pool.pick("session-1"), first)
+
+    def test_backends_at_cap_are_skipped_even_with_affinity(self) -> None:
+        pool = LlmPool(_backends("a", "b", "c"), affinity_max_skew=10, max_outstanding=2)
+        preferred = pool.pick("session-1")
+        preferred.outstanding = 2
+        other = pool.pick("session-1")
+        self.assertIsNot(other, preferred)
+        for backend in pool.backends:
+            backend.outstanding = 2
+        self.assertIs(pool.pick("session-1"), preferred)
+
+    def test_ejects_after_consecutive_failures_and_readmits(self) -> None:
+        pool = LlmPool(_backends("a", "b"), max_failures=2, eject_sec=30, session_affinity=False, clock=lambda: self.now)
+        a, b = pool.backends
+        pool._record_failure(a)
+        pool._record_failure(a)
+        self.assertEqual(pool.healthy_backends(), [b])
+        a.outstanding, b.outstanding = 0, 5
+        self.assertIs(pool.pick(), b)
+        self.now = 31.0
+        self.assertIs(pool.pick(), a)
+
+    def test_all_ejected_still_returns_a_backend(self) -> None:
+        for backend in self.pool.backends:
+            backend.ejected_until = 100.0
+        self.pool.backends[1].ejected_until = 50.0
+        self.assertIs(self.pool.pick(), self.pool.backends[1])
+
+
+class PoolRequestTests(unittest.IsolatedAsyncioTestCase):
+    async def test_chat_retries_on_another_backend_after_connect_error(self) -> None:
+        hosts = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            hosts.append(request.url.host)
+            if request.url.host == "a":
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response(200, json={"message": {"content": "ok"}, "done": True})
+
+        registry = _Registry(handler)
+        pool = LlmPool(_backends("a", "b"), session_affinity=False, http_clients=registry)
+        response = await pool.chat({"model": "m", "messages": []})
+        await registry.client.aclose()
+        self.assertEqual(hosts, ["a", "b"])
+        self.assertEqual(response.json()["message"]["content"], "ok")
+        self.assertEqual(pool.backends[0].consecutive_failures, 1)
+        self.assertEqual(pool.backends[0].outstanding, 0)
+
+    async def test_client_error_is_not_a_health_failure(self) -> None:
+        registry = _Registry(lambda request: httpx.Response(400, text="invalid messages"))
+        pool = LlmPool(_backends("a", "b"), session_affinity=False, http_clients=registry)
+        response = await pool.chat({"model": "m", "messages": []})
+        await registry.client.aclose()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(pool.backends[0].consecutive_failures, 0)
+
+    async def test_missing_model_retries_on_another_backend(self) -> None:
+        hosts = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            hosts.append(request.url.host)
+            if request.url.host == "a":
+                return httpx.Response(404, json={"error": "model 'gemma4:e4b' not found"})
+            return httpx.Response(200, json={"message": {"content": "ok"}, "done": True})
+
+        registry = _Registry(handler)
+        pool = LlmPool(_backends("a", "b"), session_affinity=False, http_clients=registry)
+        response = await pool.chat({"model": "gemma4:e4b", "messages": []})
+        await registry.client.aclose()
+        self.assertEqual(hosts, ["a", "b"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(pool.backends[0].consecutive_failures, 0)
+
+    async def test_unknown_model_cannot_eject_backends(self) -> None:
+        registry = _Registry(lambda request: httpx.Response(404, json={"error": "model 'nope' not found"}))
+        pool = LlmPool(_backends("a", "b"), max_failures=1, session_affinity=False, http_clients=registry)
+        for _ in range(3):
+            response = await pool.chat({"model": "nope", "messages": []})
+            self.assertEqual(response.status_code, 404)
+        await registry.client.aclose()
+        self.assertEqual(len(pool.healthy_backends()), 2)
+
+    async def test_wrong_base_url_404_is_a_health_failure(self) -> None:
+        hosts = []
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            hosts.append(request.url.host)
+            if request.url.host == "a":
+                return httpx.Response(404, text="404 page not found")
+            return httpx.Response(200, json={"message": {"content": "ok"}, "done": True})
+
+        registry = _Registry(handler)
+        pool = LlmPool(_backends("a", "b"), session_affinity=False, http_clients=registry)
+        response = await pool.chat({"model": "m", "messages": []})
+        await registry.client.aclose()
+        self.assertEqual(hosts, ["a", "b"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(pool.backends[0].consecutive_failures, 1)
+
+    async def test_backend_model_alias_replaces_request_model(self) -> None:
+        seen = {}
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen["payload"] = json.loads(request.content)
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+        registry = _Registry(handler)
+        backends = parse_backends("openai|http://vllm:8000/v1|model=google/gemma-3-4b-it", "http://localhost:11434")
+        pool = LlmPool(backends, http_clients=registry)
+        await pool.chat({"model": "gemma4:e4b", "messages": []})
+        await registry.client.aclose()
+        self.assertEqual(seen["payload"]["model"], "google/gemma-3-4b-it")
+
+    async def test_openai_stream_is_translated(self) -> None:
+        events = [
+            {"choices": [{"delta": {"content": "台"}, "finish_reason": None}]},
+            {"choices": [{"delta": {"content": "南"}, "finish_reason": None}]},
+            {"choices": [{"delta": {}, "finish_reason": "stop"}]},
+            {"choices": [], "usage": {"completion_tokens": 2}},
+        ]
+        body = "".join(f"data: {json.dumps(item)}\n\n" for item in events) + "data: [DONE]\n\n"
+        seen = {}
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            seen["path"] = request.url.path
+            seen["payload"] = json.loads(request.content)
+            return httpx.Response(200, text=body)
+
+        registry = _Registry(handler)
+        backend = LlmBackend(name="openai:vllm", base_url="http://vllm:8000/v1", protocol=PROTOCOL_OPENAI)
+        pool = LlmPool([backend], http_clients=registry)
+        stream = await pool.open_stream({"model": "m", "messages": [], "options": {"num_predict": 64}})
+        chunks = [chunk async for chunk in stream.chunks()]
+        await stream.aclose()
+        await registry.client.aclose()
+        self.assertEqual(seen["path"], "/v1/chat/completions")
+        self.assertEqual(seen["payload"]["max_tokens"], 64)
+        self.assertTrue(seen["payload"]["stream"])
+        self.assertEqual("".join(chunk["message"]["content"] for chunk in chunks), "台南")
+        self.assertTrue(chunks[-1]["done"])
+        self.assertEqual(sum(1 for chunk in chunks if chunk["done"]), 1)
+        self.assertEqual(backend.outstanding, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
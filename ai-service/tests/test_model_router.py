@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import os
+import unittest
+from unittest.mock import patch
+
+from app.model_router import (
+    ROLE_EXTRACTOR,
+    ROLE_OUTLINER,
+    ROLE_PLANNER,
+    ROLE_RESPONDER,
+    LLM_ROLE_REQUESTS,
+    ModelRouter,
+    model_router_from_env,
+    track_llm_call,
+)
+
+
+class ModelRouterTests(unittest.TestCase):
+    def test_unconfigured_roles_keep_previous_models(self) -> None:
+        router = ModelRouter("big:7b")
+        self.assertEqual(router.route(ROLE_RESPONDER, "user-pick").model, "user-pick")
+        self.assertEqual(router.route(ROLE_PLANNER, "user-pick").model, "user-pick")
+        self.assertEqual(router.route(ROLE_EXTRACTOR, "user-pick").model, "big:7b")
+        self.assertEqual(router.route(ROLE_OUTLINER).options, {"temperature": 0.3, "num_predict": 1200})
+
+    def test_role_models_override_defaults(self) -> None:
+        router = ModelRouter("big:7b", role_models={ROLE_PLANNER: "small:1.5b", ROLE_EXTRACTOR: "small:3b"})
+        self.assertEqual(router.route(ROLE_PLANNER, "user-pick").model, "small:1.5b")
+        self.assertEqual(router.route(ROLE_EXTRACTOR).model, "small:3b")
+        self.assertEqual(router.route(ROLE_RESPONDER).model, "big:7b")
+
+    def test_from_env_merges_role_options(self) -> None:
+        env = {
+            "OLLAMA_PLANNER_MODEL": "qwen2.5:1.5b",
+            "OLLAMA_PLANNER_OPTIONS": '{"num_ctx": 4096, "temperature": 0}',
+            "OLLAMA_EXTRACTOR_OPTIONS": "not json",
+        }
+        with patch.dict(os.environ, env):
+            router = model_router_from_env("big:7b", {"num_predict": 8192})
+        planner = router.route(ROLE_PLANNER)
+        self.assertEqual(planner.model, "qwen2.5:1.5b")
+        self.assertEqual(planner.options, {"temperature": 0, "num_predict": 800, "num_ctx": 4096})
+        self.assertEqual(router.route(ROLE_EXTRACTOR).options, {"temperature": 0.1, "num_predict": 512})
+        self.assertEqual(router.route(ROLE_RESPONDER).options, {"num_predict": 8192})
+
+    def test_track_llm_call_counts_failures(self) -> None:
+        counter = LLM_ROLE_REQUESTS.labels(role=ROLE_PLANNER, model="m-test", result="error")
+        before = counter._value.get()
+        with track_llm_call(ROLE_PLANNER, "m-test") as call:
+            call.failed()
+        with self.assertRaises(RuntimeError):
+            with track_llm_call(ROLE_PLANNER, "m-test"):
+                raise RuntimeError("boom")
+        self.assertEqual(counter._value.get(), before + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from app.preference_worker import PreferenceExtractionQueue
+
+
+class PreferenceExtractionQueueTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.processed = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.running = 0
+        self.max_running = 0
+
+    async def _process(self, user_id, history) -> None:
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await self.gate.wait()
+            self.processed.append((user_id, list(history)))
+        finally:
+            self.running -= 1
+
+    async def test_only_latest_history_per_user_is_processed(self) -> None:
+        queue = PreferenceExtractionQueue(self._process, concurrency=1)
+        self.gate.clear()
+        queue.submit(1, ["a"])
+        await asyncio.sleep(0.01)
+        # user 1 執行中時再排入兩次，只會處理最後一次
+        queue.submit(1, ["a", "b"])
+        queue.submit(1, ["a", "b", "c"])
+        self.assertEqual(queue.queue_depth, 1)
+        self.gate.set()
+        await asyncio.wait_for(queue.join(), timeout=1)
+        await queue.stop()
+        self.assertEqual(self.processed, [(1, ["a"]), (1, ["a", "b", "c"])])
+
+    async def test_concurrency_is_bounded(self) -> None:
+        queue = PreferenceExtractionQueue(self._process, concurrency=2)
+        self.gate.clear()
+        for user_id in range(5):
+            queue.submit(user_id, [user_id])
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.running, 2)
+        self.gate.set()
+        await asyncio.wait_for(queue.join(), timeout=1)
+        await queue.stop()
+        self.assertEqual(self.max_running, 2)
+        self.assertEqual(sorted(user_id for user_id, _ in self.processed), [0, 1, 2, 3, 4])
+
+    async def test_full_queue_drops_oldest_user(self) -> None:
+        queue = PreferenceExtractionQueue(self._process, concurrency=1, max_pending=2)
+        self.gate.clear()
+        queue.submit(1, [1])
+        await asyncio.sleep(0.01)
+        for user_id in (2, 3, 4):
+            queue.submit(user_id, [user_id])
+        self.gate.set()
+        await asyncio.wait_for(queue.join(), timeout=1)
+        await queue.stop()
+        self.assertEqual([user_id for user_id, _ in self.processed], [1, 3, 4])
+
+    async def test_failure_does_not_stop_worker(self) -> None:
+        async def flaky(user_id, history) -> None:
+            if user_id == 1:
+                raise RuntimeError("ollama down")
+            self.processed.append((user_id, history))
+
+        queue = PreferenceExtractionQueue(flaky, concurrency=1)
+        queue.submit(1, [])
+        queue.submit(2, [])
+        await asyncio.wait_for(queue.join(), timeout=1)
+        await queue.stop()
+        self.assertEqual(self.processed, [(2, [])])
+
+
+if __name__ == "__main__":
+    unittest.main()
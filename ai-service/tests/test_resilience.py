@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import httpx
+
+from app.tools.resilience import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+    hedged_call,
+    is_hedge_attempt,
+    is_retryable_error,
+    reset_circuit_breakers,
+)
+
+
+class RetryableErrorTests(unittest.TestCase):
+    def test_classifies_status_codes(self) -> None:
+        self.assertTrue(is_retryable_error("youtube api error: 503"))
+        self.assertTrue(is_retryable_error("weather api error: 429"))
+        self.assertTrue(is_retryable_error("ReadTimeout"))
+        self.assertFalse(is_retryable_error("youtube api error: 403"))
+        # 舊版以子字串比對 "5"，查無地名的結果也會被重試
+        self.assertFalse(is_retryable_error("geocoding no result for 5F"))
+        self.assertFalse(is_retryable_error(None))
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.breaker = CircuitBreaker(
+            "test-upstream",
+            window_size=10,
+            min_calls=4,
+            failure_rate=0.5,
+            slow_call_sec=2.0,
+            slow_call_rate=0.75,
+            open_sec=30.0,
+            clock=lambda: self.now,
+        )
+
+    def test_opens_on_failure_rate_and_fails_fast(self) -> None:
+        for ok in (True, False, True, False):
+            self.assertTrue(self.breaker.allow())
+            (self.breaker.record_success if ok else self.breaker.record_failure)(0.1)
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertAlmostEqual(self.breaker.retry_after(), 30.0)
+
+    def test_opens_on_slow_calls(self) -> None:
+        for _ in range(4):
+            self.breaker.record_success(3.0)
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+
+    def test_half_open_allows_single_probe(self) -> None:
+        for _ in range(4):
+            self.breaker.record_failure(0.1)
+        self.now = 31.0
+        self.assertEqual(self.breaker.state, STATE_HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success(0.1)
+        self.assertEqual(self.breaker.state, STATE_CLOSED)
+
+    def test_failed_probe_reopens(self) -> None:
+        for _ in range(4):
+            self.breaker.record_failure(0.1)
+        self.now = 31.0
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure(0.1)
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_hedge_delay_uses_p95_after_enough_samples(self) -> None:
+        self.assertIsNone(self.breaker.hedge_delay(min_samples=5))
+        for value in (0.1, 0.2, 0.3, 0.4, 1.0):
+            self.breaker.record_success(value)
+        self.assertEqual(self.breaker.hedge_delay(min_samples=5, min_delay_sec=0.05), 1.0)
+
+
+class HedgedCallTests(unittest.IsolatedAsyncioTestCase):
+    async def test_second_attempt_wins_when_first_is_slow(self) -> None:
+        calls = []
+
+        async def call():
+            hedge = is_hedge_attempt()
+            calls.append(hedge)
+            await asyncio.sleep(0.01 if hedge else 1.0)
+            return {"ok": True, "hedge": hedge}
+
+        result = await asyncio.wait_for(hedged_call(call, 0.02, lambda item: item["ok"]), timeout=0.5)
+        self.assertTrue(result["hedge"])
+        self.assertEqual(calls, [False, True])
+
+    async def test_no_hedge_when_first_is_fast(self) -> None:
+        call = AsyncMock(return_value={"ok": True})
+        await hedged_call(call, 0.5, lambda item: item["ok"])
+        call.assert_awaited_once()
+
+
+class ExecuteWithRetryBreakerTests(unittest.IsolatedAsyncioTestCase):
+    @staticmethod
+    def _cached_handler(cache, loader):
+        async def handler(args, context):
+            return await cache.get_or_load("weather", args, loader)
+
+        return handler
+
+    async def test_open_breaker_returns_degraded_result_without_calling_upstream(self) -> None:
+        from app.tools import agent as agent_module
+        from app.tools.cache import ToolResultCache
+
+        breaker = CircuitBreaker("weather", min_calls=1)
+        breaker.record_failure(0.1)
+        loader = AsyncMock(return_value={"ok": True})
+        handler = self._cached_handler(ToolResultCache({"weather": 60.0}), loader)
+        with patch.object(agent_module, "get_circuit_breaker", return_value=breaker):
+            result = await agent_module._execute_with_retry(handler, {"city": "台南"}, {}, "get_weather")
+        loader.assert_not_awaited()
+        self.assertFalse(result["ok"])
+        self.assertTrue(result["data"]["degraded"])
+
+    async def test_cache_hits_bypass_breaker_and_are_not_recorded(self) -> None:
+        from app.tools import agent as agent_module
+        from app.tools.cache import ToolResultCache
+
+        breaker = CircuitBreaker("weather", min_calls=1)
+        loader = AsyncMock(return_value={"ok": True, "source": "open-meteo"})
+        handler = self._cached_handler(ToolResultCache({"weather": 60.0}), loader)
+        with patch.object(agent_module, "get_circuit_breaker", return_value=breaker):
+            for _ in range(30):
+                await agent_module._execute_with_retry(handler, {"city": "台南"}, {}, "get_weather")
+            self.assertEqual(loader.await_count, 1)
+            self.assertEqual(len(breaker._window), 1)
+            self.assertEqual(len(breaker._latencies), 1)
+            # 上游掛掉時快取中的結果仍可用
+            breaker.record_failure(0.1)
+            self.assertEqual(breaker.state, STATE_OPEN)
+            result = await agent_module._execute_with_retry(handler, {"city": "台南"}, {}, "get_weather")
+        self.assertTrue(result["ok"])
+        self.assertEqual(breaker.state, STATE_OPEN)
+
+    async def test_non_retryable_error_is_not_retried(self) -> None:
+        from app.tools import agent as agent_module
+
+        handler = AsyncMock(return_value={"ok": False, "source": "youtube", "error": "youtube api error: 403"})
+        with patch.object(agent_module, "get_circuit_breaker", return_value=CircuitBreaker("youtube")):
+            result = await agent_module._execute_with_retry(handler, {}, {}, "search_youtube_videos")
+        self.assertEqual(handler.await_count, 1)
+        self.assertEqual(result["error"], "youtube api error: 403")
+
+
+class GeocodeBreakerTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        reset_circuit_breakers()
+
+    def tearDown(self) -> None:
+        reset_circuit_breakers()
+
+    async def test_nominatim_rate_limit_stays_out_of_weather_breaker(self) -> None:
+        from app.http_clients import UPSTREAM_GEOCODE
+        from app.tools import agent as agent_module
+        from app.tools.resilience import get_circuit_breaker
+        from app.tools.weather import get_weather
+
+        def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.host == "nominatim.openstreetmap.org":
+                return httpx.Response(429, text="rate limited")
+            return httpx.Response(200, json={"results": []})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        registry = MagicMock()
+        registry.get.return_value = client
+        weather_breaker = CircuitBreaker("weather", min_calls=1)
+
+        async def weather_handler(args, context):
+            return await get_weather(args["region"], "test-agent", args["region"], "explicit", registry)
+
+        with patch.object(agent_module, "get_circuit_breaker", return_value=weather_breaker):
+            for _ in range(6):
+                result = await agent_module._execute_with_retry(weather_handler, {"region": "熊本"}, {}, "get_weather")
+                self.assertEqual(result["error"], "geocoding no result")
+        await client.aclose()
+        self.assertEqual(weather_breaker.state, STATE_CLOSED)
+        self.assertTrue(all(ok for ok, _ in weather_breaker._window))
+        self.assertEqual(get_circuit_breaker(UPSTREAM_GEOCODE).state, STATE_OPEN)
+
+
+if __name__ == "__main__":
+    unittest.main()
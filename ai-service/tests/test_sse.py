@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import unittest
+from typing import Any, Dict, List
+
+from app.sse import TokenBatch, coalesce_tokens, sse_event
+
+
+async def _chunks(tokens: List[str], delay_sec: float = 0.0, done: Dict[str, Any] = None):
+    for token in tokens:
+        if delay_sec:
+            await asyncio.sleep(delay_sec)
+        yield {"message": {"content": token}, "done": False}
+    yield done or {"message": {"content": ""}, "done": True}
+
+
+async def _collect(stream) -> List[Any]:
+    return [item async for item in stream]
+
+
+class SseEventTests(unittest.TestCase):
+    def test_frame_is_utf8_json(self) -> None:
+        frame = sse_event({"token": "台南"})
+        self.assertTrue(frame.startswith(b"data: "))
+        self.assertTrue(frame.endswith(b"\n\n"))
+        self.assertEqual(json.loads(frame[6:].decode("utf-8")), {"token": "台南"})
+
+
+class CoalesceTokensTests(unittest.IsolatedAsyncioTestCase):
+    async def test_fast_tokens_are_merged_until_max_chars(self) -> None:
+        items = await _collect(coalesce_tokens(_chunks(["ab", "cd", "ef", "g"]), flush_ms=1000, max_chars=4))
+        batches = [item for item in items if isinstance(item, TokenBatch)]
+        self.assertEqual([batch.text for batch in batches], ["abcd", "efg"])
+        self.assertEqual(sum(batch.count for batch in batches), 4)
+        self.assertTrue(items[-1]["done"])
+
+    async def test_window_flushes_while_upstream_is_quiet(self) -> None:
+        async def slow():
+            yield {"message": {"content": "a"}, "done": False}
+            await asyncio.sleep(0.2)
+            yield {"message": {"content": "b"}, "done": True}
+
+        received = []
+        started = asyncio.get_running_loop().time()
+        async for item in coalesce_tokens(slow(), flush_ms=20, max_chars=100):
+            received.append((item, asyncio.get_running_loop().time() - started))
+        first, elapsed = received[0]
+        self.assertEqual(first.text, "a")
+        self.assertLess(elapsed, 0.15)
+        self.assertEqual(received[1][0].text, "b")
+        self.assertTrue(received[2][0]["done"])
+
+    async def test_low_latency_mode_passes_each_token(self) -> None:
+        items = await _collect(coalesce_tokens(_chunks(["a", "b"]), flush_ms=0))
+        self.assertEqual([item.text for item in items if isinstance(item, TokenBatch)], ["a", "b"])
+
+    async def test_error_chunk_flushes_pending_text_first(self) -> None:
+        async def with_error():
+            yield {"message": {"content": "a"}, "done": False}
+            yield {"error": "boom"}
+
+        items = await _collect(coalesce_tokens(with_error(), flush_ms=1000, max_chars=100))
+        self.assertEqual(items[0].text, "a")
+        self.assertEqual(items[1], {"error": "boom"})
+
+    async def test_upstream_exception_propagates(self) -> None:
+        async def broken():
+            yield {"message": {"content": "a"}, "done": False}
+            raise RuntimeError("read failed")
+
+        received: List[Any] = []
+        with self.assertRaises(RuntimeError):
+            async for item in coalesce_tokens(broken(), flush_ms=1000, max_chars=100):
+                received.append(item)
+        # 例外前已累積的文字仍會送出
+        self.assertEqual([item.text for item in received], ["a"])
+
+
+if __name__ == "__main__":
+    unittest.main()
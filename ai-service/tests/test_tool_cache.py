@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from app.tools.cache import ToolResultCache, tool_cache_key
+
+
+class _FakeStore:
+    def __init__(self) -> None:
+        self.rows = {}
+
+    async def get(self, key):
+        return self.rows.get(key)
+
+    async def set(self, key, tool, value, ttl_sec):
+        self.rows[key] = (value, ttl_sec)
+
+
+class ToolResultCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.calls = 0
+
+    def _cache(self, **kwargs) -> ToolResultCache:
+        kwargs.setdefault("ttls", {"weather": 600.0, "geocode": 86400.0})
+        return ToolResultCache(clock=lambda: self.now, **kwargs)
+
+    async def _load(self):
+        self.calls += 1
+        return {"ok": True, "source": "open-meteo", "data": {"call": self.calls}, "error": None}
+
+    def test_key_normalizes_arguments(self) -> None:
+        self.assertEqual(
+            tool_cache_key("travel_search", {"q": "台南  美食", "limit": 5}),
+            tool_cache_key("travel_search", {"limit": 5, "q": " 台南 美食"}),
+        )
+        self.assertNotEqual(
+            tool_cache_key("travel_search", {"q": "台南"}),
+            tool_cache_key("youtube_search", {"q": "台南"}),
+        )
+
+    async def test_hit_within_ttl_and_reload_after_expiry(self) -> None:
+        cache = self._cache()
+        first = await cache.get_or_load("weather", {"lat": 23.0}, self._load)
+        self.assertIs(await cache.get_or_load("weather", {"lat": 23.0}, self._load), first)
+        self.now = 601.0
+        await cache.get_or_load("weather", {"lat": 23.0}, self._load)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(cache.stats()["weather"]["hit"], 1)
+        self.assertAlmostEqual(cache.stats()["weather"]["hit_ratio"], 1 / 3)
+
+    async def test_failures_are_not_cached(self) -> None:
+        cache = self._cache()
+
+        async def failing():
+            self.calls += 1
+            return {"ok": False, "source": "youtube", "error": "youtube api error: 403"}
+
+        for _ in range(2):
+            await cache.get_or_load("weather", {"lat": 1}, failing)
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(len(cache), 0)
+
+    async def test_tool_without_ttl_bypasses_cache(self) -> None:
+        cache = self._cache()
+        await cache.get_or_load("youtube_search", {"q": "x"}, self._load)
+        await cache.get_or_load("youtube_search", {"q": "x"}, self._load)
+        self.assertEqual(self.calls, 2)
+
+    async def test_concurrent_calls_share_one_load(self) -> None:
+        cache = self._cache()
+        gate = asyncio.Event()
+
+        async def slow():
+            self.calls += 1
+            await gate.wait()
+            return "台南市"
+
+        tasks = [asyncio.create_task(cache.get_or_load("geocode", {"region": "台南"}, slow)) for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.set()
+        self.assertEqual(await asyncio.gather(*tasks), ["台南市"] * 3)
+        self.assertEqual(self.calls, 1)
+
+    async def test_persistent_tier_is_shared_between_instances(self) -> None:
+        store = _FakeStore()
+        await self._cache(persistent=store).get_or_load("geocode", {"region": "熊本"}, self._load)
+        other = self._cache(persistent=store)
+        value = await other.get_or_load("geocode", {"region": "熊本"}, self._load)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(value["data"], {"call": 1})
+        self.assertEqual(other.stats()["geocode"]["persistent_hit"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
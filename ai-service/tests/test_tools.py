@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import asyncio
+import time
 import unittest
 from unittest.mock import AsyncMock, patch
 
 from app.tools.agent import extract_tool_calls, get_tool_schemas
+from app.tools.router import ROUTE_DIRECT, ROUTE_LLM, ROUTE_SKIP, extract_transport_endpoints, route_tools
 from app.tools.weather import infer_weather_region
 
 
@@ -75,6 +78,108 @@ class WeatherToolArgumentTests(unittest.TestCase):
         self.assertEqual(_extract_weather_location({"location": {"name": "台南"}}), "台南")
 
 
+ALL_TOOL_FLAGS = {"weather": True, "youtube": True, "transport": True, "travel_info": True}
+
+
+class ToolRouterTests(unittest.TestCase):
+    def test_plain_chat_skips_tools(self) -> None:
+        route = route_tools("幫我安排台南兩天一夜的美食行程", ALL_TOOL_FLAGS)
+        self.assertEqual(route.path, ROUTE_SKIP)
+        self.assertEqual(route.calls, ())
+
+    def test_weather_and_time_run_directly(self) -> None:
+        route = route_tools("現在幾點？今天台北天氣如何", ALL_TOOL_FLAGS)
+        self.assertEqual(route.path, ROUTE_DIRECT)
+        self.assertEqual([call["name"] for call in route.calls], ["get_current_time", "get_weather"])
+
+    def test_weather_flag_off_does_not_route_weather(self) -> None:
+        route = route_tools("今天會下雨嗎", {**ALL_TOOL_FLAGS, "weather": False})
+        self.assertEqual(route.path, ROUTE_SKIP)
+
+    def test_transport_with_endpoints_runs_directly(self) -> None:
+        self.assertEqual(extract_transport_endpoints("從台北到台南怎麼去？"), ("台北", "台南"))
+        route = route_tools("從台北到台南怎麼去？", ALL_TOOL_FLAGS)
+        self.assertEqual(route.path, ROUTE_DIRECT)
+        self.assertEqual(
+            route.calls[0],
+            {"name": "search_transport_options", "arguments": {"departure": "台北", "destination": "台南"}},
+        )
+
+    def test_transport_without_endpoints_falls_back_to_llm(self) -> None:
+        self.assertEqual(route_tools("去墾丁搭什麼交通比較方便", ALL_TOOL_FLAGS).path, ROUTE_LLM)
+
+    def test_search_intent_falls_back_to_llm(self) -> None:
+        route = route_tools("台中這週末有什麼展覽？天氣好嗎", ALL_TOOL_FLAGS)
+        self.assertEqual(route.path, ROUTE_LLM)
+        self.assertEqual(route.calls, ())
+
+    def test_summary_marks_route_entry(self) -> None:
+        summary = route_tools("今天天氣如何", ALL_TOOL_FLAGS).summary()
+        self.assertEqual(summary["kind"], "route")
+        self.assertEqual(summary["route"], ROUTE_DIRECT)
+        self.assertEqual(summary["arguments"], {"planned_tools": ["get_weather"]})
+
+
+class ExecuteToolCallsTests(unittest.IsolatedAsyncioTestCase):
+    async def test_calls_run_concurrently_and_keep_order(self) -> None:
+        from app.tools.agent import execute_tool_calls
+
+        def slow(name: str, delay: float):
+            async def handler(_args, _context):
+                await asyncio.sleep(delay)
+                return {"ok": True, "source": name, "data": {}, "error": None}
+
+            return handler
+
+        executor = {
+            "search_youtube_videos": slow("youtube", 0.1),
+            "search_travel_information": slow("ddg", 0.05),
+            "get_weather": slow("weather", 0.1),
+        }
+        calls = [
+            {"name": "get_weather", "arguments": {}},
+            {"name": "search_youtube_videos", "arguments": {"query": "台南"}},
+            {"name": "search_travel_information", "arguments": {"query": "台南"}},
+        ]
+        started = time.monotonic()
+        results = await execute_tool_calls(calls, executor, {})
+        self.assertLess(time.monotonic() - started, 0.2)
+        self.assertEqual([result["source"] for result in results], ["weather", "youtube", "ddg"])
+
+    async def test_timeout_only_fails_slow_tool(self) -> None:
+        from app.tools.agent import execute_tool_calls
+
+        async def hang(_args, _context):
+            await asyncio.sleep(5)
+
+        async def fast(_args, _context):
+            return {"ok": True, "source": "fast", "data": {}, "error": None}
+
+        results = await execute_tool_calls(
+            [{"name": "search_travel_information", "arguments": {}}, {"name": "search_transport_options", "arguments": {}}],
+            {"search_travel_information": hang, "search_transport_options": fast},
+            {},
+            tool_timeout_sec=0.05,
+        )
+        self.assertFalse(results[0]["ok"])
+        self.assertIn("timeout", results[0]["error"])
+        self.assertTrue(results[1]["ok"])
+
+    async def test_weather_runs_once_and_reuses_shared_result(self) -> None:
+        from app.tools.agent import execute_tool_calls
+
+        weather = AsyncMock(return_value={"ok": True, "source": "open-meteo", "data": {}, "error": None})
+        calls = [{"name": "get_weather", "arguments": {"location": "台北"}}, {"name": "get_weather", "arguments": {}}]
+        results = await execute_tool_calls(calls, {"get_weather": weather}, {})
+        self.assertIs(results[0], results[1])
+        weather.assert_awaited_once()
+
+        cached = {"ok": True, "source": "cached", "data": {}, "error": None}
+        results = await execute_tool_calls(calls[:1], {"get_weather": weather}, {}, shared_results={"get_weather": cached})
+        self.assertIs(results[0], cached)
+        weather.assert_awaited_once()
+
+
 class _FakeResponse:
     def __init__(self, payload, status_code: int = 200) -> None:
         self._payload = payload
@@ -87,8 +192,10 @@ class _FakeResponse:
 class _FakeClient:
     def __init__(self, payloads):
         self._payloads = list(payloads)
+        self.post_count = 0
 
     async def post(self, *_args, **_kwargs):
+        self.post_count += 1
         if not self._payloads:
             return _FakeResponse({"message": {"content": ""}})
         return _FakeResponse(self._payloads.pop(0))
@@ -133,6 +240,7 @@ class ResolveToolContextTests(unittest.IsolatedAsyncioTestCase):
                 tool_flags={"weather": True},
                 max_rounds=3,
                 max_calls_per_round=2,
+                pre_route=False,
             )
 
         self.assertTrue(resolved["used_tools"])
@@ -140,6 +248,78 @@ class ResolveToolContextTests(unittest.IsolatedAsyncioTestCase):
         self.assertTrue(any(item.get("tool") == "get_weather" for item in resolved["tool_calls_summary"]))
         fake_weather_handler.assert_awaited_once()
 
+    def _context(self, message: str) -> dict:
+        return {
+            "last_user_message": message,
+            "default_timezone": "Asia/Taipei",
+            "default_region": None,
+            "user_ai_settings": {},
+            "http_user_agent": "test-agent",
+        }
+
+    async def test_pre_router_skip_makes_no_planner_call(self) -> None:
+        from app.tools import agent as agent_module
+
+        fake_client = _FakeClient([])
+        base_messages = [{"role": "user", "content": "推薦台南的早餐"}]
+        resolved = await agent_module.resolve_tool_context(
+            client=fake_client,
+            ollama_base_url="http://fake-ollama",
+            model="fake-model",
+            base_messages=base_messages,
+            context=self._context("推薦台南的早餐"),
+            tool_flags=ALL_TOOL_FLAGS,
+        )
+        self.assertEqual(fake_client.post_count, 0)
+        self.assertFalse(resolved["used_tools"])
+        self.assertEqual(resolved["messages"], base_messages)
+        self.assertEqual(resolved["tool_calls_summary"][0]["route"], ROUTE_SKIP)
+
+    async def test_pre_router_direct_runs_tool_without_planner(self) -> None:
+        from app.tools import agent as agent_module
+
+        fake_client = _FakeClient([])
+        fake_weather_handler = AsyncMock(
+            return_value={"ok": True, "source": "open-meteo", "data": {"region": "台中"}, "error": None}
+        )
+        with patch.object(
+            agent_module,
+            "build_tool_executor",
+            return_value={"get_weather": fake_weather_handler},
+        ):
+            resolved = await agent_module.resolve_tool_context(
+                client=fake_client,
+                ollama_base_url="http://fake-ollama",
+                model="fake-model",
+                base_messages=[{"role": "user", "content": "今天天氣如何"}],
+                context=self._context("今天天氣如何"),
+                tool_flags=ALL_TOOL_FLAGS,
+            )
+        self.assertEqual(fake_client.post_count, 0)
+        self.assertTrue(resolved["used_tools"])
+        self.assertEqual(resolved["direct_reply"], "")
+        self.assertEqual([item["tool"] for item in resolved["tool_calls_summary"]], ["tool_router", "get_weather"])
+        self.assertIn("open-meteo", resolved["messages"][-1]["content"])
+        fake_weather_handler.assert_awaited_once()
+
+    async def test_custom_trigger_rules_use_llm_planning(self) -> None:
+        from app.tools import agent as agent_module
+
+        fake_client = _FakeClient([{"message": {"content": "好的"}}])
+        context = self._context("推薦台南的早餐")
+        context["tool_policy_json"] = {"tool_trigger_rules": "提到餐廳時先查營業時間"}
+        resolved = await agent_module.resolve_tool_context(
+            client=fake_client,
+            ollama_base_url="http://fake-ollama",
+            model="fake-model",
+            base_messages=[{"role": "user", "content": "推薦台南的早餐"}],
+            context=context,
+            tool_flags=ALL_TOOL_FLAGS,
+        )
+        self.assertEqual(fake_client.post_count, 1)
+        self.assertEqual(resolved["direct_reply"], "好的")
+        self.assertEqual(resolved["tool_calls_summary"][0]["route"], ROUTE_LLM)
+
 
 if __name__ == "__main__":
     unittest.main()
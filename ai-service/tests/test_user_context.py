@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+import unittest
+
+from app.user_context import UserContextCache, UserContextSnapshot, snapshot_from_row
+
+
+class SnapshotFromRowTests(unittest.TestCase):
+    def test_parses_consolidated_row(self) -> None:
+        snapshot = snapshot_from_row(
+            7,
+            {
+                "profile": {"travel_style": "慢活"},
+                "memories": [{"memory_text": "喜歡夜市"}, "bad"],
+                "preferences_json": {"pace": "slow"},
+                "ai_settings": {"current_lat": 22.99},
+                "recent_dialogue": [{"role": "user", "content": "hi"}],
+                "interaction_scores": {"abc": 1.5, " ": 2, "def": "x"},
+            },
+        )
+        self.assertEqual(snapshot.profile, {"travel_style": "慢活"})
+        self.assertEqual(snapshot.memories, [{"memory_text": "喜歡夜市"}])
+        self.assertEqual(snapshot.ai_settings, {"current_lat": 22.99})
+        self.assertEqual(snapshot.interaction_scores, {"abc": 1.5})
+
+    def test_missing_row_gives_empty_snapshot(self) -> None:
+        snapshot = snapshot_from_row(7, None)
+        self.assertIsNone(snapshot.profile)
+        self.assertEqual(snapshot.memories, [])
+        self.assertEqual(snapshot.ai_settings, {})
+
+
+class UserContextCacheTests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self) -> None:
+        self.now = 0.0
+        self.calls = []
+        self.gate = None
+
+    async def _loader(self, user_id: int) -> UserContextSnapshot:
+        self.calls.append(user_id)
+        if self.gate is not None:
+            await self.gate.wait()
+        return UserContextSnapshot(user_id=user_id, profile={"call": len(self.calls)})
+
+    def _cache(self, **kwargs) -> UserContextCache:
+        return UserContextCache(self._loader, clock=lambda: self.now, **kwargs)
+
+    async def test_hit_within_ttl_and_reload_after_expiry(self) -> None:
+        cache = self._cache(ttl_sec=60)
+        first = await cache.get(1)
+        self.assertIs(await cache.get(1), first)
+        self.now = 61.0
+        self.assertIsNot(await cache.get(1), first)
+        self.assertEqual(self.calls, [1, 1])
+
+    async def test_hit_reloads_volatile_parts(self) -> None:
+        volatile_rows = [{"recent_dialogue": [{"role": "user", "content": "新訊息"}], "interaction_scores": {"abc": -1.2}}]
+
+        async def volatile(user_id: int):
+            return volatile_rows.pop(0)
+
+        cache = self._cache(ttl_sec=60, volatile_loader=volatile)
+        await cache.get(1)
+        snapshot = await cache.get(1)
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(snapshot.profile, {"call": 1})
+        self.assertEqual(snapshot.recent_dialogue[0]["content"], "新訊息")
+        self.assertEqual(snapshot.interaction_scores, {"abc": -1.2})
+
+    async def test_volatile_failure_keeps_cached_snapshot(self) -> None:
+        async def volatile(user_id: int):
+            raise RuntimeError("db down")
+
+        cache = self._cache(ttl_sec=60, volatile_loader=volatile)
+        first = await cache.get(1)
+        self.assertIs(await cache.get(1), first)
+
+    async def test_concurrent_gets_share_one_query(self) -> None:
+        cache = self._cache()
+        self.gate = asyncio.Event()
+        tasks = [asyncio.create_task(cache.get(1)) for _ in range(5)]
+        await asyncio.sleep(0)
+        self.gate.set()
+        results = await asyncio.gather(*tasks)
+        self.assertEqual(self.calls, [1])
+        self.assertTrue(all(result is results[0] for result in results))
+
+    async def test_waiter_reloads_when_only_leader_is_cancelled(self) -> None:
+        cache = self._cache()
+        self.gate = asyncio.Event()
+        leader = asyncio.create_task(cache.get(1))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get(1))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        self.gate.set()
+        self.assertEqual((await waiter).user_id, 1)
+        self.assertEqual(self.calls, [1, 1])
+
+    async def test_cancelled_waiter_does_not_reload(self) -> None:
+        cache = self._cache()
+        self.gate = asyncio.Event()
+        leader = asyncio.create_task(cache.get(1))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get(1))
+        await asyncio.sleep(0)
+        # 兩者一起被取消（例如同一個 stage 逾時）：等待者不應吞掉自己的取消再查一次
+        leader.cancel()
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(self.calls, [1])
+
+    async def test_invalidate_drops_entry(self) -> None:
+        cache = self._cache()
+        first = await cache.get(1)
+        cache.invalidate(1)
+        self.assertIsNot(await cache.get(1), first)
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_invalidate_during_load_does_not_cache_stale_result(self) -> None:
+        cache = self._cache()
+        self.gate = asyncio.Event()
+        task = asyncio.create_task(cache.get(1))
+        await asyncio.sleep(0)
+        cache.invalidate(1)
+        self.gate.set()
+        await task
+        self.gate = None
+        self.assertEqual(len(cache), 0)
+        await cache.get(1)
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_lru_bound(self) -> None:
+        cache = self._cache(max_entries=2)
+        for user_id in (1, 2, 3):
+            await cache.get(user_id)
+        self.assertEqual(len(cache), 2)
+        await cache.get(1)
+        self.assertEqual(self.calls, [1, 2, 3, 1])
+
+    async def test_loader_failure_is_not_cached(self) -> None:
+        attempts = []
+
+        async def failing(user_id: int) -> UserContextSnapshot:
+            attempts.append(user_id)
+            raise RuntimeError("db down")
+
+        cache = UserContextCache(failing)
+        with self.assertRaises(RuntimeError):
+            await cache.get(1)
+        with self.assertRaises(RuntimeError):
+            await cache.get(1)
+        self.assertEqual(attempts, [1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
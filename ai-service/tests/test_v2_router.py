@@ -2,9 +2,11 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 import unittest
+from unittest.mock import AsyncMock, patch
 
 from fastapi import HTTPException
 
+from app import v2_router
 from app.v2_router import (
     _ensure_embedding_contract,
     _plan_result_to_contract,
@@ -109,5 +111,20 @@ class EmbeddingContractTests(unittest.TestCase):
         self.assertEqual(ctx.exception.status_code, 422)
 
 
+class PipelineJobTests(unittest.IsolatedAsyncioTestCase):
+    async def test_async_job_creation_uses_async_db(self) -> None:
+        with patch.object(v2_router.db, "afetch_one", AsyncMock(return_value={"id": "job-1"})) as afetch, patch.object(
+            v2_router, "_fetch_one", side_effect=AssertionError("sync DB call on the event loop")
+        ):
+            job_id = await v2_router._acreate_pipeline_job("recommend_videos", "trace-1", {"city": "台南"})
+        self.assertEqual(job_id, "job-1")
+        self.assertIn("v2.pipeline_jobs", afetch.await_args.args[0])
+
+    async def test_async_job_creation_requires_id(self) -> None:
+        with patch.object(v2_router.db, "afetch_one", AsyncMock(return_value=None)):
+            with self.assertRaises(RuntimeError):
+                await v2_router._acreate_pipeline_job("plan_from_intent", "trace-1", {})
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -465,6 +465,7 @@ app.put("/api/user/profile", requireAuth, async (req, res) => {
       Array.isArray(preferredCities) ? JSON.stringify(preferredCities) : null
     ]
   );
+  notifyUserContextChanged(req.user.id);
   res.json({ profile: result.rows[0] });
 });
 
@@ -515,6 +516,7 @@ app.put("/api/user/ai-settings", requireAuth, async (req, res) => {
       typeof autoUseCurrentLocation === "boolean" ? autoUseCurrentLocation : null
     ]
   );
+  notifyUserContextChanged(req.user.id);
   res.json({ settings: result.rows[0] });
 });
 
@@ -538,6 +540,7 @@ app.put("/api/user/location", requireAuth, async (req, res) => {
     `,
     [req.user.id, JSON.stringify(DEFAULT_TOOL_POLICY), normalizedLat, normalizedLng, normalizedRegion]
   );
+  notifyUserContextChanged(req.user.id);
   res.json({ settings: result.rows[0] });
 });
 
@@ -570,6 +573,7 @@ app.post("/api/user/memory", requireAuth, async (req, res) => {
     `,
     [req.user.id, String(memoryType), String(memoryText), Number(confidence) || 0.8, String(source)]
   );
+  notifyUserContextChanged(req.user.id);
   res.status(201).json({ item: result.rows[0] });
 });
 
@@ -801,6 +805,16 @@ app.post("/api/chat", requireAuth, async (req, res) => {
     await setSessionHistory(sessionId, mergedHistory, 3600);
   }
 
+  // Abort the ai-service request when the browser goes away so the model stops generating.
+  const upstreamAbort = new AbortController();
+  let clientClosed = false;
+  res.on("close", () => {
+    if (!res.writableEnded) {
+      clientClosed = true;
+      upstreamAbort.abort();
+    }
+  });
+
   const response = await fetch(`${config.aiServiceUrl}/api/chat`, {
     method: "POST",
     headers: {
@@ -814,14 +828,24 @@ app.post("/api/chat", requireAuth, async (req, res) => {
       session_id: sessionId,
       user_id: req.user.id,
       trace_id: traceId
-    })
+    }),
+    signal: upstreamAbort.signal
+  }).catch((err) => {
+    if (clientClosed) {
+      return null;
+    }
+    throw err;
   });
+  if (!response) {
+    return;
+  }
 
-  if (!response.ok || !response.body) {
+  // Saves and sends the canned reply; the SSE headers may already be out when the error arrives mid-stream.
+  const sendFallbackReply = async (statusCode, errorText, recommendedVideos = []) => {
     const fallbackReply = buildFallbackReply(body.message);
     const fallbackHistory = normalizeChatMessages([...mergedHistory, { role: "assistant", content: fallbackReply }]);
     await saveChatMessage(chatSessionDbId, "assistant", fallbackReply, {
-      recommended_videos: [],
+      recommended_videos: recommendedVideos,
       fallback: true
     });
     await setSessionHistory(sessionId, fallbackHistory, 3600);
@@ -831,33 +855,65 @@ app.post("/api/chat", requireAuth, async (req, res) => {
       sessionId,
       endpoint: "/api/chat",
       method: "POST",
-      statusCode: response.status || 502,
+      statusCode,
       requestJson: { message: body.message, model: body.model },
       responseJson: { fallback: true },
-      errorText: "ai-service unavailable, used fallback reply",
+      errorText,
       durationMs: Date.now() - chatStartMs
     }).catch(() => {});
     if (body.stream === false) {
       res.json({
         reply: fallbackReply,
-        recommended_videos: [],
+        recommended_videos: recommendedVideos,
         fallback: true
       });
       return;
     }
-    res.setHeader("Content-Type", "text/event-stream; charset=utf-8");
-    res.setHeader("Cache-Control", "no-cache, no-transform");
-    res.setHeader("Connection", "keep-alive");
-    res.write(`data: ${JSON.stringify({ token: fallbackReply }, null, 0)}\n\n`);
-    res.write(`data: ${JSON.stringify({ done: true, recommended_videos: [], fallback: true }, null, 0)}\n\n`);
+    if (!res.headersSent) {
+      res.setHeader("Content-Type", "text/event-stream; charset=utf-8");
+      res.setHeader("Cache-Control", "no-cache, no-transform");
+      res.setHeader("Connection", "keep-alive");
+    }
+    const fallbackChunk =
+      `data: ${JSON.stringify({ token: fallbackReply }, null, 0)}\n\n` +
+      `data: ${JSON.stringify({ done: true, recommended_videos: recommendedVideos, fallback: true }, null, 0)}\n\n`;
+    res.write(fallbackChunk);
     if (sessionId) {
       broadcastToSession(sessionId, {
         type: "stream_response",
         sessionId,
-        chunk: `data: ${JSON.stringify({ token: fallbackReply })}\n\ndata: ${JSON.stringify({ done: true, recommended_videos: [], fallback: true })}\n\n`
+        chunk: fallbackChunk
       });
     }
     res.end();
+  };
+
+  // Admission backpressure (429 per-user queue, 503 overloaded) goes back to the client with Retry-After;
+  // a canned 200 reply would hide it and invite an immediate retry.
+  const retryAfter = response.headers.get("retry-after");
+  if (response.status === 429 || (response.status === 503 && retryAfter)) {
+    const data = await response.json().catch(() => ({ error: "llm overloaded" }));
+    insertAuditLog({
+      traceId,
+      userId: req.user.id,
+      sessionId,
+      endpoint: "/api/chat",
+      method: "POST",
+      statusCode: response.status,
+      requestJson: { message: body.message, model: body.model },
+      responseJson: data,
+      errorText: `ai-service admission rejected: ${data.reason || data.error || response.status}`,
+      durationMs: Date.now() - chatStartMs
+    }).catch(() => {});
+    if (retryAfter) {
+      res.setHeader("Retry-After", retryAfter);
+    }
+    res.status(response.status).json(data);
+    return;
+  }
+
+  if (!response.ok || !response.body) {
+    await sendFallbackReply(response.status || 502, "ai-service unavailable, used fallback reply");
     return;
   }
 
@@ -899,6 +955,9 @@ app.post("/api/chat", requireAuth, async (req, res) => {
   const encoder = new TextEncoder();
   let assistantText = "";
   let recommendedVideos = [];
+  let pendingFrames = "";
+  let streamError = "";
+  let usedFallback = false;
 
   try {
     while (true) {
@@ -906,20 +965,68 @@ app.post("/api/chat", requireAuth, async (req, res) => {
       if (done) {
         break;
       }
-      const chunk = decoder.decode(value, { stream: true });
-      assistantText += extractTokenText(chunk);
-      recommendedVideos = mergeRecommendedVideos(recommendedVideos, extractRecommendedVideos(chunk));
+      // Forward whole SSE frames only, so an error frame can be swapped for the fallback reply.
+      pendingFrames += decoder.decode(value, { stream: true });
+      const frames = pendingFrames.split("\n\n");
+      pendingFrames = frames.pop();
+      let chunk = "";
+      for (const frame of frames) {
+        const error = extractStreamError(frame);
+        if (error) {
+          streamError = error;
+          break;
+        }
+        chunk += `${frame}\n\n`;
+      }
+      if (chunk) {
+        assistantText += extractTokenText(chunk);
+        recommendedVideos = mergeRecommendedVideos(recommendedVideos, extractRecommendedVideos(chunk));
+        if (sessionId) {
+          broadcastToSession(sessionId, {
+            type: "stream_response",
+            sessionId,
+            chunk
+          });
+        }
+        res.write(encoder.encode(chunk));
+      }
+      if (streamError) {
+        await reader.cancel().catch(() => {});
+        break;
+      }
+    }
+    const tail = pendingFrames + decoder.decode();
+    if (!streamError && tail.trim()) {
+      streamError = extractStreamError(tail);
+      if (!streamError) {
+        assistantText += extractTokenText(tail);
+        recommendedVideos = mergeRecommendedVideos(recommendedVideos, extractRecommendedVideos(tail));
+        res.write(encoder.encode(`${tail}\n\n`));
+      }
+    }
+  } catch (err) {
+    if (!clientClosed) {
+      streamError = `ai-service stream read failed: ${err.message || err}`;
+    }
+  }
+
+  if (streamError && !clientClosed && !assistantText.trim()) {
+    // ai-service already answered 200 before the LLM failed; recover the same way as a non-2xx response.
+    usedFallback = true;
+    await sendFallbackReply(502, `ai-service stream error, used fallback reply: ${streamError}`, recommendedVideos);
+    return;
+  }
+
+  try {
+    if (streamError && !clientClosed) {
+      const errorChunk = `data: ${JSON.stringify({ error: streamError })}\n\n`;
       if (sessionId) {
-        broadcastToSession(sessionId, {
-          type: "stream_response",
-          sessionId,
-          chunk
-        });
+        broadcastToSession(sessionId, { type: "stream_response", sessionId, chunk: errorChunk });
       }
-      res.write(encoder.encode(chunk));
+      res.write(encoder.encode(errorChunk));
     }
   } finally {
-    if (assistantText.trim()) {
+    if (assistantText.trim() && !usedFallback) {
       await saveChatMessage(chatSessionDbId, "assistant", assistantText, {
         recommended_videos: recommendedVideos
       });
@@ -935,9 +1042,14 @@ app.post("/api/chat", requireAuth, async (req, res) => {
       sessionId,
       endpoint: "/api/chat",
       method: "POST",
-      statusCode: 200,
+      statusCode: clientClosed ? 499 : streamError ? 502 : 200,
       requestJson: { message: body.message, model: body.model, city: body.city, stream: body.stream },
-      responseJson: { assistant_text_length: assistantText.length, recommended_videos_count: recommendedVideos.length },
+      responseJson: {
+        assistant_text_length: assistantText.length,
+        recommended_videos_count: recommendedVideos.length,
+        ...(clientClosed ? { outcome: "cancelled" } : {})
+      },
+      ...(streamError ? { errorText: `ai-service stream error: ${streamError}` } : {}),
       durationMs: Date.now() - chatStartMs
     }).catch(() => {});
     res.end();
@@ -1627,11 +1739,26 @@ ${existingMemoryText || "（無）"}
   }
 }
 
+// ai-service 以 user_id 快取個人化快照（profile、記憶、AI 設定）；寫入後通知失效，失敗時由 TTL 兜底
+function notifyUserContextChanged(userId) {
+  fetch(`${config.aiServiceUrl}/api/internal/user-context/invalidate`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      ...(config.aiServiceInternalToken ? { "x-internal-token": config.aiServiceInternalToken } : {})
+    },
+    body: JSON.stringify({ user_id: userId })
+  }).catch((err) => {
+    console.warn("[user context] invalidate failed:", err instanceof Error ? err.message : err);
+  });
+}
+
 async function saveExtractedMemories(userId, message) {
   const memories = extractMemoriesFromMessage(message);
   if (memories.length === 0) {
     return;
   }
+  let inserted = 0;
   for (const item of memories) {
     const exists = await pool.query(
       `
@@ -1652,6 +1779,10 @@ async function saveExtractedMemories(userId, message) {
       `,
       [userId, item.memoryType, item.memoryText, item.confidence, item.source]
     );
+    inserted += 1;
+  }
+  if (inserted > 0) {
+    notifyUserContextChanged(userId);
   }
 }
 
@@ -1692,6 +1823,7 @@ async function saveAiReviewedMemories(userId) {
     );
     inserted += 1;
   }
+  notifyUserContextChanged(userId);
   return {
     inserted,
     skipped,
@@ -1732,6 +1864,23 @@ async function saveChatMessage(sessionDbId, role, content, meta) {
   );
 }
 
+function extractStreamError(frame) {
+  for (const line of frame.split("\n")) {
+    if (!line.startsWith("data:")) {
+      continue;
+    }
+    try {
+      const parsed = JSON.parse(line.slice(5).trim());
+      if (parsed && parsed.error) {
+        return String(parsed.error);
+      }
+    } catch {
+      // Ignore malformed json chunk.
+    }
+  }
+  return "";
+}
+
 function extractRecommendedVideos(chunk) {
   const lines = chunk.split("\n");
   const items = [];
@@ -34,6 +34,7 @@ import {
 } from "@/lib/api";
 import { cn } from "@/lib/utils";
 import { normalizeRecommendedVideos } from "@/lib/recommendedVideos";
+import type { ChatRagSource } from "@/types/planner";
 import {
   getPlanJobV2,
   getRecommendJobV2,
@@ -57,6 +58,7 @@ type ChatRole = "system" | "user" | "assistant";
 type ChatMessage = {
   role: ChatRole;
   content: string;
+  sources?: ChatRagSource[];
 };
 
 type ChatModelOption = {
@@ -176,6 +178,8 @@ type SavedItineraryDetail = SavedItinerarySummary & {
 
 type ToolCallSummary = {
   tool?: string;
+  kind?: string;
+  route?: string;
   ok?: boolean;
   source?: string;
   error?: string | null;
@@ -2942,7 +2946,7 @@ function HomePageInner() {
             }
           }
           if (data.tool_calls_summary && data.tool_calls_summary.length > 0) {
-            setToolCallSummaries(data.tool_calls_summary.slice(0, 8));
+            setToolCallSummaries(data.tool_calls_summary.filter((item) => item.kind !== "route").slice(0, 8));
           }
           if (data.itinerary_plan && data.itinerary_plan.days?.length) {
             applyItineraryPlanFromChat(data.itinerary_plan);
@@ -2967,6 +2971,7 @@ function HomePageInner() {
         let buffered = "";
 
         type ChatStreamPayload = {
+          type?: "context" | "itinerary_plan";
           token?: string;
           done?: boolean;
           error?: string;
@@ -2974,6 +2979,7 @@ function HomePageInner() {
           fallback?: boolean;
           tool_calls_summary?: ToolCallSummary[];
           itinerary_plan?: ChatItineraryPlanPayload;
+          rag_sources?: ChatRagSource[];
         };
 
         function applyChatStreamPayload(payload: ChatStreamPayload): void {
@@ -2990,6 +2996,12 @@ function HomePageInner() {
               )
             );
           }
+          if (payload.rag_sources) {
+            const sources = payload.rag_sources;
+            setChatMessages((prev) =>
+              prev.map((item, index) => (index === assistantIndex ? { ...item, sources } : item))
+            );
+          }
           if (payload.recommended_videos) {
             const list = normalizeRecommendedVideos(payload.recommended_videos);
             setRecommendedVideos(list);
@@ -3004,8 +3016,8 @@ function HomePageInner() {
           if (payload.fallback) {
             setChatDegraded(true);
           }
-          if (payload.done && payload.tool_calls_summary) {
-            setToolCallSummaries(payload.tool_calls_summary.slice(0, 8));
+          if ((payload.done || payload.type === "context") && payload.tool_calls_summary) {
+            setToolCallSummaries(payload.tool_calls_summary.filter((item) => item.kind !== "route").slice(0, 8));
           }
           if (payload.itinerary_plan && payload.itinerary_plan.days?.length) {
             applyItineraryPlanFromChat(payload.itinerary_plan);
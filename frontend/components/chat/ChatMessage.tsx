@@ -121,6 +121,11 @@ export function markdownToSafeHtml(markdown: string): string {
   return html;
 }
 
+function formatSourceTime(sec: number): string {
+  const total = Math.max(0, Math.floor(sec));
+  return `${Math.floor(total / 60)}:${String(total % 60).padStart(2, "0")}`;
+}
+
 export function ChatMessageComponent({
   message,
   isStreaming,
@@ -234,6 +239,19 @@ export function ChatMessageComponent({
             }}
           />
         )}
+        {!isUser && message.content && message.sources && message.sources.length > 0 && (
+          <div className="mt-2 border-t border-border/40 pt-2 text-xs text-muted">
+            <p className="mb-1 font-semibold">參考片段</p>
+            <ul className="space-y-0.5">
+              {message.sources.map((source) => (
+                <li key={source.ref}>
+                  [片段{source.ref}] {source.video_title || "影片"}（{formatSourceTime(source.start_sec)}–
+                  {formatSourceTime(source.end_sec)}）
+                </li>
+              ))}
+            </ul>
+          </div>
+        )}
       </div>
     </div>
   );
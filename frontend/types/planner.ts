@@ -8,6 +8,8 @@ export type ChatRole = "system" | "user" | "assistant";
 export type ChatMessage = {
   role: ChatRole;
   content: string;
+  /** 回覆引用的影片片段（串流 context event 的 rag_sources） */
+  sources?: ChatRagSource[];
 };
 
 export type ChatModelOption = {
@@ -138,12 +140,25 @@ export type SavedItineraryDetail = SavedItinerarySummary & {
 
 export type ToolCallSummary = {
   tool?: string;
+  kind?: string;
+  route?: string;
   ok?: boolean;
   source?: string;
   error?: string | null;
   arguments?: Record<string, unknown>;
 };
 
+export type ChatRagSource = {
+  ref: number;
+  segment_id?: number | null;
+  video_id?: number | null;
+  video_title?: string;
+  city?: string | null;
+  start_sec: number;
+  end_sec: number;
+  summary?: string;
+};
+
 export type Place = {
   id: string;
   name: string;
@@ -0,0 +1,37 @@
+-- Migration 015: 關鍵字檢索改走 pg_trgm GIN 索引
+-- ai-service 的 sparse 檢索（app/keyword_search.py）以 `欄位 ILIKE '%詞%'` 比對，
+-- 有 trigram 索引時可用 bitmap index scan，不必對 segments JOIN videos 做全表掃描。
+-- 注意：少於 3 個字元的詞無法抽出 trigram，仍會退回掃描索引全體，但結果正確。
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_segments_summary_trgm ON segments
+  USING gin (summary gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_segments_tags_trgm ON segments
+  USING gin ((tags::text) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_videos_title_trgm ON videos
+  USING gin (title gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_places_name_trgm ON places
+  USING gin (name gin_trgm_ops);
+
+-- V2 推薦（/api/v2/recommend）的文字與城市比對
+CREATE INDEX IF NOT EXISTS idx_v2_video_segments_summary_trgm ON v2.video_segments
+  USING gin (summary gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_v2_video_segments_city_trgm ON v2.video_segments
+  USING gin (city gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_v2_videos_title_trgm ON v2.videos
+  USING gin (title gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_v2_videos_city_trgm ON v2.videos
+  USING gin (city gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_v2_places_name_trgm ON v2.places
+  USING gin (name gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_v2_places_city_trgm ON v2.places
+  USING gin (city gin_trgm_ops);
@@ -0,0 +1,93 @@
+-- Migration 016: 反正規化的 segment 檢索表
+-- ai-service 的檢索查詢原本對每個候選 segment 以 LEFT JOIN LATERAL 聚合 segment_places/places，
+-- 並 JOIN videos 取標題。segment_search_doc 預先存好 segment、影片標題、城市、標籤文字、
+-- 地點名稱與 embedding，檢索只需讀這一張表。
+-- 維護方式：video-indexer 寫入或重建 segment 後呼叫 refresh_segment_search_doc(segment_ids)；
+-- 傳入 NULL 代表全部重建（本 migration 結尾即以此回填既有資料）。
+
+CREATE EXTENSION IF NOT EXISTS vector;
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS segment_search_doc (
+  segment_id INTEGER PRIMARY KEY REFERENCES segments(id) ON DELETE CASCADE,
+  video_id INTEGER NOT NULL REFERENCES videos(id) ON DELETE CASCADE,
+  start_sec INTEGER NOT NULL,
+  end_sec INTEGER NOT NULL,
+  summary TEXT,
+  tags JSONB,
+  tags_text TEXT NOT NULL DEFAULT '',
+  city VARCHAR(100),
+  youtube_id VARCHAR(20) NOT NULL,
+  video_title TEXT NOT NULL,
+  channel VARCHAR(255),
+  duration INTEGER,
+  place_names TEXT NOT NULL DEFAULT '',
+  embedding_vector vector(768),
+  segment_created_at TIMESTAMP,
+  refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE OR REPLACE FUNCTION refresh_segment_search_doc(segment_ids INTEGER[] DEFAULT NULL)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  affected INTEGER;
+BEGIN
+  INSERT INTO segment_search_doc (
+    segment_id, video_id, start_sec, end_sec, summary, tags, tags_text, city,
+    youtube_id, video_title, channel, duration, place_names, embedding_vector,
+    segment_created_at, refreshed_at
+  )
+  SELECT
+    s.id, s.video_id, s.start_sec, s.end_sec, s.summary, s.tags, COALESCE(s.tags::text, ''), s.city,
+    v.youtube_id, v.title, v.channel, v.duration, COALESCE(place_meta.place_names, ''), s.embedding_vector,
+    s.created_at, NOW()
+  FROM segments s
+  JOIN videos v ON v.id = s.video_id
+  LEFT JOIN LATERAL (
+    SELECT string_agg(DISTINCT p.name, ' ') AS place_names
+    FROM segment_places sp
+    JOIN places p ON p.id = sp.place_id
+    WHERE sp.segment_id = s.id
+  ) AS place_meta ON TRUE
+  WHERE segment_ids IS NULL OR s.id = ANY(segment_ids)
+  ON CONFLICT (segment_id) DO UPDATE SET
+    video_id = EXCLUDED.video_id,
+    start_sec = EXCLUDED.start_sec,
+    end_sec = EXCLUDED.end_sec,
+    summary = EXCLUDED.summary,
+    tags = EXCLUDED.tags,
+    tags_text = EXCLUDED.tags_text,
+    city = EXCLUDED.city,
+    youtube_id = EXCLUDED.youtube_id,
+    video_title = EXCLUDED.video_title,
+    channel = EXCLUDED.channel,
+    duration = EXCLUDED.duration,
+    place_names = EXCLUDED.place_names,
+    embedding_vector = EXCLUDED.embedding_vector,
+    segment_created_at = EXCLUDED.segment_created_at,
+    refreshed_at = EXCLUDED.refreshed_at;
+  GET DIAGNOSTICS affected = ROW_COUNT;
+  RETURN affected;
+END;
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_segment_search_doc_video_id ON segment_search_doc(video_id);
+CREATE INDEX IF NOT EXISTS idx_segment_search_doc_city ON segment_search_doc(city);
+CREATE INDEX IF NOT EXISTS idx_segment_search_doc_created_at ON segment_search_doc(segment_created_at DESC);
+
+CREATE INDEX IF NOT EXISTS idx_segment_search_doc_embedding ON segment_search_doc
+  USING hnsw (embedding_vector vector_cosine_ops)
+  WHERE embedding_vector IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_segment_search_doc_summary_trgm ON segment_search_doc
+  USING gin (summary gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_segment_search_doc_tags_trgm ON segment_search_doc
+  USING gin (tags_text gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_segment_search_doc_title_trgm ON segment_search_doc
+  USING gin (video_title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_segment_search_doc_places_trgm ON segment_search_doc
+  USING gin (place_names gin_trgm_ops);
+
+SELECT refresh_segment_search_doc(NULL);
@@ -0,0 +1,14 @@
+-- Migration 017: 外部工具結果快取的持久層
+-- ai-service 設定 TOOL_CACHE_PERSISTENT=true 時，地名座標、天氣、YouTube 搜尋與 DuckDuckGo 結果
+-- 除了記憶體快取外也寫入此表，重啟後保留且多個 worker 共用。cache_key 為「工具:正規化參數的 SHA-256」。
+-- 過期列由 ai-service 定期刪除，也可安全地整表清空。
+
+CREATE TABLE IF NOT EXISTS tool_result_cache (
+  cache_key TEXT PRIMARY KEY,
+  tool VARCHAR(50) NOT NULL,
+  payload JSONB NOT NULL,
+  expires_at TIMESTAMPTZ NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_tool_result_cache_expires_at ON tool_result_cache (expires_at);
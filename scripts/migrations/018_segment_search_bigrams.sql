@@ -0,0 +1,29 @@
+-- Migration 018: segment_search_doc 的 bigram 索引
+-- pg_trgm 無法從少於 3 個字元的詞抽出 trigram，`summary ILIKE '%台南%'` 這類以空白分隔的
+-- 2 字中文詞（最常見的查詢形式）會掃過整個 trigram 索引（見 migration 015）。
+-- search_bigrams 存放各文字欄位（每個以空白分隔的片段內）相鄰兩字元的小寫 bigram，
+-- ai-service（app/keyword_search.py）對 2 字元的詞改用 `search_bigrams @@ '台南'::tsquery`，
+-- 由 GIN 索引直接找出含該詞的列；3 字元以上的詞仍走 trigram。
+
+CREATE OR REPLACE FUNCTION text_bigrams(input TEXT)
+RETURNS TEXT[]
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+AS $$
+  SELECT COALESCE(array_agg(DISTINCT substr(w, i, 2)), '{}'::TEXT[])
+  FROM regexp_split_to_table(lower(COALESCE(input, '')), '\s+') AS w,
+       generate_series(1, char_length(w) - 1) AS i
+$$;
+
+-- 以空白連接各欄位，不會產生跨欄位的 bigram；refresh_segment_search_doc 不需修改
+ALTER TABLE segment_search_doc
+  ADD COLUMN IF NOT EXISTS search_bigrams TSVECTOR
+  GENERATED ALWAYS AS (
+    array_to_tsvector(text_bigrams(
+      COALESCE(summary, '') || ' ' || tags_text || ' ' || video_title || ' ' || place_names
+    ))
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_segment_search_doc_bigrams ON segment_search_doc
+  USING gin (search_bigrams);
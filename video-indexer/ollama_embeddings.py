@@ -1,9 +1,10 @@
 from __future__ import annotations
 
 import re
-from typing import Iterable
+from typing import Iterable, Sequence
 
 import httpx
+import numpy as np
 
 from config import get_ollama_base_url, get_ollama_embed_model
 
@@ -85,3 +86,14 @@ def get_vector_column_dim(conn, table_name: str, column_name: str) -> int | None
     if not match:
         return None
     return int(match.group(1))
+
+
+def register_vector_adapter(conn) -> None:
+    """註冊 pgvector 的 psycopg2 adapter：之後 numpy 陣列以 vector 型別送出，不必先組成文字常值。"""
+    from pgvector.psycopg2 import register_vector
+
+    register_vector(conn)
+
+
+def to_vector_param(embedding: Sequence[float]) -> np.ndarray:
+    return np.asarray(embedding, dtype=np.float32)
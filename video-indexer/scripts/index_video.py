@@ -15,9 +15,10 @@ from psycopg2.extras import RealDictCursor
 from config import get_database_url
 from transcripts import fetch_transcript, merge_adjacent_cues
 from whisper_transcribe import transcribe_video
-from ollama_embeddings import embed_text, get_vector_column_dim
+from ollama_embeddings import embed_text, get_vector_column_dim, register_vector_adapter, to_vector_param
 from semantic_segment import segment_by_semantic_similarity, Segment
 from extract_places import extract_places_with_ollama, summarize_segment_text
+from search_doc import refresh_segment_search_doc
 
 
 def get_videos_to_index(conn, limit: int = 10, youtube_ids: list[str] | None = None):
@@ -115,6 +116,7 @@ def index_video(conn, video: dict, use_whisper: bool = True, skip_places: bool =
         return 0, 2
 
     seg_count = 0
+    seg_ids: list[int] = []
     total = len(segments)
     expected_dim = get_vector_column_dim(conn, "segments", "embedding_vector")
     with conn.cursor() as cur:
@@ -138,12 +140,11 @@ def index_video(conn, video: dict, use_whisper: bool = True, skip_places: bool =
                     f"segment embedding 維度不符: expected={expected_dim}, got={len(retrieval_embedding)}, "
                     f"video_id={video_id}, index={i}"
                 )
-            embedding_str = "[" + ",".join(str(x) for x in retrieval_embedding) + "]"
 
             cur.execute(
                 """
                 INSERT INTO segments (video_id, start_sec, end_sec, summary, tags, embedding_vector, city)
-                VALUES (%s, %s, %s, %s, %s, %s::vector, %s)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
                 RETURNING id
                 """,
                 (
@@ -152,11 +153,12 @@ def index_video(conn, video: dict, use_whisper: bool = True, skip_places: bool =
                     int(seg.end_sec),
                     summary,
                     pg_extras.Json(tags),
-                    embedding_str,
+                    to_vector_param(retrieval_embedding),
                     video_city,
                 ),
             )
             seg_id = cur.fetchone()[0]
+            seg_ids.append(seg_id)
             seg_count += 1
 
             for p in places_data:
@@ -175,6 +177,8 @@ def index_video(conn, video: dict, use_whisper: bool = True, skip_places: bool =
                     (seg_id, place_id),
                 )
 
+        # 與 segments / segment_places 同一交易更新檢索表
+        refresh_segment_search_doc(cur, seg_ids)
         conn.commit()
 
     return seg_count, 0
@@ -189,6 +193,7 @@ def main():
     args = parser.parse_args()
 
     conn = psycopg2.connect(get_database_url())
+    register_vector_adapter(conn)
     try:
         videos = get_videos_to_index(conn, limit=args.limit, youtube_ids=args.ids)
         if not videos:
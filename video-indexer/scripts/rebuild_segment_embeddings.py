@@ -10,7 +10,8 @@ import psycopg2
 from psycopg2.extras import RealDictCursor, execute_batch
 
 from config import get_database_url, get_ollama_embed_model
-from ollama_embeddings import embed_texts, get_vector_column_dim
+from ollama_embeddings import embed_texts, get_vector_column_dim, register_vector_adapter, to_vector_param
+from search_doc import refresh_segment_search_doc
 
 
 def load_segments(conn, ids: list[int] | None, limit: int | None):
@@ -45,6 +46,7 @@ def main():
     args = parser.parse_args()
 
     conn = psycopg2.connect(get_database_url())
+    register_vector_adapter(conn)
     try:
         expected_dim = get_vector_column_dim(conn, "segments", "embedding_vector")
         if not expected_dim:
@@ -60,7 +62,7 @@ def main():
             f"model={get_ollama_embed_model()} expected_dim={expected_dim}"
         )
 
-        updates: list[tuple[str, int]] = []
+        updates: list[tuple[object, int]] = []
         batch_size = max(1, args.batch_size)
         for start in range(0, len(rows), batch_size):
             batch = rows[start : start + batch_size]
@@ -76,8 +78,7 @@ def main():
                     raise RuntimeError(
                         f"segment {row['id']} 維度不符: expected={expected_dim}, got={len(embedding)}"
                     )
-                vector_literal = "[" + ",".join(str(x) for x in embedding) + "]"
-                updates.append((vector_literal, row["id"]))
+                updates.append((to_vector_param(embedding), row["id"]))
 
             print(f"已處理 {min(start + len(batch), len(rows))}/{len(rows)}")
 
@@ -90,14 +91,15 @@ def main():
                 cur,
                 """
                 UPDATE segments
-                SET embedding_vector = %s::vector
+                SET embedding_vector = %s
                 WHERE id = %s
                 """,
                 updates,
                 page_size=100,
             )
+            refreshed = refresh_segment_search_doc(cur, [segment_id for _, segment_id in updates])
         conn.commit()
-        print(f"完成寫回 {len(updates)} 筆 segments embeddings。")
+        print(f"完成寫回 {len(updates)} 筆 segments embeddings（同步 segment_search_doc {refreshed} 筆）。")
     finally:
         conn.close()
 
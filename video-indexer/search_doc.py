@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from typing import Sequence
+
+# 每次呼叫 refresh_segment_search_doc 的 segment 數量上限，避免單一陳述式鎖住過多列
+REFRESH_CHUNK_SIZE = 500
+
+
+def refresh_segment_search_doc(cur, segment_ids: Sequence[int]) -> int:
+    """同步 segment_search_doc（migration 016）中指定 segment 的反正規化資料。
+
+    需在寫入 segments / segment_places 的同一個交易內呼叫，commit 後檢索表即與原始表一致。
+    """
+    ids = sorted({int(segment_id) for segment_id in segment_ids})
+    refreshed = 0
+    for start in range(0, len(ids), REFRESH_CHUNK_SIZE):
+        cur.execute(
+            "SELECT refresh_segment_search_doc(%s::integer[])",
+            (ids[start : start + REFRESH_CHUNK_SIZE],),
+        )
+        row = cur.fetchone()
+        if row and row[0]:
+            refreshed += int(row[0])
+    return refreshed